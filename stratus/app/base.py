@@ -3,6 +3,12 @@ from typing import List, Union, Dict, Set, Iterator, Tuple, ItemsView
 from stratus_endpoint.util.config import Config, StratusLogger
 from multiprocessing import Process as SubProcess
 from stratus.app.operations import *
+from stratus.app.events import Wakeup, RequestQueue, StatusJournal
+from stratus.app.placement import PlacementEngine
+from stratus.util.spool import ResultSpool
+from stratus.app.store import ResultStore
+from stratus.app.cache import RequestCache, CoalescedWorkflow
+from stratus.app.memo import TaskMemo
 from threading import Thread
 
 class StratusCoreBase:
@@ -76,9 +82,17 @@ class StratusAppBase(Thread):
         self.logger = StratusLogger.getLogger()
         self.core = _core
         self.registeredRequests = set()
-        self.requestQueue = queue.Queue()
+        self.wakeup = Wakeup()
+        self.requestQueue = RequestQueue( self.wakeup )
+        self.statusJournal = StatusJournal( int( _core.parm( "journal_size", "10000" ) ) )
+        self.spool = ResultSpool( _core.parm( "spool_dir", "~/.stratus/spool" ), float( _core.parm( "spool_max_age", "86400" ) ) )
+        self.completed_workflows = ResultStore( self.spool, on_evict=self.registeredRequests.discard, **_core.parms )
+        self.requestCache = RequestCache( **_core.parms )
+        self.taskMemo = TaskMemo( self.spool, **_core.parms )
         self.active_workflows: Dict[str, StratusWorkflow] = {}
-        self.completed_workflows: Dict[str, StratusWorkflow] = {}
+        self.poll_interval = float( _core.parm( "poll_interval", "0.05" ) )
+        self.idle_timeout = float( _core.parm( "idle_timeout", "5.0" ) )
+        self.placement: PlacementEngine = PlacementEngine.create( _core.parm( "placement", "greedy" ), **_core.parms )
         self._active = True
 
     @property
@@ -89,11 +103,26 @@ class StratusAppBase(Thread):
         self.logger.info(" &&&&&&&&&&&&&&&&&&&&&&&&& Running STRATUS App: " + self.__class__.__name__ + " &&&&&&&&&&&&&&&&&&&&&&&&&")
         self.initInteractions()
         self.logger.info(" &&&&&&&&&&&&&&&&&&&&&&&&& Starting STRATUS App Loop &&&&&&&&&&&&&&&&&&&&&&&&&")
-        while self._active:
-            self.ingestRequests()
-            self.update_workflows()
-            self.updateInteractions()
-            time.sleep(0)
+        try:
+            while self._active:
+                self.ingestRequests()
+                self.update_workflows()
+                self.updateInteractions()
+                self.waitForEvents( self.eventTimeout() )
+        finally:
+            self.wakeup.close()
+
+    def eventTimeout(self) -> float:
+        # Only workflows with tasks whose handles can't push status changes are polled; the rest wake the loop through notify,
+        # so the wait is otherwise bounded by the ( longer ) idle timeout
+        polled = any( workflow.polled() for workflow in self.active_workflows.values() )
+        return self.poll_interval if polled else self.idle_timeout
+
+    def waitForEvents(self, timeout: float ):
+        self.wakeup.wait( timeout )
+
+    def notify(self, rid: str = None ):
+        self.wakeup.set()
 
     @abc.abstractmethod
     def processError(self, rid: str, ex: Exception): pass
@@ -105,33 +134,26 @@ class StratusAppBase(Thread):
     def updateInteractions(self): pass
 
     def distributeOps(self, clientOpsets: Dict[str, ClientOpSet]) -> Iterator[ClientOpSet]:
-        # Distributes ops to clients while maximizing locality of operations
-        filtered_opsets: Set[ClientOpSet] = set()
-        processed_ops: List[str] = []
-        sorted_opsets: List[ClientOpSet] = list(sorted(clientOpsets.items(), reverse=True, key=lambda x: x[1]))
-        while len( sorted_opsets ):
-            cid, base_opset = sorted_opsets.pop(0)
-            new_opset = base_opset.new()
-            for op in base_opset:
-                if op.id not in processed_ops:
-                    processed_ops.append( op.id )
-                    new_opset.add( op )
-            if len( new_opset ) > 0:
-                filtered_opsets.add( new_opset )
-            for cid, opset in sorted_opsets:
-                opset.remove( processed_ops )
-            sorted_opsets = list( sorted( sorted_opsets, reverse=True, key=lambda x: x[1] ) )
-        distributed_opsets = [opset.connectedOpsets() for opset in filtered_opsets]
+        # Distributes ops to clients using the configured placement engine ( 'placement' parm: greedy | cost )
+        placed_opsets: List[ClientOpSet] = self.placement.place( clientOpsets )
+        distributed_opsets = [opset.connectedOpsets() for opset in placed_opsets]
         return itertools.chain.from_iterable(distributed_opsets)
 
     def submitWorkflow(self, request: Dict):
         request.setdefault("rid", UID.randomId(6))
         self.requestQueue.put( request )
         self.registeredRequests.add( request["rid"] )
+        self.statusJournal.record( request["rid"], Status.str( Status.IDLE ) )
         return request
 
-    def createWorkflow( self, tasks: List[WorkflowTask] ) -> StratusWorkflow:
-        return StratusWorkflow(nodes=tasks)
+    def recordStatus(self, rid: str, workflow: StratusWorkflow ):
+        status = workflow.status()
+        info = dict( message=str( workflow.getResult().exception() ) ) if status == Status.ERROR else {}
+        self.statusJournal.record( rid, Status.str( status ), **info )
+
+    def createWorkflow( self, tasks: List[WorkflowTask], request: Dict = None ) -> StratusWorkflow:
+        memo = self.taskMemo if self.taskMemo.enabled else None
+        return StratusWorkflow( nodes=tasks, memo=memo, request=request or {} )
 
     def ingestRequests( self ):
         rid = ""
@@ -140,9 +162,11 @@ class StratusAppBase(Thread):
                 request = self.requestQueue.get_nowait()
                 rid = request.get("rid", UID.randomId(6))
                 self.logger.info(f"Ingest request: {rid}")
+                if self.admitCached( rid, request ): continue
                 clientOpsets: Dict[str, ClientOpSet] = self.geClientOpsets(request)
                 tasks: List[WorkflowTask] = [WorkflowTask(cOpSet) for cOpSet in self.distributeOps(clientOpsets)]
-                self.active_workflows[ rid ] = self.createWorkflow( tasks )
+                self.active_workflows[ rid ] = self.createWorkflow( tasks, request )
+                self.recordStatus( rid, self.active_workflows[ rid ] )
             except queue.Empty:
                 return
             except Exception as err:
@@ -151,6 +175,7 @@ class StratusAppBase(Thread):
                 self.logger.error( traceback.format_exc() )
                 workflow = StratusWorkflow(error=(msg, err))
                 self.active_workflows[ rid ] = workflow
+                self.recordStatus( rid, workflow )
 
     def update_workflows(self):
         completed_list = {}
@@ -160,8 +185,51 @@ class StratusAppBase(Thread):
                 self.logger.info(f" ***********************************   StratusApp.completed_workflow: {rid}")
                 completed_list[rid] = workflow
         for rid, workflow in completed_list.items():
-            self.completed_workflows[rid] = workflow
+            if isinstance( workflow, WorkflowBase ): workflow.release()
+            stored = self.completed_workflows.materialize( rid, workflow )
             del self.active_workflows[rid]
+            if self.requestCache.leading( rid ):
+                # The cache keeps stored itself; the leader and its followers get replicas, which can be spilled and removed independently
+                followers = self.requestCache.complete( rid, stored )
+                self.completed_workflows[rid] = stored.replicate( rid )
+                for follower in followers:
+                    if self.active_workflows.pop( follower, None ) is not None:
+                        self.completed_workflows[follower] = stored.replicate( follower )
+                        self.recordStatus( follower, stored )
+            else:
+                self.completed_workflows[rid] = stored
+            self.recordStatus( rid, stored )
+        self.completed_workflows.maintain()
+        self.taskMemo.store.maintain()
+
+    def admitCached( self, rid: str, request: Dict ) -> bool:
+        # Completes the request from the request cache, or attaches it to an identical request in flight; returns False if it must be executed
+        key = self.requestCache.key( request )
+        if key is None: return False
+        cached = self.requestCache.lookup( key, rid )
+        if cached is not None:
+            self.completed_workflows[rid] = cached
+            self.recordStatus( rid, cached )
+            return True
+        leader = self.requestCache.join( key, rid )
+        if ( leader is not None ) and isinstance( self.active_workflows.get( leader ), ( type(None), CoalescedWorkflow ) ):
+            # The leader is no longer executing: rid leads in its place
+            self.resubmitFollowers( [ follower for follower in self.requestCache.abandon( leader ) if follower != rid ] )
+            leader = self.requestCache.join( key, rid )
+        if leader is None: return False
+        self.logger.info( f"Request {rid} coalesced onto in-flight request {leader}" )
+        self.active_workflows[rid] = CoalescedWorkflow( self.active_workflows[leader], request )
+        self.recordStatus( rid, self.active_workflows[rid] )
+        return True
+
+    def resubmitFollowers( self, followers: List[str] ):
+        # Requests coalesced onto a leader that was cleared before completing are ingested again ( the first becomes the new leader )
+        for follower in followers:
+            placeholder = self.active_workflows.get( follower )
+            if isinstance( placeholder, CoalescedWorkflow ):
+                self.logger.info( f"Resubmitting request {follower}: the in-flight request it was coalesced onto was cleared" )
+                placeholder.abandon()
+                self.requestQueue.put( placeholder.request )
 
     def waitForCompletion(self, rid: str ):
         while( True ):
@@ -173,6 +241,12 @@ class StratusAppBase(Thread):
         workflow = self.completed_workflows.get( rid )
         return None if workflow is None else workflow.getResult()
 
+    def resultExpired( self, rid: str ) -> bool:
+        return self.completed_workflows.expired( rid )
+
+    def getStoreStats(self) -> Dict:
+        return dict( store=self.completed_workflows.stats(), cache=self.requestCache.stats(), memo=self.taskMemo.stats() )
+
     def getWorkflows(self) -> Dict[str, StratusWorkflow]:
         return { **self.completed_workflows, **self.active_workflows }
 
@@ -188,8 +262,13 @@ class StratusAppBase(Thread):
             del self.completed_workflows[rid]
             try: self.registeredRequests.remove( rid )
             except Exception: pass
+        elif rid in self.active_workflows:
+            workflow = self.active_workflows.pop( rid )
+            if isinstance( workflow, WorkflowBase ): workflow.release()
+            self.registeredRequests.discard( rid )
+            self.resubmitFollowers( self.requestCache.abandon( rid ) )
         else:
-            self.logger.error( f"Attampt to clear a workflow {rid} that is not in the completed_workflows")
+            self.logger.error( f"Attampt to clear an unknown workflow {rid}")
 
     def geClientOpsets(self, request: Dict ) -> Dict[str, ClientOpSet]:
         # Returns map of client id to list of ops in request that can be handled by that client
@@ -201,12 +280,15 @@ class StratusAppBase(Thread):
             clients = self.core.getClients( op )
             assert len(clients) > 0, f"Can't find a client to process the operation': {op.epas}, clients = { [str(client.endpointSpecs) for client in self.core.getClients( op )] }"
             for client in clients:
+               client.addStatusListener( self.notify )
                opSet = clientOpsets.setdefault(client.handle, ClientOpSet(request,client))
                opSet.add( op )
         return clientOpsets
 
     def shutdown(self):
         self._active = False
+        self.wakeup.set()
+        if not self.is_alive(): self.wakeup.close()      # Otherwise closed by the app loop on exit
 
     def parm(self, name: str, default = None ) -> str:
         return self.core.parm( name, default )
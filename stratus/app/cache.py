@@ -0,0 +1,154 @@
+""" Content-addressed cache of whole-request results, with coalescing of identical in-flight requests """
+import collections, hashlib, json, threading, time, fnmatch
+from typing import List, Dict, Optional, Any, Tuple
+from stratus_endpoint.util.config import StratusLogger
+from stratus_endpoint.handler.base import Status
+from stratus.app.store import StoredWorkflow, StoredTask
+from stratus.util.parsing import str2bool
+
+class CoalescedWorkflow:
+    """ Placeholder for a request that is waiting on an identical request already in flight: reports the leader's status
+        until the app replaces it with a replica of the leader's result, or resubmits the request if the leader is cleared. """
+
+    def __init__( self, leader, request: Dict = None ):
+        self.leader = leader
+        self.request = request
+
+    def abandon(self):
+        self.leader = None
+
+    def status(self) -> Status:
+        return Status.IDLE if self.leader is None else self.leader.status()
+
+    def getResult(self):
+        return None if self.leader is None else self.leader.getResult()
+
+    def completed(self) -> bool:
+        return False
+
+    def polled(self) -> bool:
+        return False
+
+    def update(self) -> bool:
+        return False
+
+class RequestCache:
+    """ Results of completed requests keyed by a sha256 of the request spec ( excluding rid, cid and other per-submission
+        keys ).  Configured by parms 'cache.enabled', 'cache.ttl' ( seconds ), 'cache.max_entries', 'cache.max_mb',
+        and 'cache.epas' / 'cache.exclude_epas' ( comma-separated op name patterns, e.g. 'xop:*' ). """
+
+    TRANSIENT_KEYS = { "rid", "cid", "clients", "status" }
+
+    def __init__( self, **kwargs ):
+        self.logger = StratusLogger.getLogger()
+        self.enabled = str2bool( kwargs.get( "cache.enabled", "false" ) )
+        self.ttl = float( kwargs.get( "cache.ttl", 300 ) )
+        self.max_entries = int( kwargs.get( "cache.max_entries", 1000 ) )
+        self.max_bytes = float( kwargs.get( "cache.max_mb", 512 ) ) * 1024 * 1024
+        self.include = self._patterns( kwargs.get( "cache.epas", "*" ) )
+        self.exclude = self._patterns( kwargs.get( "cache.exclude_epas", "" ) )
+        self._entries: collections.OrderedDict = collections.OrderedDict()      # key -> ( StoredWorkflow, expiry, accounted bytes )
+        self._inflight: Dict[str,Tuple[str,List[str]]] = {}                     # key -> ( leader rid, follower rids )
+        self._leaders: Dict[str,str] = {}                                       # leader rid -> key
+        self._lock = threading.RLock()
+        self._nbytes = 0
+        self._counts = collections.Counter()
+
+    @staticmethod
+    def _patterns( spec: str ) -> List[str]:
+        return [ pattern.strip() for pattern in str( spec ).split(",") if pattern.strip() ]
+
+    def cacheable( self, request: Dict ) -> bool:
+        names = [ str( op.get( "name", "" ) ) for op in request.get( "operation", [] ) ]
+        if len( names ) == 0: return False
+        included = all( any( fnmatch.fnmatch( name, pattern ) for pattern in self.include ) for name in names )
+        excluded = any( fnmatch.fnmatch( name, pattern ) for pattern in self.exclude for name in names )
+        return included and not excluded
+
+    def key( self, request: Dict ) -> Optional[str]:
+        """ Canonical hash of the request, or None if caching is disabled or the request's ops are not opted in """
+        if not self.enabled or not self.cacheable( request ): return None
+        spec = { name: value for name, value in request.items() if name not in self.TRANSIENT_KEYS }
+        canonical = json.dumps( spec, sort_keys=True, separators=(",", ":"), default=str )
+        return hashlib.sha256( canonical.encode() ).hexdigest()
+
+    def lookup( self, key: str, rid: str ) -> Optional[StoredWorkflow]:
+        """ Returns a completed workflow for rid replicating the cached result, if present, not expired and still retrievable """
+        with self._lock:
+            entry = self._entries.get( key )
+            if ( entry is not None ) and ( ( entry[1] < time.time() ) or ( entry[0].status() != Status.COMPLETED ) ):
+                self._evict( key )
+                entry = None
+            if entry is None:
+                self._counts["misses"] += 1
+                return None
+            self._entries.move_to_end( key )
+            self._counts["hits"] += 1
+        self.logger.info( f"RequestCache: hit for request {rid} ( {key[:12]} )" )
+        return entry[0].replicate( rid )
+
+    def join( self, key: str, rid: str ) -> Optional[str]:
+        """ Returns the rid of an identical in-flight request that rid should wait on, else registers rid as the leader for key """
+        with self._lock:
+            inflight = self._inflight.get( key )
+            if inflight is None:
+                self._inflight[key] = ( rid, [] )
+                self._leaders[rid] = key
+                return None
+            inflight[1].append( rid )
+            self._counts["coalesced"] += 1
+            return inflight[0]
+
+    def leading( self, rid: str ) -> bool:
+        with self._lock:
+            return rid in self._leaders
+
+    def complete( self, rid: str, stored: StoredWorkflow ) -> List[str]:
+        """ Records the result of a leader request, returning the rids of the requests coalesced onto it.  The cache keeps
+            stored itself: the leader and its followers should be given replicas of it, so that no store can remove its files. """
+        with self._lock:
+            key = self._leaders.pop( rid, None )
+            if key is None: return []
+            ( leader, followers ) = self._inflight.pop( key )
+            if stored.status() == Status.COMPLETED: self._insert( key, stored )
+            return followers
+
+    def abandon( self, rid: str ) -> List[str]:
+        """ Forgets a request cleared before it completed.  A leader's followers are returned, to be resubmitted; a follower is detached from its leader. """
+        with self._lock:
+            key = self._leaders.pop( rid, None )
+            if key is not None: return self._inflight.pop( key )[1]
+            for ( leader, followers ) in self._inflight.values():
+                if rid in followers: followers.remove( rid )
+            return []
+
+    def _insert( self, key: str, stored: StoredWorkflow ):
+        if stored.nbytes > self.max_bytes: return
+        if key in self._entries: self._evict( key )
+        self._entries[key] = ( stored, time.time() + self.ttl, stored.nbytes )
+        self._nbytes += stored.nbytes
+        if isinstance( stored.result, StoredTask ) and not stored.result.loaded:
+            stored.result.on_load = lambda task: self._reaccount( key, stored )
+        self._enforce()
+
+    def _reaccount( self, key: str, stored: StoredWorkflow ):
+        # A lazily materialized ( or spilled ) result's size changed since it was accounted
+        with self._lock:
+            entry = self._entries.get( key )
+            if ( entry is None ) or ( entry[0] is not stored ): return
+            self._nbytes += stored.nbytes - entry[2]
+            self._entries[key] = ( stored, entry[1], stored.nbytes )
+            self._enforce()
+
+    def _enforce(self):
+        while len( self._entries ) and ( ( len( self._entries ) > self.max_entries ) or ( self._nbytes > self.max_bytes ) ):
+            self._evict( next( iter( self._entries ) ) )
+            self._counts["evicted"] += 1
+
+    def _evict( self, key: str ):
+        ( stored, expiry, nbytes ) = self._entries.pop( key )
+        self._nbytes -= nbytes
+
+    def stats(self) -> Dict[str,Any]:
+        with self._lock:
+            return dict( enabled=self.enabled, entries=len( self._entries ), memory_bytes=self._nbytes, inflight=len( self._inflight ), **self._counts )
@@ -1,18 +1,28 @@
-from typing import List, Dict, Any, Sequence, BinaryIO, TextIO, ValuesView, Tuple, Optional
+from typing import List, Dict, Any, Sequence, BinaryIO, TextIO, ValuesView, Tuple, Optional, Callable
 from stratus_endpoint.util.config import Config, StratusLogger, UID
 from stratus_endpoint.handler.base import TaskHandle, Status, TaskResult
-import abc, fnmatch, traceback
+import abc, fnmatch, traceback, threading, re
 from decorator import decorator, dispatch_on
 
 class EndpointSpec:
+    WILDCARDS = re.compile( r"[*?\[]" )
+
     def __init__(self, epaSpec: str ):
         self.logger = StratusLogger.getLogger()
         self._epaSpec = epaSpec
+        self._regex = re.compile( fnmatch.translate( epaSpec ) )
+
+    @property
+    def isPattern(self) -> bool:
+        return self.WILDCARDS.search( self._epaSpec ) is not None
+
+    @property
+    def regex(self) -> str:
+        return fnmatch.translate( self._epaSpec )
 
     def handles( self, epa: str, **kwargs ) -> bool:
         try:
-            self.logger.debug(f"EndpointSpec: comparing '{epa}' against epaSpec '{self._epaSpec}'")
-            return fnmatch.fnmatch( epa, self._epaSpec )
+            return self._regex.match( epa ) is not None
         except Exception as err:
             self.logger.error( f"Error Checking EPA '{epa}' against epaSpec '{self._epaSpec}': {str(err)}")
             return False
@@ -20,6 +30,33 @@ class EndpointSpec:
     def __str__(self):
         return self._epaSpec
 
+class ClientStats:
+    """ Live load and latency measurements for a client, used to place and balance operations """
+
+    def __init__( self, smoothing: float = 0.2 ):
+        self._lock = threading.Lock()
+        self._smoothing = smoothing
+        self.outstanding = 0
+        self.completed = 0
+        self.errors = 0
+        self.latency: Optional[float] = None       # Exponentially weighted mean task latency (sec)
+
+    def started(self):
+        with self._lock:
+            self.outstanding += 1
+
+    def finished(self, elapsed: float, error: bool = False ):
+        with self._lock:
+            self.outstanding = max( self.outstanding - 1, 0 )
+            if error:
+                self.errors += 1
+            else:
+                self.completed += 1
+                self.latency = elapsed if self.latency is None else ( 1.0 - self._smoothing ) * self.latency + self._smoothing * elapsed
+
+    def __str__(self):
+        return f"ClientStats[outstanding={self.outstanding}, completed={self.completed}, errors={self.errors}, latency={self.latency}]"
+
 @decorator
 def stratusrequest( func, *args, **kwargs ):
     new_args = list(args)
@@ -29,6 +66,7 @@ def stratusrequest( func, *args, **kwargs ):
 class StratusClient:
     __metaclass__ = abc.ABCMeta
     logger = StratusLogger.getLogger()
+    pushes_status = False           # True if the client calls notifyStatus when its requests change status
 
     def __init__( self, type: str, **kwargs ):
         cid = kwargs.get( "cid" )
@@ -40,6 +78,9 @@ class StratusClient:
         self.priority: float = float( self.parm( "priority", "0" ) )
         self.active = False
         self._endpointSpecs: List[EndpointSpec] = None
+        self._statusListeners: List[Callable[[str],None]] = []
+        self._endpointListeners: List[Callable[[],None]] = []
+        self.stats = ClientStats()
         self.clients = { self.cid }
 
     @property
@@ -55,9 +96,17 @@ class StratusClient:
             endPointData = self.capabilities("epas")
             if "error" in endPointData: raise Exception( "Error accessing endpoint data: " + endPointData["message"] )
             self.logger.info( "EndpointSpecs: " + str(endPointData))
-            self._endpointSpecs = [ EndpointSpec(epaSpec) for epaSpec in endPointData["epas"] ]
+            self.setEndpointSpecs( endPointData["epas"] )
             self.activate()
 
+    def setEndpointSpecs(self, epaSpecs: List[str] ):
+        self._endpointSpecs = [ EndpointSpec(epaSpec) for epaSpec in epaSpecs ]
+        for listener in list( self._endpointListeners ): listener()
+
+    def addEndpointListener(self, listener: Callable[[],None] ):
+        # Listeners are called whenever this client's endpointSpecs change
+        if listener not in self._endpointListeners: self._endpointListeners.append( listener )
+
     @abc.abstractmethod
     @stratusrequest
     def request(self, request: Dict, inputs: List[TaskResult] = None, **kwargs ) -> TaskHandle: pass
@@ -75,10 +124,23 @@ class StratusClient:
         if self.active:
             self.active = False
 
+    def addStatusListener(self, listener: Callable[[str],None] ):
+        if listener not in self._statusListeners:
+            self._statusListeners.append( listener )
+
+    def notifyStatus(self, rid: str ):
+        # Called by task handles (or their response managers) when the status of request rid changes
+        for listener in self._statusListeners:
+            try: listener( rid )
+            except Exception as err: self.logger.error( f"Error in status listener for request {rid}: {err}" )
+
     @property
     def endpointSpecs(self) -> List[str]:
         return [str(eps) for eps in self._endpointSpecs]
 
+    def getEndpointSpecs(self) -> List[EndpointSpec]:
+        return [] if self._endpointSpecs is None else self._endpointSpecs
+
     def handles(self, epa: str, **kwargs ) -> bool:
         for endpointSpec in self._endpointSpecs:
             if endpointSpec.handles( epa, **kwargs ): return True
@@ -0,0 +1,91 @@
+import socket, select, queue, collections, threading, time
+from typing import Optional, Set, Tuple, List, Dict
+
+class Wakeup:
+    """ Self-pipe used to interrupt the app loop's blocking wait from any thread.
+        Exposes a fileno() so it can be registered with select or a zmq.Poller alongside sockets. """
+
+    def __init__(self):
+        self._reader, self._writer = socket.socketpair()
+        self._reader.setblocking( False )
+        self._writer.setblocking( False )
+
+    def fileno(self) -> int:
+        return self._reader.fileno()
+
+    def set(self):
+        try: self._writer.send( b"\0" )
+        except ( BlockingIOError, OSError ): pass     # Pipe full: a wakeup is already pending
+
+    def clear(self):
+        try:
+            while self._reader.recv( 4096 ): pass
+        except ( BlockingIOError, OSError ): pass
+
+    def wait( self, timeout: Optional[float] = None ) -> bool:
+        readable, _, _ = select.select( [ self._reader ], [], [], timeout )
+        self.clear()
+        return len( readable ) > 0
+
+    def close(self):
+        for sock in ( self._reader, self._writer ):
+            try: sock.close()
+            except Exception: pass
+
+class RequestQueue(queue.Queue):
+    """ Queue that wakes the app loop whenever a new request is put on it """
+
+    def __init__( self, wakeup: Wakeup, maxsize: int = 0 ):
+        queue.Queue.__init__( self, maxsize )
+        self._wakeup = wakeup
+
+    def put( self, item, block=True, timeout=None ):
+        queue.Queue.put( self, item, block, timeout )
+        self._wakeup.set()
+
+class StatusJournal:
+    """ Bounded, sequence-numbered log of workflow status changes.  Readers pass the cursor returned by their
+        previous read and block until newer events are recorded or the timeout expires ( long-poll ). """
+
+    def __init__( self, maxlen: int = 10000 ):
+        self._events: collections.deque = collections.deque( maxlen=maxlen )
+        self._seq = 0
+        self._condition = threading.Condition()
+
+    @property
+    def cursor(self) -> int:
+        return self._seq
+
+    def record( self, rid: str, status: str, **info ):
+        with self._condition:
+            self._seq += 1
+            self._events.append( ( self._seq, dict( rid=rid, status=status, **info ) ) )
+            self._condition.notify_all()
+
+    @property
+    def oldest(self) -> int:
+        """ Sequence number of the oldest retained event """
+        return self._events[0][0] if len( self._events ) else self._seq + 1
+
+    def since( self, cursor: int, rids: Optional[Set[str]] = None, timeout: Optional[float] = None ) -> Tuple[int,List[Dict],bool]:
+        """ Returns ( new cursor, events after cursor for the given rids, reset ), waiting up to timeout for at least one such event.
+            'reset' is True when events after cursor are no longer retained ( or the journal was restarted ), in which case the
+            reader must resynchronize from a full status query. """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._condition:
+            if ( cursor > self._seq ) or ( cursor < self.oldest - 1 ):
+                return self._seq, self._collect( 0, rids ), True
+            while True:
+                events = self._collect( cursor, rids )
+                remaining = None if deadline is None else deadline - time.time()
+                if len( events ) or ( ( remaining is not None ) and ( remaining <= 0 ) ): return self._seq, events, False
+                cursor = self._seq
+                self._condition.wait( remaining )
+
+    def _collect( self, cursor: int, rids: Optional[Set[str]] ) -> List[Dict]:
+        events = []
+        for seq, event in reversed( self._events ):
+            if seq <= cursor: break
+            if ( rids is None ) or ( event["rid"] in rids ): events.append( event )
+        events.reverse()
+        return events
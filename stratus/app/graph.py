@@ -1,17 +1,30 @@
 import copy, abc
-from typing import List, Dict, Set, Iterator, Any
+from typing import List, Dict, Set, Iterator, Any, Tuple, Optional, Iterable
 from stratus_endpoint.util.config import StratusLogger, UID
 from stratus.app.client import StratusClient
 from decorator import decorator, dispatch_on
 from stratus_endpoint.handler.base import TaskHandle
-import networkx as nx
 
 @decorator
 def graphop( func, *args, **kwargs ):
     args[0].connect()
     return func( *args, **kwargs)
 
+@decorator
+def graphquery( func, *args, **kwargs ):
+    # Memoizes a topology query on the graph until the next mutation of the graph
+    graph: "DependencyGraph" = args[0]
+    graph.connect()
+    key = ( func.__name__, *args[1:], *sorted( kwargs.items() ) )
+    if graph._cache_version != graph._version:
+        graph._query_cache.clear()
+        graph._cache_version = graph._version
+    if key not in graph._query_cache:
+        graph._query_cache[key] = func( *args, **kwargs )
+    return graph._query_cache[key]
+
 class Connection:
+    __slots__ = ( "_id", "_src_nid", "_dest_nid" )
     INCOMING = 0
     OUTGOING = 1
     ALL = 2
@@ -39,6 +52,7 @@ class Connection:
         return f"C[{self._id}:{self._src_nid}->{self._dest_nid}]"
 
 class DGNode:
+    __slots__ = ( "logger", "params", "id", "_inputs", "_outputs" )
 
     def __init__( self, inputs: List[str], outputs: List[str] = None, **kwargs ):
         self.logger =  StratusLogger.getLogger()
@@ -63,15 +77,164 @@ class DGNode:
         assert result is not None,f"Missing required parameter in DGNode {self.id}: {key}, parms = {self.params}"
         return result
 
+class DAG:
+    """ Compact directed graph: nodes are mapped to integer ids with per-node adjacency arrays.
+        Copies share their arrays until one of them is mutated (copy-on-write). """
+    __slots__ = ( "_nids", "_index", "_succ", "_pred", "_edges", "_shared" )
+
+    def __init__( self ):
+        self._nids: List[Optional[str]] = []           # integer id -> node id (None for removed nodes)
+        self._index: Dict[str,int] = {}                 # node id -> integer id
+        self._succ: List[List[int]] = []
+        self._pred: List[List[int]] = []
+        self._edges: Dict[Tuple[int,int],str] = {}     # (src,dest) -> connection id
+        self._shared = False
+
+    def _own(self):
+        if self._shared:
+            self._nids = list( self._nids )
+            self._index = dict( self._index )
+            self._succ = [ list( adj ) for adj in self._succ ]
+            self._pred = [ list( adj ) for adj in self._pred ]
+            self._edges = dict( self._edges )
+            self._shared = False
+
+    def copy(self) -> "DAG":
+        dag = DAG.__new__( DAG )
+        dag._nids, dag._index, dag._succ, dag._pred, dag._edges = self._nids, self._index, self._succ, self._pred, self._edges
+        dag._shared = self._shared = True
+        return dag
+
+    def subgraph(self, nids: Iterable[str] ) -> "DAG":
+        # Induced subgraph over nids, built in O( size of subgraph )
+        dag = DAG()
+        members = [ self._index[nid] for nid in nids if nid in self._index ]
+        for i in members: dag.add_node( self._nids[i] )
+        for i in members:
+            for j in self._succ[i]:
+                if self._nids[j] in dag._index:
+                    dag.add_edge( self._nids[i], self._nids[j], self._edges[(i,j)] )
+        return dag
+
+    def __len__(self):
+        return len( self._index )
+
+    @property
+    def nodes(self) -> List[str]:
+        return list( self._index.keys() )
+
+    def has_node(self, nid: str ) -> bool:
+        return nid in self._index
+
+    def add_node(self, nid: str ):
+        if nid not in self._index:
+            self._own()
+            self._index[nid] = len( self._nids )
+            self._nids.append( nid )
+            self._succ.append( [] )
+            self._pred.append( [] )
+
+    def remove_node(self, nid: str ):
+        if nid in self._index:
+            self._own()
+            i = self._index.pop( nid )
+            for j in self._succ[i]:
+                self._pred[j].remove( i )
+                del self._edges[(i,j)]
+            for j in self._pred[i]:
+                self._succ[j].remove( i )
+                del self._edges[(j,i)]
+            self._succ[i], self._pred[i], self._nids[i] = [], [], None
+
+    def has_edge(self, src: str, dest: str ) -> bool:
+        i, j = self._index.get( src ), self._index.get( dest )
+        return ( i is not None ) and ( j is not None ) and ( (i,j) in self._edges )
+
+    def add_edge(self, src: str, dest: str, id: str ):
+        self.add_node( src )
+        self.add_node( dest )
+        i, j = self._index[src], self._index[dest]
+        if (i,j) not in self._edges:
+            self._own()
+            self._edges[(i,j)] = id
+            self._succ[i].append( j )
+            self._pred[j].append( i )
+
+    def edge_id(self, src: str, dest: str ) -> str:
+        return self._edges[ ( self._index[src], self._index[dest] ) ]
+
+    def predecessors(self, nid: str ) -> Iterator[str]:
+        return ( self._nids[j] for j in self._pred[ self._index[nid] ] )
+
+    def successors(self, nid: str ) -> Iterator[str]:
+        return ( self._nids[j] for j in self._succ[ self._index[nid] ] )
+
+    def has_predecessor(self, nid0: str, nid1: str ) -> bool:
+        return self.has_edge( nid1, nid0 )
+
+    def has_successor(self, nid0: str, nid1: str ) -> bool:
+        return self.has_edge( nid0, nid1 )
+
+    def in_edges(self, nid: str ) -> List[Tuple[str,str]]:
+        return [ ( src, nid ) for src in self.predecessors( nid ) ]
+
+    def out_edges(self, nid: str ) -> List[Tuple[str,str]]:
+        return [ ( nid, dest ) for dest in self.successors( nid ) ]
+
+    def weakly_connected_components(self) -> List[Set[str]]:
+        components = []
+        visited = set()
+        for i0 in self._index.values():
+            if i0 not in visited:
+                visited.add( i0 )
+                stack, component = [ i0 ], []
+                while len( stack ):
+                    i = stack.pop()
+                    component.append( i )
+                    for j in ( *self._succ[i], *self._pred[i] ):
+                        if j not in visited:
+                            visited.add( j )
+                            stack.append( j )
+                components.append( { self._nids[i] for i in component } )
+        return components
+
+    def topological_order(self) -> List[str]:
+        indegree = { i: len( self._pred[i] ) for i in self._index.values() }
+        frontier = [ i for i, n in indegree.items() if n == 0 ]
+        order = []
+        while len( frontier ):
+            i = frontier.pop()
+            order.append( self._nids[i] )
+            for j in self._succ[i]:
+                indegree[j] -= 1
+                if indegree[j] == 0: frontier.append( j )
+        if len( order ) < len( indegree ): raise Exception( "Cycle detected in dependency graph" )
+        return order
+
+    def to_networkx(self):
+        import networkx as nx
+        graph = nx.DiGraph()
+        graph.add_nodes_from( self._index.keys() )
+        for (i,j), id in self._edges.items(): graph.add_edge( self._nids[i], self._nids[j], id=id )
+        return graph
+
 class DependencyGraph():
 
     def __init__( self, **kwargs ):
         self.logger = StratusLogger.getLogger()
         self.nodes: Dict[str, DGNode] = {}
-        self.graph = kwargs.get( "graph", nx.DiGraph( ) )
-        for node in kwargs.get( "nodes", [] ): self.add( node )
+        self.graph: DAG = kwargs.get( "graph", DAG() )
+        self._producers: Dict[str, List[str]] = {}     # output id -> ids of the nodes producing it
+        self._consumers: Dict[str, List[str]] = {}     # input id -> ids of the nodes consuming it
         self._allow_multiple_outputs = kwargs.get( "allow_multiple_outputs", False )
         self._connected = False
+        self._version = 0
+        self._cache_version = 0
+        self._query_cache: Dict[Tuple,Any] = {}
+        linked = "graph" in kwargs
+        for node in kwargs.get( "nodes", [] ):
+            if linked: self._indexNode( node )      # Node is already connected in the supplied graph
+            else:      self.add( node )
 
     def _addDependency(self, depId, srcId: str, destId: str ):
         if not self.graph.has_edge( srcId, destId ):
@@ -95,7 +258,34 @@ class DependencyGraph():
     def _addDGNode(self, node: DGNode):
         if node.id not in self.nodes.keys():
             self._connected = False
-            self.nodes[node.id] = node
+            self._linkNode( node )
+
+    def _indexNode(self, node: DGNode ):
+        self.nodes[node.id] = node
+        for iid in node.getInputs(): self._consumers.setdefault( iid, [] ).append( node.id )
+        for oid in node.getOutputs(): self._producers.setdefault( oid, [] ).append( node.id )
+
+    def _linkNode(self, node: DGNode ):
+        # Connects a new node to the existing nodes using the output/input indices: O(fan-in + fan-out)
+        self._version += 1
+        self.graph.add_node( node.id )
+        for iid in node.getInputs():
+            for src_nid in self._producers.get( iid, [] ):
+                self._addDependency( iid, src_nid, node.id )
+        for oid in node.getOutputs():
+            for dest_nid in self._consumers.get( oid, [] ):
+                self._addDependency( oid, node.id, dest_nid )
+        self._indexNode( node )
+
+    def _unlinkNode(self, node: DGNode ):
+        self._version += 1
+        for iid in node.getInputs():
+            consumers = self._consumers.get( iid, [] )
+            if node.id in consumers: consumers.remove( node.id )
+        for oid in node.getOutputs():
+            producers = self._producers.get( oid, [] )
+            if node.id in producers: producers.remove( node.id )
+        self.graph.remove_node( node.id )
 
     def __repr__(self):
         keys = list(self.nodes.keys())
@@ -103,34 +293,22 @@ class DependencyGraph():
         return "-".join(keys)
 
     def connect(self):
-        if not self._connected:
-            self.graph.clear()
-            for nid in self.nodes.keys(): self.graph.add_node(nid)
-            for dnode in self.nodes.values():
-                inputs = dnode.getInputs()
-                self.logger.debug(f"Checking dest node[{dnode.id}] inputs: {inputs}")
-                for iid in inputs:
-                    for snode in self.nodes.values():
-                        outputs = snode.getOutputs()
-                        self.logger.debug(f"Checking src node[{snode.id}] outputs: {outputs}")
-                        if iid in outputs:
-                            self._addDependency( iid, snode.id, dnode.id  )
-            self._connected = True
+        # Nodes are linked incrementally as they are added, so this only marks the graph as connected.
+        self._connected = True
 
     def remove(self, nids: List[str]):
         for nid in nids:
-            try:
-                del self.nodes[ nid]
-                self.graph.remove_node( nid )
-            except: pass
+            node = self.nodes.pop( nid, None )
+            if node is not None:
+                self._unlinkNode( node )
+                self._connected = False
 
-    def copy(self):
-        return DependencyGraph( nodes=self.nodes.values(), graph = copy.deepcopy(self.graph) )
+    def copy(self, **kwargs ) -> "DependencyGraph":
+        return DependencyGraph( **{ "nodes": self.nodes.values(), "graph": self.graph.copy(), "allow_multiple_outputs": self._allow_multiple_outputs, **kwargs } )
 
     def filter(self, iops: Set[str] ) -> "DependencyGraph":
-        newDepGraph = self.copy()
-        newDepGraph.remove( list( self.ids ^ iops ) )
-        return newDepGraph
+        nids = [ nid for nid in iops if nid in self.nodes ]
+        return self.copy( nodes=[ self.nodes[nid] for nid in nids ], graph=self.graph.subgraph( nids ) )
 
     def __len__(self):
         return self.nodes.__len__()
@@ -142,9 +320,16 @@ class DependencyGraph():
         return len(self.nodes) < len(other)
 
     @graphop
-    def connectedComponents(self):
-        components = nx.weakly_connected_components(self.graph)
-        return [subgraph_iops for subgraph_iops in components]
+    def connectedComponents(self) -> List[Set[str]]:
+        return self.graph.weakly_connected_components()
+
+    @graphop
+    def topologicalOrder(self) -> List[str]:
+        return self.graph.topological_order()
+
+    def toNetworkx(self):
+        # Exports the graph as a networkx.DiGraph, for debugging and visualization
+        return self.graph.to_networkx()
 
     @graphop
     def predecessors( self, nid: str ):
@@ -162,37 +347,36 @@ class DependencyGraph():
     def has_successor( self, nid0: str,  nid1: str ):
         return self.graph.has_successor( nid0, nid1 )
 
-    @graphop
+    @graphquery
     def getConnections( self, nid: str, ctype: int ) -> List[Connection]:
         connections = []
         if ctype == Connection.INCOMING: graph_edges = self.graph.in_edges(nid)
         elif ctype == Connection.OUTGOING: graph_edges = self.graph.out_edges(nid)
-        elif ctype == Connection.ALL: graph_edges = self.graph.edges(nid)
-        else: raise Exception( "Unknown Connections type: {ctype}")
-        for edge_tup in graph_edges:
-            edata = self.graph.get_edge_data(*edge_tup)
-            connections.append( Connection( edata["id"], edge_tup[0], edge_tup[1] ) )
+        elif ctype == Connection.ALL: graph_edges = self.graph.in_edges(nid) + self.graph.out_edges(nid)
+        else: raise Exception( f"Unknown Connections type: {ctype}")
+        for ( src_nid, dest_nid ) in graph_edges:
+            connections.append( Connection( self.graph.edge_id( src_nid, dest_nid ), src_nid, dest_nid ) )
         return connections
 
-    @graphop
+    @graphquery
     def getConnectedNodes(self, nid: str, ctype: int) -> List[DGNode]:
         nids = [ conn.nid(ctype) for conn in  self.getConnections( nid, ctype ) ]
         return [self.nodes.get( nid ) for nid in nids if nid is not None ]
 
-    @graphop
+    @graphquery
     def getInputs(self) -> List[Connection]:
         ilist = []
         for nid,dnode  in self.nodes.items():
-            incoming_connection_ids = [ conn.id for conn in self.getConnections( nid, Connection.INCOMING ) ]
+            incoming_connection_ids = { conn.id for conn in self.getConnections( nid, Connection.INCOMING ) }
             for iid in dnode.getInputs():
                 if iid not in incoming_connection_ids: ilist.append( Connection(iid,None,nid) )
         return ilist
 
-    @graphop
+    @graphquery
     def getOutputs(self) -> List[Connection]:
         olist = []
         for nid,dnode  in self.nodes.items():
-            outgoing_connection_ids = [ conn.id for conn in self.getConnections( nid, Connection.OUTGOING ) ]
+            outgoing_connection_ids = { conn.id for conn in self.getConnections( nid, Connection.OUTGOING ) }
             for oid in dnode.getOutputs():
                 if oid not in outgoing_connection_ids: olist.append( Connection(oid,nid,None) )
         if not self._allow_multiple_outputs:
@@ -201,11 +385,11 @@ class DependencyGraph():
         if len(olist) == 0: raise Exception("Missing output node in workflow")
         return olist
 
-    @graphop
+    @graphquery
     def getOutputNodes(self) -> List[str]:
         return [ conn.src_nid for conn in self.getOutputs() ]
 
-    @graphop
+    @graphquery
     def getOutputNode(self) -> str:
         outputs = self.getOutputs()
         return outputs[0].src_nid
@@ -0,0 +1,77 @@
+""" Memoization of intermediate workflow task results across workflows, keyed by the content of the task's sub-DAG """
+import hashlib, json, collections
+from typing import List, Dict, Optional, Any
+from stratus_endpoint.util.config import StratusLogger
+from stratus_endpoint.handler.base import TaskHandle, TaskResult, Status
+from stratus.app.store import ResultStore, StoredWorkflow, StoredTask
+from stratus.util.spool import ResultSpool
+from stratus.util.parsing import str2bool
+
+def _digest( spec: Any ) -> str:
+    return hashlib.sha256( json.dumps( spec, sort_keys=True, separators=(",", ":"), default=str ).encode() ).hexdigest()
+
+class TaskMemo:
+    """ Completed WorkflowTask results keyed by a hash of the task's op params, the hashes of the ops upstream of it,
+        and the input and domain specs they read ( including request-wide defaults and options ), so that a workflow
+        sharing a prefix with an earlier one can splice in the cached result.  Enabled by parm 'memo.enabled';
+        bounded by the 'memo.*' ResultStore parms. """
+
+    OP_TRANSIENT_KEYS = { "input", "result", "id" }
+    REQUEST_KEYS = { "rid", "cid", "clients", "status", "domain", "input", "operation" }
+
+    def __init__( self, spool: ResultSpool, **kwargs ):
+        self.logger = StratusLogger.getLogger()
+        self.enabled = str2bool( kwargs.get( "memo.enabled", "false" ) )
+        self.store = ResultStore( spool, prefix="memo", **kwargs )
+        self._counts = collections.Counter()
+
+    def taskKeys( self, request: Dict, tasks: List["WorkflowTask"] ) -> Dict[str,str]:
+        """ Returns a map of task id to memo key for the tasks of a workflow """
+        if not self.enabled: return {}
+        domains = { domain.get("name"): domain for domain in request.get( "domain", [] ) }
+        default_domain = [ domains[name] for name in sorted( domains, key=str ) ]          # Applies to ops and inputs that don't name a domain
+        context = { name: value for name, value in request.items() if name not in self.REQUEST_KEYS }
+        resolve = lambda spec: domains.get( spec["domain"], spec["domain"] ) if "domain" in spec else default_domain
+        inputs = {}
+        for input in request.get( "input", [] ):
+            for name in { input.get( "name", "" ), str( input.get( "name", "" ) ).split(":")[-1] }:
+                inputs[name] = { **input, "domain": resolve( input ) }
+        producers = { output: op for task in tasks for op in task.ops for output in op.getOutputs() }
+        op_keys: Dict[str,str] = {}
+
+        def opKey( op ) -> str:
+            if op.id not in op_keys:
+                op_keys[op.id] = None       # Guards against cycles
+                params = { name: value for name, value in op.params.items() if name not in self.OP_TRANSIENT_KEYS }
+                params["domain"] = resolve( params )
+                sources = [ opKey( producers[name] ) if name in producers else inputs.get( name, name ) for name in op.getInputs() ]
+                op_keys[op.id] = _digest( dict( op=params, sources=sources, context=context ) )
+            return op_keys[op.id]
+
+        try:
+            return { task.id: _digest( dict( handle=task.handle, ops=sorted( opKey( op ) for op in task.ops ) ) ) for task in tasks }
+        except Exception as err:
+            self.logger.error( f"TaskMemo: error computing task keys, memoization disabled for request {request.get('rid')}: {err}" )
+            return {}
+
+    def lookup( self, key: str ) -> Optional[TaskHandle]:
+        stored: StoredWorkflow = self.store.get( key )
+        if ( stored is not None ) and ( stored.status() == Status.ERROR ):     # The recorded result could not be retrieved
+            del self.store[key]
+            stored = None
+        if stored is None:
+            self._counts["misses"] += 1
+            return None
+        self._counts["hits"] += 1
+        return stored.replicate( key ).getResult()
+
+    def record( self, key: str, handle: TaskHandle ) -> TaskHandle:
+        """ Records a completed task result in the memo, returning a handle that can be read repeatedly by consumers.
+            The result is read from the task's handle when first fetched, not here ( in the workflow update ). """
+        stored = StoredWorkflow( StoredTask.pending( key, handle, Status.COMPLETED ), Status.COMPLETED )
+        replica = stored.replicate( key )
+        self.store[key] = stored
+        return replica.getResult()
+
+    def stats(self) -> Dict[str,Any]:
+        return dict( enabled=self.enabled, **self.store.stats(), **self._counts )
@@ -1,5 +1,6 @@
 import copy, os, time, traceback, abc
-from typing import List, Dict, Set, Iterator, Any, Optional, Tuple
+from collections import deque
+from typing import List, Dict, Set, Iterator, Any, Optional, Tuple, Deque
 from stratus_endpoint.util.config import StratusLogger, UID
 from stratus.app.client import StratusClient
 from concurrent.futures import wait, as_completed, Executor, Future
@@ -7,6 +8,7 @@ from stratus_endpoint.handler.base import TaskHandle, TaskResult, TaskFuture, St
 from stratus.app.graph import DGNode, DependencyGraph, graphop, Connection
 
 class Op(DGNode):
+    __slots__ = ( "name", "epas" )
 
     def __init__( self, **kwargs ):
         inputs:  List[str] = self.parse( kwargs.get("input",[]) )
@@ -62,6 +64,7 @@ class ClientOpSet(OpSet):
         self.client: StratusClient = client
         self._request = request
         self._taskHandle: TaskHandle = None
+        self._submit_time: float = None
 
     def connectedOpsets(self) -> List["ClientOpSet"]:
         subgraphs = self.connectedComponents()
@@ -77,8 +80,12 @@ class ClientOpSet(OpSet):
                         operation = self.getOperationSpecs(),
                         cid= self.client.cid )
 
-    def copy(self) -> "ClientOpSet":
-        return ClientOpSet( self._request, self.client, nodes=self.nodes.values(), graph = copy.deepcopy(self.graph) )
+    @property
+    def inputSpecs(self) -> List[Dict]:
+        return self._request.get("input",[])
+
+    def copy(self, **kwargs ) -> "ClientOpSet":
+        return ClientOpSet( self._request, self.client, **{ "nodes": self.nodes.values(), "graph": self.graph.copy(), **kwargs } )
 
     def getOperationSpecs(self) -> List[Dict[str,Any]]:
         return [ op.params for op in self.nodes.values()]
@@ -110,17 +117,31 @@ class ClientOpSet(OpSet):
     def __str__(self):
         return "C({}):[{}]".format( self.client, ",".join( [ op for op in self.nodes.keys() ] ) )
 
+    def splice( self, handle: TaskHandle ):
+        # Substitutes a ( memoized ) completed result for the execution of this opset
+        self._taskHandle = handle
+
     def submit( self, inputs: List[TaskResult] ) -> TaskHandle:
         self.logger.info(f"ClientOpSet Submit TASK {self.client.handle}" )
         if self._taskHandle is None:
             filtered_request =  self.getFilteredRequest( self._request )
             self.logger.info( f"Client {self.client.handle}: submit operations {filtered_request['operations']}" )
             self._taskHandle = self.client.request(filtered_request, inputs)
+            self._submit_time = time.time()
+            self.client.stats.started()
         return self._taskHandle
 
     def status(self) -> Status:
         if self._taskHandle is None: return Status.IDLE
-        return self._taskHandle.status()
+        status = self._taskHandle.status()
+        if status in [ Status.COMPLETED, Status.ERROR, Status.CANCELED ]: self.finish( status != Status.COMPLETED )
+        return status
+
+    def finish( self, error: bool = False ):
+        # Records the end of a submitted opset in the client's load stats, once, whichever path observes it first
+        if self._submit_time is not None:
+            self.client.stats.finished( time.time() - self._submit_time, error )
+            self._submit_time = None
 
     def exception(self) -> Optional[Exception]:
         if self._taskHandle is None: return None
@@ -129,6 +150,7 @@ class ClientOpSet(OpSet):
         return exc
 
 class WorkflowTask(DGNode):
+    __slots__ = ( "_opset", "dependencies", "consumers", "_future" )
 
     def __init__( self, opset: ClientOpSet, **kwargs ):
         self._opset = opset
@@ -143,6 +165,10 @@ class WorkflowTask(DGNode):
     def requestSpec(self) -> Dict:
         return self._opset.requestSpec
 
+    @property
+    def ops(self) -> List[Op]:
+        return list( self._opset.nodes.values() )
+
     @property
     def name(self) -> str:
         return self._opset.name
@@ -185,6 +211,9 @@ class WorkflowTask(DGNode):
     def status(self) -> Status:
         return self._opset.status()
 
+    def splice( self, handle: TaskHandle ):
+        self._opset.splice( handle )
+
     def submit( self, executor: Executor, **kwargs ) -> TaskFuture:
         self.logger.info( f"Submitting Task[{self.handle}:{self.rid}]")
         self._future = executor.submit( self.execute, **kwargs )
@@ -194,7 +223,16 @@ class WorkflowTask(DGNode):
     def execute( self, **kwargs ) -> TaskResult:
         results: List[TaskResult] = self.waitOnTasks()
         handle = self._opset.submit( results )
-        return handle.blockForResult( **kwargs )
+        try:
+            result = handle.blockForResult( **kwargs )
+        except Exception:
+            self._opset.finish( True )
+            raise
+        self._opset.finish()
+        return result
+
+    def finish( self, error: bool = False ):
+        self._opset.finish( error )
 
     def getDependentInputs(self) -> List[TaskResult]:
         results = []
@@ -335,52 +373,124 @@ class WorkflowBase(DependencyGraph):
     def completed(self):
         return self._status not in [Status.EXECUTING, Status.IDLE]
 
+    def polled(self) -> bool:
+        # True while progress can only be observed by polling update(), rather than being signalled to the app loop
+        return not self.completed()
+
+    def release(self):
+        # Ends the load accounting of any submitted tasks that never reported a terminal status ( errored, canceled or abandoned workflows )
+        for wtask in self.tasks: wtask.finish( True )
+
     def connect(self):
-        DependencyGraph.connect(self)
-        for wtask in self.tasks:
-            in_edges = self.graph.in_edges(wtask.id)
-            connections = [ Connection(self.graph.get_edge_data(*edge_tup)["id"], edge_tup[0], edge_tup[1]) for edge_tup in in_edges ]
-            nids = [conn.nid(Connection.INCOMING) for conn in connections ]
-            dep_tasks: List[WorkflowTask] =  [self.nodes.get(nid) for nid in nids if nid is not None]
-            wtask.setDependencies( dep_tasks )
+        if not self._connected:
+            DependencyGraph.connect(self)
+            for wtask in self.tasks:
+                in_edges = self.graph.in_edges(wtask.id)
+                dep_tasks: List[WorkflowTask] =  [self.nodes.get(src_nid) for (src_nid, dest_nid) in in_edges ]
+                wtask.setDependencies( dep_tasks )
+                out_edges = self.graph.out_edges(wtask.id)
+                consumer_tasks: List[WorkflowTask] = [self.nodes.get(dest_nid) for (src_nid, dest_nid) in out_edges ]
+                wtask.setConsumers( consumer_tasks )
 
 class StratusWorkflow(WorkflowBase):
 
     def __init__( self, **kwargs ):
         WorkflowBase.__init__( self, **kwargs )
+        self._indegree: Dict[str,int] = {}
+        self._ready: Deque[str] = deque()
+        self._running: Set[str] = set()
+        self._output_id: str = None
+        self._memo = kwargs.get( "memo", None )
+        self._request: Dict = kwargs.get( "request", {} )
+        self._memo_keys: Dict[str,str] = {}
+
+    def initSchedule(self):
+        # Tasks are released onto the ready queue when their count of uncompleted dependencies drops to zero
+        self._output_id = self.getOutputNode()
+        hits = self.spliceMemoized()
+        needed = self.neededTasks( hits )
+        self._indegree = { tid: len( self.nodes[tid].dependencies ) for tid in needed if tid not in hits }
+        self._ready = deque( [ tid for tid, indegree in self._indegree.items() if indegree == 0 ] )
+        self._running = set()
+        for tid in hits:
+            if tid in needed: self.completeTask( self.nodes[tid] )
+
+    def spliceMemoized(self) -> Set[str]:
+        # Substitutes memoized results for tasks whose sub-DAG has already been computed by an earlier workflow
+        if self._memo is None: return set()
+        self._memo_keys = self._memo.taskKeys( self._request, self.tasks )
+        hits = set()
+        for tid, key in self._memo_keys.items():
+            handle = self._memo.lookup( key )
+            if handle is not None:
+                self.logger.info( f"Workflow {self._request.get('rid')}: spliced memoized result for task {tid}" )
+                self.nodes[tid].splice( handle )
+                hits.add( tid )
+        return hits
+
+    def neededTasks( self, hits: Set[str] ) -> Set[str]:
+        # Tasks reachable upstream from the output task without passing through a memoized task
+        needed, stack = set(), [ self._output_id ]
+        while len( stack ):
+            tid = stack.pop()
+            if tid in needed: continue
+            needed.add( tid )
+            if tid not in hits: stack.extend( dep.id for dep in self.nodes[tid].dependencies )
+        return needed
+
+    def polled(self) -> bool:
+        # Running tasks on clients that push status changes wake the app loop when they complete
+        if self._status == Status.IDLE: return True
+        return any( not self.nodes[tid].client.pushes_status for tid in self._running )
+
+    def launchReadyTasks(self):
+        while len( self._ready ):
+            tid = self._ready.popleft()
+            self.nodes[tid].async_execute()
+            self._running.add( tid )
+
+    def completeTask(self, wtask: WorkflowTask ):
+        if ( wtask.id in self._running ) and ( wtask.id in self._memo_keys ):
+            wtask.splice( self._memo.record( self._memo_keys[wtask.id], wtask.taskHandle ) )
+        wtask.finish()
+        self._running.discard( wtask.id )
+        self.completed_tasks.append( wtask.id )
+        self.logger.info( f"COMPLETED TASK: taskID: {wtask.id}, outputID: {self._output_id}, nodes: {list(self.ids)}, exception: {wtask.taskHandle.exception()}, status: {wtask.taskHandle.status()}")
+        if wtask.id == self._output_id:
+            self.result =  wtask.taskHandle
+        for consumer in wtask.consumers:
+            if consumer.id not in self._indegree: continue
+            self._indegree[consumer.id] -= 1
+            if self._indegree[consumer.id] == 0:
+                self._ready.append( consumer.id )
 
     @graphop
     def update( self ) -> bool:
-        completed = True
         try:
             if self._status in [Status.EXECUTING, Status.IDLE]:
+                if self._status == Status.IDLE: self.initSchedule()
                 self._status = Status.EXECUTING
-                output_id = self.getOutputNode()
-                for wtask in self.tasks:
-                    if wtask.id not in self.completed_tasks:
-                        stat = wtask.status()
-                        if stat == Status.ERROR:
-                            self._status = Status.ERROR
-                            exc = wtask.exception()
-                            raise Exception( "Workflow Errored out: " + ( getattr(exc, 'message', repr(exc)) if exc is not None else "NULL" )  )
-                        elif stat == Status.CANCELED:
-                            self._status = Status.CANCELED
-                            raise Exception("Workflow Canceled")
-                        elif (stat == Status.IDLE) and (wtask.dependentStatus() == Status.COMPLETED):
-                            wtask.async_execute()
-                            completed = False
-                        elif ( stat == Status.EXECUTING ):
-                            completed = False
-                        elif ( stat == Status.COMPLETED ):
-                            self._status = Status.COMPLETED
-                            self.completed_tasks.append( wtask.id )
-                            self.logger.info( f"COMPLETED TASK: taskID: {wtask.id}, outputID: {output_id}, nodes: {list(self.ids)}, exception: {wtask.taskHandle.exception()}, status: {wtask.taskHandle.status()}")
-                            if wtask.id == output_id:
-                                self.result =  wtask.taskHandle
+                self.launchReadyTasks()
+                for tid in list( self._running ):
+                    wtask: WorkflowTask = self.nodes[tid]
+                    stat = wtask.status()
+                    if stat == Status.ERROR:
+                        self._status = Status.ERROR
+                        exc = wtask.exception()
+                        raise Exception( "Workflow Errored out: " + ( getattr(exc, 'message', repr(exc)) if exc is not None else "NULL" )  )
+                    elif stat == Status.CANCELED:
+                        self._status = Status.CANCELED
+                        raise Exception("Workflow Canceled")
+                    elif stat == Status.COMPLETED:
+                        self.completeTask( wtask )
+                self.launchReadyTasks()
+                if len( self._running ) == 0:
+                    self._status = Status.COMPLETED
         except Exception as err:
             self._status = Status.ERROR
             self.result = FailedTask( err )
-        return completed
+            self.release()
+        return self.completed()
 
 
 if __name__ == "__main__":
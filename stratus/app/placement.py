@@ -0,0 +1,217 @@
+import abc, itertools, random
+from typing import List, Dict, Set, Iterator, Any, Optional, Tuple, Callable, Type
+from stratus_endpoint.util.config import StratusLogger
+from stratus.app.client import StratusClient
+from stratus.app.operations import Op, OpSet, ClientOpSet
+
+class PlacementEngine:
+    """ Assigns each op in a request to exactly one of the clients that can handle it """
+    __metaclass__ = abc.ABCMeta
+    engines: Dict[str, Type["PlacementEngine"]] = {}
+
+    def __init__( self, **kwargs ):
+        self.logger = StratusLogger.getLogger()
+        self.parms = kwargs
+
+    def parm(self, name: str, default: Any ) -> Any:
+        return self.parms.get( f"placement.{name}", default )
+
+    @classmethod
+    def register( cls, name: str, engine: Type["PlacementEngine"] ):
+        cls.engines[ name ] = engine
+
+    @classmethod
+    def create( cls, name: str, **kwargs ) -> "PlacementEngine":
+        engine = cls.engines.get( name )
+        assert engine is not None, f"Unknown placement engine '{name}', available engines: {list(cls.engines.keys())}"
+        return engine( **kwargs )
+
+    @abc.abstractmethod
+    def place( self, clientOpsets: Dict[str, ClientOpSet] ) -> List[ClientOpSet]:
+        """ Takes the map of client handle -> all ops that client can handle, returns disjoint opsets covering every op """
+        pass
+
+class GreedyPlacement(PlacementEngine):
+    """ Repeatedly gives the largest candidate opset all of its unassigned ops, maximizing locality of operations """
+
+    def place( self, clientOpsets: Dict[str, ClientOpSet] ) -> List[ClientOpSet]:
+        filtered_opsets: List[ClientOpSet] = []
+        processed_ops: Set[str] = set()
+        sorted_opsets: List[Tuple[str,ClientOpSet]] = list(sorted(clientOpsets.items(), reverse=True, key=lambda x: x[1]))
+        while len( sorted_opsets ):
+            cid, base_opset = sorted_opsets.pop(0)
+            new_opset = base_opset.new()
+            for op in base_opset:
+                if op.id not in processed_ops:
+                    processed_ops.add( op.id )
+                    new_opset.add( op )
+            if len( new_opset ) > 0:
+                filtered_opsets.append( new_opset )
+            for cid, opset in sorted_opsets:
+                opset.remove( list( processed_ops & opset.ids ) )
+            sorted_opsets = list( sorted( sorted_opsets, reverse=True, key=lambda x: x[1] ) )
+        return filtered_opsets
+
+class CostModelPlacement(PlacementEngine):
+    """ Chooses the assignment of ops to clients that minimizes the estimated critical-path makespan.
+
+        The estimated run time of an op on a client is taken from the client's measured latency history if
+        available, otherwise from its declared cost hints ( client parms 'cost.<epa>.<op>', 'cost.<op>' or 'cost' ),
+        scaled up by the client's outstanding requests and down by its priority.  Edges between ops placed on
+        different clients add a transfer cost proportional to the producer's 'size' hint ( MB ), and ops reading
+        request inputs that are not in one of the client's 'data_locations' pay a transfer cost for that input.
+        Small requests are placed by exhaustive search, larger ones using HEFT list scheduling. """
+
+    def __init__( self, **kwargs ):
+        PlacementEngine.__init__( self, **kwargs )
+        self.transfer_rate = float( self.parm( "transfer_rate", 0.1 ) )           # sec per MB moved between clients
+        self.default_size = float( self.parm( "default_size", 1.0 ) )             # MB
+        self.exhaustive_limit = int( self.parm( "exhaustive_limit", 256 ) )       # max assignments searched exhaustively
+
+    def place( self, clientOpsets: Dict[str, ClientOpSet] ) -> List[ClientOpSet]:
+        candidates: Dict[str, List[str]] = {}
+        ops: Dict[str, Op] = {}
+        for handle, opset in clientOpsets.items():
+            for op in opset:
+                ops[op.id] = op
+                candidates.setdefault( op.id, [] ).append( handle )
+        graph = OpSet( nodes=ops.values() )
+        order: List[str] = graph.topologicalOrder()
+        preds: Dict[str, List[str]] = { oid: list( graph.predecessors( oid ) ) for oid in order }
+        costs: Dict[Tuple[str,str], float] = { (oid,handle): self.cost( ops[oid], clientOpsets[handle] ) for oid, handles in candidates.items() for handle in handles }
+        transfers: Dict[str, float] = { oid: self.transfer( ops[oid] ) for oid in order }
+
+        nassignments = 1
+        for handles in candidates.values(): nassignments *= len( handles )
+        if nassignments <= self.exhaustive_limit:
+            assignment = self.exhaustiveSearch( order, candidates, preds, costs, transfers )
+        else:
+            assignment = self.heft( order, candidates, preds, costs, transfers, graph )
+
+        placed_opsets: Dict[str, ClientOpSet] = {}
+        for oid in order:
+            handle = assignment[oid]
+            placed_opsets.setdefault( handle, clientOpsets[handle].new() ).add( ops[oid] )
+        self.logger.info( f"CostModelPlacement: { {handle: list(opset.ids) for handle, opset in placed_opsets.items()} }" )
+        return list( placed_opsets.values() )
+
+    def cost( self, op: Op, opset: ClientOpSet ) -> float:
+        client: StratusClient = opset.client
+        latency = client.stats.latency
+        estimate = latency if latency is not None else self.costHint( op, client )
+        concurrency = max( float( client.parm( "concurrency", "1" ) ), 1.0 )
+        estimate = estimate * ( 1.0 + client.stats.outstanding / concurrency ) / ( 1.0 + max( client.priority, 0.0 ) )
+        return estimate + self.inputTransfer( op, opset )
+
+    def costHint( self, op: Op, client: StratusClient ) -> float:
+        keys = [ f"cost.{epa}.{op.name}" for epa in op.epas ] + [ f"cost.{op.name}", "cost" ]
+        for key in keys:
+            hint = client.parm( key )
+            if hint is not None: return float( hint )
+        return 1.0
+
+    def inputTransfer( self, op: Op, opset: ClientOpSet ) -> float:
+        locations = opset.client.parm( "data_locations" )
+        if locations is None: return 0.0
+        prefixes = [ loc.strip() for loc in locations.split(",") ]
+        inputs = { spec.get("name","").split(":")[-1]: spec.get("uri","") for spec in opset.inputSpecs }
+        remote = [ iid for iid in op.getInputs() if ( iid in inputs ) and not any( inputs[iid].startswith(prefix) for prefix in prefixes ) ]
+        return len( remote ) * self.default_size * self.transfer_rate
+
+    def transfer( self, op: Op ) -> float:
+        return float( op.get( "size", self.default_size ) ) * self.transfer_rate
+
+    def makespan( self, order: List[str], assignment: Dict[str,str], preds: Dict[str, List[str]], costs: Dict[Tuple[str,str], float], transfers: Dict[str, float] ) -> float:
+        finish: Dict[str, float] = {}
+        available: Dict[str, float] = {}
+        for oid in order:
+            handle = assignment[oid]
+            ready = max( [ finish[pid] + ( transfers[pid] if assignment[pid] != handle else 0.0 ) for pid in preds[oid] ], default=0.0 )
+            finish[oid] = max( ready, available.get( handle, 0.0 ) ) + costs[(oid,handle)]
+            available[handle] = finish[oid]
+        return max( finish.values(), default=0.0 )
+
+    def exhaustiveSearch( self, order: List[str], candidates: Dict[str, List[str]], preds: Dict[str, List[str]], costs: Dict[Tuple[str,str], float], transfers: Dict[str, float] ) -> Dict[str,str]:
+        best, best_makespan = None, None
+        for handles in itertools.product( *[ candidates[oid] for oid in order ] ):
+            assignment = dict( zip( order, handles ) )
+            makespan = self.makespan( order, assignment, preds, costs, transfers )
+            if ( best_makespan is None ) or ( makespan < best_makespan ):
+                best, best_makespan = assignment, makespan
+        return best
+
+    def heft( self, order: List[str], candidates: Dict[str, List[str]], preds: Dict[str, List[str]], costs: Dict[Tuple[str,str], float], transfers: Dict[str, float], graph: OpSet ) -> Dict[str,str]:
+        rank: Dict[str, float] = {}
+        for oid in reversed( order ):
+            mean_cost = sum( costs[(oid,handle)] for handle in candidates[oid] ) / len( candidates[oid] )
+            rank[oid] = mean_cost + max( [ transfers[oid] + rank[sid] for sid in graph.successors( oid ) ], default=0.0 )
+        position = { oid: index for index, oid in enumerate( order ) }
+        assignment: Dict[str,str] = {}
+        finish: Dict[str, float] = {}
+        available: Dict[str, float] = {}
+        for oid in sorted( order, key=lambda oid: ( -rank[oid], position[oid] ) ):
+            best_handle, best_finish = None, None
+            for handle in candidates[oid]:
+                ready = max( [ finish[pid] + ( transfers[pid] if assignment[pid] != handle else 0.0 ) for pid in preds[oid] ], default=0.0 )
+                op_finish = max( ready, available.get( handle, 0.0 ) ) + costs[(oid,handle)]
+                if ( best_finish is None ) or ( op_finish < best_finish ):
+                    best_handle, best_finish = handle, op_finish
+            assignment[oid], finish[oid] = best_handle, best_finish
+            available[best_handle] = best_finish
+        return assignment
+
+class BalancedPlacement(PlacementEngine):
+    """ Spreads independent groups of ops ( connected components of the request ) across equivalent clients,
+        i.e. clients that can each handle every op in the group.  The client is chosen according to the
+        'placement.balance' parm: 'round_robin', 'least_outstanding' ( default ) or 'p2c' ( power of two choices ),
+        using each client's in-flight request count plus the groups already assigned to it in this request.
+        Groups that no single client can handle fall back to greedy placement. """
+
+    def __init__( self, **kwargs ):
+        PlacementEngine.__init__( self, **kwargs )
+        self.mode = self.parm( "balance", "least_outstanding" )
+        self.selectors: Dict[str, Callable[[List[str],Callable[[str],int]],str]] = dict( round_robin=self.roundRobin, least_outstanding=self.leastOutstanding, p2c=self.powerOfTwoChoices )
+        assert self.mode in self.selectors, f"Unknown placement.balance mode '{self.mode}', available modes: {list(self.selectors.keys())}"
+        self.fallback = GreedyPlacement( **kwargs )
+        self._rr_index: Dict[Tuple[str,...], int] = {}
+
+    def place( self, clientOpsets: Dict[str, ClientOpSet] ) -> List[ClientOpSet]:
+        candidates: Dict[str, Set[str]] = {}
+        ops: Dict[str, Op] = {}
+        for handle, opset in clientOpsets.items():
+            for op in opset:
+                ops[op.id] = op
+                candidates.setdefault( op.id, set() ).add( handle )
+        assigned: Dict[str,int] = {}
+        load = lambda handle: clientOpsets[handle].client.stats.outstanding + assigned.get( handle, 0 )
+        placed_opsets: Dict[str, ClientOpSet] = {}
+        for component in OpSet( nodes=ops.values() ).connectedComponents():
+            handles = set.intersection( *[ candidates[oid] for oid in component ] )
+            if len( handles ):
+                handle = self.selectors[self.mode]( sorted( handles ), load )
+                assigned[handle] = assigned.get( handle, 0 ) + 1
+                component_opsets = [ clientOpsets[handle].filter( component ) ]
+            else:
+                restricted_opsets = { handle: opset.filter( component ) for handle, opset in clientOpsets.items() }
+                component_opsets = self.fallback.place( { handle: opset for handle, opset in restricted_opsets.items() if len(opset) > 0 } )
+            for opset in component_opsets:
+                placed_opset = placed_opsets.setdefault( opset.client.handle, opset.new() )
+                for op in opset: placed_opset.add( op )
+        return list( placed_opsets.values() )
+
+    def roundRobin( self, handles: List[str], load: Callable[[str],int] ) -> str:
+        key = tuple( handles )
+        index = self._rr_index.get( key, 0 )
+        self._rr_index[key] = index + 1
+        return handles[ index % len(handles) ]
+
+    def leastOutstanding( self, handles: List[str], load: Callable[[str],int] ) -> str:
+        return min( handles, key=load )
+
+    def powerOfTwoChoices( self, handles: List[str], load: Callable[[str],int] ) -> str:
+        if len( handles ) < 3: return self.leastOutstanding( handles, load )
+        return self.leastOutstanding( random.sample( handles, 2 ), load )
+
+PlacementEngine.register( "greedy", GreedyPlacement )
+PlacementEngine.register( "cost", CostModelPlacement )
+PlacementEngine.register( "balanced", BalancedPlacement )
@@ -0,0 +1,300 @@
+import collections, collections.abc, threading, time, os
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional, Callable, Iterator, Any
+import xarray as xa
+from stratus_endpoint.util.config import StratusLogger, UID
+from stratus_endpoint.handler.base import TaskHandle, TaskResult, Status, FailedTask
+from stratus.app.operations import WorkflowBase
+from stratus.util.spool import ResultSpool
+
+class StoredTask(TaskHandle):
+    """ Materialized result of a completed workflow.  Each call to getResult returns a new TaskResult, so results can
+        be fetched repeatedly; datasets that have been spilled to the spool are reloaded from disk on demand.
+        A task created with a source handle is materialized from it on the first getResult call ( in the fetching
+        thread ) rather than when the workflow completes, so slow result transfers never block the app loop. """
+    SPILL_EXT = "store.nc"
+
+    def __init__( self, rid: str, header: Dict, datasets: Optional[List[xa.Dataset]], status: Status, exception: Optional[Exception] = None, **kwargs ):
+        TaskHandle.__init__( self, rid=rid, **{ key: value for key, value in kwargs.items() if key != "source" } )
+        self.header = header
+        self.datasets: Optional[List[xa.Dataset]] = datasets
+        self.paths: Optional[List[str]] = None
+        self.spool: Optional[ResultSpool] = None
+        self._spill_id = UID.randomId( 6 )                  # Copies of a result under the same rid ( e.g. memo hits ) spill to separate files
+        self._status = status
+        self._exception = exception
+        self._source: Optional[TaskHandle] = kwargs.get( "source" )
+        self._load_lock = threading.Lock()
+        self.on_load: Optional[Callable[["StoredTask"],None]] = None
+        self.nbytes = sum( dataset.nbytes for dataset in datasets or [] )
+
+    @classmethod
+    def pending( cls, rid: str, source: TaskHandle, status: Status ) -> "StoredTask":
+        return StoredTask( rid, {}, None, status, cid=getattr( source, "cid", None ), source=source )
+
+    @property
+    def loaded(self) -> bool:
+        return self._source is None
+
+    @property
+    def spilled(self) -> bool:
+        return self.paths is not None
+
+    def load(self):
+        """ Retrieves the result from the source handle, once """
+        with self._load_lock:
+            if self._source is None: return
+            source = self._source
+            try:
+                if isinstance( source, StoredTask ): source.load()
+                if isinstance( source, StoredTask ) and ( source.status() == Status.ERROR ):
+                    self.header, self.datasets = {}, []
+                    self._status, self._exception = Status.ERROR, source.exception()
+                elif isinstance( source, StoredTask ) and source.spilled:
+                    linked = source.link( self.rid )
+                    self.header, self.paths, self.spool, self.nbytes = linked.header, linked.paths, linked.spool, linked.nbytes
+                else:
+                    result: Optional[TaskResult] = source.getResult( block=True )
+                    datasets = []
+                    if result is not None:
+                        while not result.empty(): datasets.append( result.popDataset() )
+                    self.header = result.header if result is not None else {}
+                    self.datasets = datasets
+                    self.nbytes = sum( dataset.nbytes for dataset in datasets )
+            except Exception as err:
+                StratusLogger.getLogger().error( f"StoredTask: error retrieving result for {self.rid}: {err}" )
+                self.header, self.datasets = {}, []
+                self._status, self._exception = Status.ERROR, err
+            self._source = None
+        if self.on_load is not None: self.on_load( self )
+
+    def writeSpill( self, spool: ResultSpool ) -> List[str]:
+        """ Writes the datasets to spool files, leaving them in memory ( so readers are not disturbed while the files are written ) """
+        writer = lambda dataset: ( lambda path: dataset.to_netcdf( path, mode="w", format='NETCDF4' ) )
+        return [ spool.write( self.spillKey( index ), writer( dataset ), ext=self.SPILL_EXT ) for index, dataset in enumerate( self.datasets ) ]
+
+    def spill( self, spool: ResultSpool, paths: Optional[List[str]] = None ):
+        """ Releases the datasets in favour of their spool files, writing the files unless they have already been written """
+        self.paths = self.writeSpill( spool ) if paths is None else paths
+        self.spool, self.datasets = spool, None
+
+    def link( self, rid: str ) -> "StoredTask":
+        """ Spilled copy of this ( spilled ) task under a different rid, hard linking the spool files so that each copy can be removed independently """
+        task = StoredTask( rid, self.header, None, self._status, cid=getattr( self, "cid", None ) )
+        task.spool, task.nbytes = self.spool, self.nbytes
+        task.paths = [ self.spool.write( task.spillKey( index ), lambda temp_path, path=path: os.link( path, temp_path ), ext=self.SPILL_EXT ) for index, path in enumerate( self.paths ) ]
+        return task
+
+    def unspill( self, spool: ResultSpool ):
+        for index in range( len( self.paths or self.datasets or [] ) ):
+            spool.remove( self.spillKey( index ), ext=self.SPILL_EXT )
+
+    def spillKey( self, index: int ) -> str:
+        return f"{self.rid}-{self._spill_id}-{index}"
+
+    def getResult( self, **kwargs ) -> Optional[TaskResult]:
+        if not self.loaded: self.load()
+        if self._status == Status.ERROR: return None
+        datasets = self.datasets if self.datasets is not None else [ xa.open_dataset( path ) for path in self.paths ]
+        return TaskResult( dict( self.header ), list( datasets ) )
+
+    def status(self) -> Status:
+        return self._status
+
+    def exception(self) -> Optional[Exception]:
+        return self._exception
+
+class StoredWorkflow:
+    """ Lightweight stand-in for a completed workflow, so the task graph and intermediate results can be released """
+
+    def __init__( self, result: TaskHandle, status: Status ):
+        self.result = result
+        self._status = status
+        self.stored = time.time()
+        self.accessed = self.stored
+
+    def status(self) -> Status:
+        return self.result.status() if isinstance( self.result, StoredTask ) else self._status
+
+    def getResult(self) -> TaskHandle:
+        self.accessed = time.time()
+        return self.result
+
+    def completed(self) -> bool:
+        return True
+
+    def update(self) -> bool:
+        return True
+
+    @property
+    def spilled(self) -> bool:
+        return isinstance( self.result, StoredTask ) and self.result.spilled
+
+    @property
+    def nbytes(self) -> int:
+        return self.result.nbytes if isinstance( self.result, StoredTask ) and not self.result.spilled else 0
+
+    def replicate( self, rid: str ) -> "StoredWorkflow":
+        """ Copy of this completed workflow under a different rid, sharing the ( in-memory or reloaded ) datasets """
+        self.accessed = time.time()
+        if not isinstance( self.result, StoredTask ): return StoredWorkflow( self.result, self._status )
+        if not self.result.loaded: return StoredWorkflow( StoredTask.pending( rid, self.result, self._status ), self._status )
+        if self.result.status() == Status.ERROR: return StoredWorkflow( self.result, Status.ERROR )
+        if self.result.spilled: return StoredWorkflow( self.result.link( rid ), self._status )
+        result, datasets = self.result.getResult(), []
+        while not result.empty(): datasets.append( result.popDataset() )
+        return StoredWorkflow( StoredTask( rid, result.header, datasets, self._status, cid=getattr( self.result, "cid", None ) ), self._status )
+
+class ResultStore(collections.abc.MutableMapping):
+    """ Completed workflows keyed by rid, bounded by a memory budget ( parm 'store.max_mb' ), a maximum number of
+        entries ( 'store.max_entries' ) and a time-to-live since last access ( 'store.ttl' seconds ).  When over budget,
+        least recently used results larger than 'store.spill_mb' are spilled to the result spool, smaller ones are evicted.
+        Spilled results are evicted when their total size exceeds 'store.max_disk_mb' ( unbounded by default ).
+        Spill files are written by a background thread, so the app loop never waits on the encoding: a result
+        stays in memory ( and readable ) until its files have been written.
+        The parm prefix can be changed so that other caches can be built on the same policy. """
+
+    enforce_interval = 5.0
+
+    def __init__( self, spool: ResultSpool, on_evict: Callable[[str],None] = None, prefix: str = "store", **kwargs ):
+        self.logger = StratusLogger.getLogger()
+        self.spool = spool.withPrefix( prefix, float( "inf" ) )         # Spill files are removed with their entries, never by age
+        self.spool.purge( spool.max_age )                               # Leftovers from earlier processes
+        self.max_bytes = float( kwargs.get( f"{prefix}.max_mb", 2048 ) ) * 1024 * 1024
+        self.spill_bytes = float( kwargs.get( f"{prefix}.spill_mb", 16 ) ) * 1024 * 1024
+        self.max_disk_bytes = float( kwargs.get( f"{prefix}.max_disk_mb", "inf" ) ) * 1024 * 1024
+        self.max_entries = int( kwargs.get( f"{prefix}.max_entries", 10000 ) )
+        self.ttl = float( kwargs.get( f"{prefix}.ttl", 3600 ) )
+        self._on_evict = on_evict
+        self._entries: Dict[str,StoredWorkflow] = {}
+        self._lock = threading.RLock()
+        self._nbytes = 0
+        self._disk_bytes = 0
+        self._counts = collections.Counter()
+        self._last_enforced = 0.0
+        self._spilling: Dict[str,StoredWorkflow] = {}      # Entries queued to the spill thread
+        self._spilling_bytes = 0
+        self._spiller = ThreadPoolExecutor( max_workers=1, thread_name_prefix=f"{prefix}-spill" )
+        self._expired: collections.OrderedDict = collections.OrderedDict()        # Recently expired or evicted rids, so fetches can be told why the result is gone
+
+    def __setitem__( self, rid: str, workflow: WorkflowBase ):
+        stored = workflow if isinstance( workflow, StoredWorkflow ) else self.materialize( rid, workflow )
+        with self._lock:
+            if rid in self._entries: self._remove( rid )
+            self._entries[rid] = stored
+            self._expired.pop( rid, None )
+            self._nbytes += stored.nbytes
+            if stored.spilled: self._disk_bytes += stored.result.nbytes
+            self._counts["stored"] += 1
+            if isinstance( stored.result, StoredTask ) and not stored.result.loaded:
+                stored.result.on_load = lambda task: self._loaded( rid, stored )
+        self.enforce()
+
+    def __getitem__( self, rid: str ) -> StoredWorkflow:
+        return self._entries[rid]
+
+    def __delitem__( self, rid: str ):
+        with self._lock: self._remove( rid )
+
+    def __iter__( self ) -> Iterator[str]:
+        return iter( list( self._entries.keys() ) )
+
+    def __len__( self ) -> int:
+        return len( self._entries )
+
+    def materialize( self, rid: str, workflow: WorkflowBase ) -> StoredWorkflow:
+        """ Stand-in for a completed workflow; a completed result is retrieved on first access, not here ( in the app loop ) """
+        status: Status = workflow.status()
+        handle: TaskHandle = workflow.getResult()
+        if status != Status.COMPLETED or handle is None:
+            return StoredWorkflow( handle, status )
+        return StoredWorkflow( StoredTask.pending( rid, handle, status ), status )
+
+    def _loaded( self, rid: str, stored: StoredWorkflow ):
+        # Accounts for a lazily materialized result, the budget is enforced on the next maintain() call
+        with self._lock:
+            if self._entries.get( rid ) is not stored: return
+            if stored.spilled:  self._disk_bytes += stored.result.nbytes
+            else:               self._nbytes += stored.nbytes
+
+    def expired( self, rid: str ) -> bool:
+        """ True if the result for rid was dropped by the TTL or budget policy ( rather than cleared after delivery ) """
+        return rid in self._expired
+
+    def maintain(self):
+        """ Called periodically from the app loop to expire idle entries """
+        if time.time() - self._last_enforced > self.enforce_interval: self.enforce()
+
+    def enforce(self):
+        """ Expires entries past their TTL, then spills or evicts least recently used entries until within budget """
+        now = time.time()
+        self._last_enforced = now
+        with self._lock:
+            for rid, stored in list( self._entries.items() ):
+                if now - stored.accessed > self.ttl:
+                    self._remove( rid, "expired" )
+            lru = sorted( self._entries.items(), key=lambda item: item[1].accessed )
+            for rid, stored in lru:
+                over_count, over_bytes = len( self._entries ) > self.max_entries, self._nbytes - self._spilling_bytes > self.max_bytes
+                if not ( over_count or over_bytes ): break
+                if over_count:
+                    self._remove( rid, "evicted" )
+                elif rid in self._spilling:
+                    continue
+                elif stored.nbytes > self.spill_bytes:
+                    self._spilling[rid] = stored
+                    self._spilling_bytes += stored.nbytes
+                    self._spiller.submit( self._spill, rid, stored )
+                elif stored.nbytes > 0:
+                    self._remove( rid, "evicted" )
+            if self._disk_bytes > self.max_disk_bytes:
+                for rid, stored in lru:
+                    if self._disk_bytes <= self.max_disk_bytes: break
+                    if rid in self._entries and stored.spilled: self._remove( rid, "evicted" )
+
+    def _spill( self, rid: str, stored: StoredWorkflow ):
+        # Runs on the spill thread: the files are written outside the lock, then swapped in if the entry is still stored
+        try:
+            paths = stored.result.writeSpill( self.spool )
+        except Exception as err:
+            self.logger.error( f"ResultStore: error spilling result {rid}: {err}" )
+            paths = None
+        with self._lock:
+            if self._spilling.get( rid ) is stored:
+                del self._spilling[rid]
+                self._spilling_bytes -= stored.nbytes
+            if paths is None: return
+            if self._entries.get( rid ) is not stored:
+                stored.result.unspill( self.spool )
+                return
+            self._nbytes -= stored.nbytes
+            self._disk_bytes += stored.nbytes
+            stored.result.spill( self.spool, paths )
+            self._counts["spilled"] += 1
+            self.logger.info( f"ResultStore: spilled result {rid} to {self.spool.directory}" )
+
+    def flush(self):
+        """ Waits for queued spills to be written """
+        self._spiller.submit( lambda: None ).result()
+
+    def _remove( self, rid: str, reason: str = None ):
+        stored: StoredWorkflow = self._entries.pop( rid, None )
+        if stored is None: return
+        if self._spilling.get( rid ) is stored:
+            del self._spilling[rid]
+            self._spilling_bytes -= stored.nbytes
+        self._nbytes -= stored.nbytes
+        if stored.spilled: self._disk_bytes -= stored.result.nbytes
+        if isinstance( stored.result, StoredTask ): stored.result.unspill( self.spool )
+        if reason is not None:
+            self._expired[rid] = reason
+            while len( self._expired ) > self.max_entries: self._expired.popitem( last=False )
+            self._counts[reason] += 1
+            self.logger.info( f"ResultStore: {reason} result {rid}" )
+            if self._on_evict is not None: self._on_evict( rid )
+
+    def stats(self) -> Dict[str,Any]:
+        with self._lock:
+            spilled = sum( 1 for stored in self._entries.values() if stored.spilled )
+            return dict( entries=len( self._entries ), spilled_entries=spilled, memory_bytes=self._nbytes, max_bytes=self.max_bytes, disk_bytes=self._disk_bytes,
+                         occupancy=( self._nbytes / self.max_bytes if self.max_bytes else 0.0 ), **self._counts )
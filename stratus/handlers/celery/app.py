@@ -3,17 +3,18 @@ from stratus.app.base import StratusAppBase, StratusEmbeddedApp
 from stratus.app.client import stratusrequest
 from stratus.app.operations import WorkflowBase
 from stratus_endpoint.util.config import StratusLogger, UID
-from stratus_endpoint.handler.base import TaskHandle, TaskResult
+from stratus_endpoint.handler.base import TaskHandle, TaskResult, Status
 from stratus.app.operations import StratusWorkflow, WorkflowTask
 from stratus.app.client import StratusClient
 from stratus.handlers.manager import Handlers
 from stratus.handlers.base import Handler
+from stratus.handlers.celery.dataplane import DataPlane
 from celery import Celery
-from typing import Dict, List, Optional
-import queue, traceback, logging, os
+from typing import Dict, List, Optional, Tuple, Any
+import queue, traceback, logging, os, threading, json, time
 from celery.utils.log import get_task_logger
 from celery import Task
-from celery.signals import after_setup_task_logger
+from celery.signals import after_setup_task_logger, worker_process_init
 from celery.app.log import TaskFormatter
 
 logger = get_task_logger(__name__)
@@ -28,38 +29,163 @@ app.conf.update(
 celery_log_file = os.path.expanduser("~/.stratus/logs/celery.log")
 app.log.setup_logging_subsystem( loglevel=logging.INFO, logfile=celery_log_file, format='[%(asctime)s: %(levelname)s/%(processName)s-> %(pathname)s:%(lineno)d]: %(message)s' )
 
+# Worker processes keep one core and client per client spec, built at most once per process: by preloadHandlers
+# when the worker pool starts the process with the spec of its service in STRATUS_WORKER_SPEC, else on first use.
+_worker_clients: Dict[str,Tuple[StratusCore,StratusClient]] = {}
+_worker_lock = threading.Lock()
+worker_warmup: Dict[str,float] = {}          # client spec key -> seconds taken to initialize its handler and client
+
+def workerClientKey( clientSpec: Dict ) -> str:
+    return json.dumps( { name: value for name, value in clientSpec.items() if name != "cid" }, sort_keys=True, default=str )
+
+def getWorkerClient( clientSpec: Dict ) -> StratusClient:
+    key = workerClientKey( clientSpec )
+    entry = _worker_clients.get( key )
+    if entry is None:
+        with _worker_lock:
+            entry = _worker_clients.get( key )
+            if entry is None:
+                t0 = time.time()
+                hspec: Dict[str,Dict] = { clientSpec['name']: dict( clientSpec ), "stratus": { 'type': "celery", 'name':"stratus" } }
+                logger.info(f"Init Celery Task Handler with spec: {hspec}")
+                core = StratusCore( hspec, internal_clients="false" )
+                handler: Handler = core.handlers.available[ clientSpec['name'] ]
+                entry = ( core, handler.client( core ) )
+                _worker_clients[key] = entry
+                worker_warmup[key] = time.time() - t0
+                logger.info( f"Initialized handler {clientSpec['name']} in {worker_warmup[key]:.2f} s" )
+    return entry[1]
+
+@worker_process_init.connect
+def preloadHandlers( **kwargs ):
+    spec = os.environ.get( "STRATUS_WORKER_SPEC" )
+    if spec is None: return
+    try:
+        clientSpec = json.loads( spec )
+        getWorkerClient( clientSpec )
+        seconds = worker_warmup.get( workerClientKey( clientSpec ), 0.0 )
+        node = os.environ.get( "STRATUS_WORKER_NODE" )
+        logger.info( f"Worker process {os.getpid()} ( {node} ) warmed up in {seconds:.2f} s" )
+        with app.events.default_dispatcher( hostname=node ) as dispatcher:
+            dispatcher.send( "worker-warmup", seconds=seconds, pid=os.getpid() )
+    except Exception as err:
+        logger.error( f"Error preloading handlers in worker process {os.getpid()}: {err}" )
+        logger.error( traceback.format_exc() )
 
 class CeleryTask(Task):
     def __init__(self):
         Task.__init__(self)
-        self._handlers: Handlers = None
-        self._name: str = None
-        self.core: StratusCore = None
-        self._handler: Handler = None
-
-    def initHandler( self, clientSpec: Dict[str,Dict] ):
-        if self._handlers is None:
-            hspec: Dict[str,Dict] = { clientSpec['name']: clientSpec, "stratus": { 'type': "celery", 'name':"stratus" } }
-            logger.info(f"Init Celery Task Handler with spec: {hspec}")
-            self.core = StratusCore( hspec )
-            self._handlers = Handlers( self.core, hspec )
-            self._name, handlerSpec = list(hspec.items())[0]
-            self._handler: Handler = self._handlers.available[ self._name ]
+        self._dataplanes: Dict[str,DataPlane] = {}
+
+    def getDataPlane( self, spec: Optional[Dict] ) -> DataPlane:
+        key = json.dumps( spec or {}, sort_keys=True, default=str )
+        dataplane = self._dataplanes.get( key )
+        if dataplane is None: dataplane = self._dataplanes.setdefault( key, DataPlane.create( spec ) )
+        return dataplane
+
+    def executeRequest( self, inputs: List[TaskResult], clientSpec: Dict, requestSpec: Dict ) -> Optional[TaskResult]:
+        cid = clientSpec.get('cid',"UNKNOWN")
+        logger.info( f"Client[{cid}]: Executing request: {requestSpec}" )
+        client: StratusClient = getWorkerClient( clientSpec )
+        taskHandle: TaskHandle = client.request( requestSpec, inputs )
+        return taskHandle.getResult( block=True ) if taskHandle else None
 
 @app.task( bind=True, base=CeleryTask )
 def celery_execute( self, inputs: List[TaskResult], clientSpec: Dict, requestSpec: Dict ) -> Optional[TaskResult]:
-    cid = clientSpec.get('cid',"UNKNOWN")
-    logger.info( f"Client[{cid}]: Executing request: {requestSpec}" )
-    self.initHandler( clientSpec )
-    client: StratusClient = self._handler.client( self.core )
-    taskHandle: TaskHandle = client.request( requestSpec, inputs )
-    return taskHandle.getResult( block=True ) if taskHandle else None
+    return self.executeRequest( inputs, clientSpec, requestSpec )
+
+# Tasks used by the CeleryWorkflow DAG compiler: each workflow level is a chord whose members receive the results
+# accumulated so far ( keyed by workflow task id ) and whose callback merges in the results of the level.
+
+@app.task( bind=True, base=CeleryTask )
+def celery_execute_node( self, tid: str, dependencies: Dict[str,Any], clientSpec: Dict, requestSpec: Dict, dataplane: Dict = None ) -> Optional[TaskResult]:
+    # Each node receives only its own inputs, by result backend task id ( or by value when executed inline ); large
+    # datasets are exchanged by reference through the data plane rather than pickled through the result backend
+    inputs = [ DataPlane.resolve( fetchResult( dependencies[dep] ) ) for dep in sorted( dependencies ) ]
+    result = self.executeRequest( inputs, clientSpec, requestSpec )
+    return self.getDataPlane( dataplane ).externalize( result )
+
+@app.task
+def level_completed() -> None:
+    # Barrier between workflow levels ( the callback of each level's chord )
+    return None
+
+@app.task
+def select_output( task_id: str ) -> Optional[TaskResult]:
+    return fetchResult( task_id )
+
+def fetchResult( ref: Any ) -> Optional[TaskResult]:
+    """ Result of a completed upstream node, given its task id, or the result itself.  The level barrier only releases a
+        node once its upstream nodes have completed, so the result is read without waiting: blocking on another task's
+        result from inside a task can deadlock the worker pool. """
+    if not isinstance( ref, str ): return ref
+    result = app.AsyncResult( ref )
+    if not result.ready(): raise Exception( f"Upstream task {ref} has not completed" )
+    if result.failed(): raise result.result
+    return result.result
+
+class CeleryRequestHandle(TaskHandle):
+    """ Handle to a request executing asynchronously in StratusAppCelery: status is read from the app's workflows and
+        blocking reads wait on the app's completion condition, signalled by the result poller. """
+
+    def __init__( self, app: "StratusAppCelery", **kwargs ):
+        TaskHandle.__init__( self, **kwargs )
+        self._app = app
+
+    def getResult( self, **kwargs ) -> Optional[TaskResult]:
+        if kwargs.get( "block", False ):
+            if not self._app.waitForCompletion( self.rid, kwargs.get( "timeout", None ) ): return None
+        handle: Optional[TaskHandle] = self._app.getResult( self.rid )
+        return None if handle is None else handle.getResult( **kwargs )
+
+    def status(self) -> Status:
+        workflow = self._app.getWorkflow( self.rid )
+        return Status.UNKNOWN if workflow is None else workflow.status()
+
+    def exception(self) -> Optional[Exception]:
+        handle: Optional[TaskHandle] = self._app.getResult( self.rid )
+        return None if handle is None else handle.exception()
 
 class StratusAppCelery(StratusEmbeddedApp):
+    """ With parm executor = 'async', workflows are dispatched with apply_async and completed by the result poller thread,
+        so concurrent requests progress independently; the default 'inline' executor runs each workflow synchronously. """
 
-    def getWorkflow( self, tasks: List[WorkflowTask] ) -> WorkflowBase:
+    def __init__( self, core: StratusCore ):
+        from stratus.handlers.celery.workflow import CeleryResultPoller
+        StratusEmbeddedApp.__init__( self, core )
+        self.executor = self.parms.get( 'executor', 'inline' )
+        self.poller = CeleryResultPoller( float( self.parms.get( 'result_poll_interval', 0.1 ) ), int( self.parms.get( 'result_poll_max_errors', 10 ) ) )
+        self._completion = threading.Condition( threading.RLock() )
+
+    def createWorkflow( self, tasks: List[WorkflowTask], request: Dict = None ) -> WorkflowBase:
         from stratus.handlers.celery.workflow import CeleryWorkflow
-        return CeleryWorkflow( nodes=tasks, **self.parms )
+        return CeleryWorkflow( nodes=tasks, poller=self.poller, on_ready=self.processCompletions, **self.parms )
+
+    def handle_client_request(self, requestSpec: Dict, inputs: List[TaskResult] = None, **kwargs) -> TaskHandle:
+        with self._completion:
+            self.requestQueue.put( requestSpec )
+            self.ingestRequests()
+            self.processCompletions()
+        if self.executor == "inline":
+            self.waitForCompletion( requestSpec["rid"] )
+            return self.getResult( requestSpec["rid"] )
+        return CeleryRequestHandle( self, rid=requestSpec["rid"], cid=requestSpec.get("cid") )
+
+    def processCompletions(self):
+        with self._completion:
+            self.update_workflows()
+            self._completion.notify_all()
+
+    def waitForCompletion( self, rid: str, timeout: float = None ) -> bool:
+        """ Waits on the completion condition, notified whenever workflows are updated: by the result poller, or here for the
+            inline executor, whose workflows complete synchronously when updated """
+        with self._completion:
+            if rid not in self.completed_workflows: self.processCompletions()
+            return self._completion.wait_for( lambda: rid in self.completed_workflows, timeout )
+
+    def shutdown(self):
+        self.poller.shutdown()
+        StratusEmbeddedApp.shutdown( self )
 
     def processError(self, rid: str, ex: Exception): pass
 
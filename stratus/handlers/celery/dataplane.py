@@ -0,0 +1,78 @@
+""" Data plane for Celery task payloads: datasets larger than a threshold are written to a store shared by the workers
+    and passed through the broker and result backend as lightweight references, resolved lazily by the consuming task """
+import abc
+import xarray as xa
+from typing import Dict, List, Optional, Any, Union
+from stratus_endpoint.util.config import StratusLogger, UID
+from stratus_endpoint.handler.base import TaskResult
+from stratus.util.spool import ResultSpool
+MB = 1024 * 1024
+
+class DatasetRef:
+    """ Picklable reference to a dataset held in a data plane store """
+    __slots__ = ( "path", "nbytes" )
+
+    def __init__( self, path: str, nbytes: int ):
+        self.path = path
+        self.nbytes = nbytes
+
+    def open(self) -> xa.Dataset:
+        return xa.open_dataset( self.path )
+
+    def __repr__(self):
+        return f"DatasetRef[{self.path}:{self.nbytes}]"
+
+class DataPlane:
+    __metaclass__ = abc.ABCMeta
+
+    def __init__( self, **kwargs ):
+        self.logger = StratusLogger.getLogger()
+        self.threshold = float( kwargs.get( "threshold_mb", 64 ) ) * MB
+
+    @staticmethod
+    def create( spec: Optional[Dict[str,Any]] ) -> "DataPlane":
+        # Data plane types: 'inline' ( everything through the result backend ) | 'filesystem' ( shared directory )
+        spec = spec or {}
+        ptype = spec.get( "type", "inline" )
+        if ptype == "inline": return InlineDataPlane( **spec )
+        if ptype == "filesystem": return FilesystemDataPlane( **spec )
+        raise Exception( f"Unknown data plane type: {ptype}" )
+
+    def externalize( self, result: Optional[TaskResult] ) -> Optional[TaskResult]:
+        """ Returns a copy of result with the datasets above the size threshold replaced by references """
+        if result is None: return None
+        items = [ self.put( dataset ) if dataset.nbytes > self.threshold else dataset for dataset in result.data ]
+        return TaskResult( result.header, items )
+
+    @staticmethod
+    def resolve( result: Optional[TaskResult] ) -> Optional[TaskResult]:
+        """ Returns a copy of result with references replaced by ( lazily loaded ) datasets """
+        if result is None: return None
+        items: List[Union[xa.Dataset,DatasetRef]] = result.data
+        if not any( isinstance( item, DatasetRef ) for item in items ): return result
+        return TaskResult( result.header, [ item.open() if isinstance( item, DatasetRef ) else item for item in items ] )
+
+    @abc.abstractmethod
+    def put( self, dataset: xa.Dataset ) -> DatasetRef: pass
+
+class InlineDataPlane(DataPlane):
+
+    def __init__( self, **kwargs ):
+        DataPlane.__init__( self, **kwargs )
+        self.threshold = float( "inf" )
+
+    def put( self, dataset: xa.Dataset ) -> DatasetRef:
+        raise Exception( "The inline data plane does not store datasets" )
+
+class FilesystemDataPlane(DataPlane):
+    """ Stores datasets as NetCDF files in a directory visible to all workers ( local disk for single host deployments,
+        a shared filesystem otherwise ); files are purged after 'max_age' seconds. """
+
+    def __init__( self, **kwargs ):
+        DataPlane.__init__( self, **kwargs )
+        self.spool = ResultSpool( kwargs.get( "directory", "~/.stratus/dataplane" ), float( kwargs.get( "max_age", 3600 ) ), prefix="dataplane" )
+
+    def put( self, dataset: xa.Dataset ) -> DatasetRef:
+        path = self.spool.write( UID.randomId( 12 ), lambda temp_path: dataset.to_netcdf( temp_path, mode="w", format='NETCDF4' ) )
+        self.logger.info( f"DataPlane: stored dataset ( {dataset.nbytes/MB:.1f} MB ) at {path}" )
+        return DatasetRef( path, dataset.nbytes )
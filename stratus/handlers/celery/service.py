@@ -7,19 +7,178 @@ from stratus.app.base import StratusAppBase
 from .app import StratusAppCelery
 from stratus_endpoint.util.config import StratusLogger, UID
 from stratus.util.parsing import str2bool
-import subprocess, os
+import subprocess, os, socket, time, threading, collections, atexit, json
 from threading import Thread
 
-class TaskManager(Thread):
+class WorkerStats:
+    """ Load on one worker node, accumulated from celery task events """
+    __slots__ = ( "received", "active", "latency", "last_busy", "warmup" )
+    alpha = 0.3
 
-    def __init__(self, name: str ):
-        Thread.__init__(self)
-        self._name = name
-        self.id = self._name
-        self._completedProcess = None
+    def __init__(self):
+        self.received: Dict[str,float] = {}     # task uuid -> time received by the worker
+        self.active = 0
+        self.latency = 0.0                      # Exponentially weighted time tasks wait on the worker before starting
+        self.last_busy = time.time()
+        self.warmup = 0.0                       # Handler initialization time reported by the worker's processes
+
+    def onReceived( self, uuid: str, timestamp: float ):
+        self.received[uuid] = timestamp
+        self.last_busy = time.time()
+
+    def onStarted( self, uuid: str, timestamp: float ):
+        received = self.received.pop( uuid, None )
+        if received is not None: self.latency = self.alpha * ( timestamp - received ) + ( 1 - self.alpha ) * self.latency
+        self.active += 1
+        self.last_busy = time.time()
+
+    def onFinished( self, uuid: str ):
+        self.received.pop( uuid, None )
+        self.active = max( self.active - 1, 0 )
+        self.last_busy = time.time()
+
+class EventMonitor(Thread):
+    """ Consumes celery task events ( workers are started with -E ) and maintains per-worker load statistics """
+
+    def __init__( self ):
+        Thread.__init__( self, daemon=True, name="CeleryEventMonitor" )
+        self.logger = StratusLogger.getLogger()
+        self.stats: Dict[str,WorkerStats] = collections.defaultdict( WorkerStats )
+        self._active = True
+        self._receiver = None
+
+    def run(self):
+        from .app import app
+        handlers = { "task-received":  lambda event: self.stats[event["hostname"]].onReceived( event["uuid"], event["timestamp"] ),
+                     "task-started":   lambda event: self.stats[event["hostname"]].onStarted( event["uuid"], event["timestamp"] ),
+                     "task-succeeded": lambda event: self.stats[event["hostname"]].onFinished( event["uuid"] ),
+                     "task-failed":    lambda event: self.stats[event["hostname"]].onFinished( event["uuid"] ),
+                     "task-revoked":   lambda event: self.stats[event["hostname"]].onFinished( event["uuid"] ),
+                     "worker-warmup":  self.onWarmup }
+        while self._active:
+            try:
+                with app.connection() as connection:
+                    self._receiver = app.events.Receiver( connection, handlers=handlers )
+                    self._receiver.capture( limit=None, timeout=None, wakeup=True )
+            except Exception as err:
+                self.logger.error( f"Celery event monitor error ( reconnecting ): {err}" )
+                time.sleep( 5.0 )
+
+    def onWarmup( self, event: Dict ):
+        self.stats[event["hostname"]].warmup = event["seconds"]
+        self.logger.info( f"Celery worker {event['hostname']} process {event.get('pid')} warmed up in {event['seconds']:.2f} s" )
+
+    def shutdown(self):
+        self._active = False
+        if self._receiver is not None: self._receiver.should_stop = True
+
+class WorkerPool:
+    """ Celery worker process consuming one service queue, restarted if it exits unexpectedly, with its pool
+        concurrency scaled between min_concurrency and max_concurrency according to the queue depth and task latency """
+
+    def __init__( self, name: str, spec: Dict[str,str] = None, min_concurrency: int = 1, max_concurrency: int = 4, max_latency: float = 2.0, scale_down_delay: float = 60.0 ):
+        self.logger = StratusLogger.getLogger()
+        self.name = name
+        self.spec = spec or {}
+        self.node = f"{name}@{socket.gethostname()}"
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max( max_concurrency, min_concurrency )
+        self.max_latency = max_latency
+        self.scale_down_delay = scale_down_delay
+        self.concurrency = min_concurrency
+        self.restarts = 0
+        self._process: subprocess.Popen = None
+        self._active = False
+
+    def start(self):
+        self._active = True
+        self.concurrency = self.min_concurrency
+        # Worker processes preload the service's handler from STRATUS_WORKER_SPEC ( see app.preloadHandlers )
+        env = dict( os.environ, STRATUS_WORKER_SPEC=json.dumps( self.spec, default=str ), STRATUS_WORKER_NODE=self.node )
+        self._process = subprocess.Popen( [ 'celery', '--app=stratus.handlers.celery.app:app', 'worker', '-l', 'info', '-Q', self.name, '-n', f"{self.name}@%h", '-E',
+                                            f'--concurrency={self.concurrency}' ], env=env )
+        self.logger.info( f"Started celery worker {self.node} ( pid {self._process.pid}, concurrency {self.concurrency} )" )
+
+    def check(self) -> bool:
+        # Restarts the worker if it has exited while the pool is active, returns True if it was restarted
+        if self._active and ( self._process is not None ) and ( self._process.poll() is not None ):
+            self.restarts += 1
+            self.logger.error( f"Celery worker {self.node} exited with code {self._process.returncode}, restarting ( restart #{self.restarts} )" )
+            self.start()
+            return True
+        return False
+
+    def queueDepth(self) -> int:
+        from .app import app
+        with app.connection_or_acquire() as connection:
+            return connection.default_channel.queue_declare( queue=self.name, passive=True ).message_count
+
+    def autoscale( self, stats: WorkerStats ):
+        # Target concurrency covers the executing and queued tasks; grows while tasks wait too long to start, shrinks only after an idle delay
+        try: depth = self.queueDepth()
+        except Exception as err:
+            self.logger.debug( f"Can't get depth of queue {self.name}: {err}" )
+            depth = 0
+        waiting = len( stats.received ) + depth
+        target = stats.active + waiting
+        # The latency average only changes when tasks start, so it only justifies growth while tasks are waiting
+        if ( waiting > 0 ) and ( stats.latency > self.max_latency ) and ( target <= self.concurrency ): target = self.concurrency + 1
+        target = min( max( target, self.min_concurrency ), self.max_concurrency )
+        if ( target < self.concurrency ) and ( time.time() - stats.last_busy < self.scale_down_delay ): return
+        self.resize( target )
+
+    def resize( self, target: int ):
+        from .app import app
+        if target == self.concurrency: return
+        if target > self.concurrency: app.control.pool_grow( target - self.concurrency, destination=[ self.node ] )
+        else:                         app.control.pool_shrink( self.concurrency - target, destination=[ self.node ] )
+        self.logger.info( f"Resized celery worker {self.node}: concurrency {self.concurrency} -> {target}" )
+        self.concurrency = target
+
+    def drain( self, timeout: float = 60.0 ):
+        # Stops consuming new tasks, then warm-shuts the worker, which lets executing tasks finish
+        from .app import app
+        self._active = False
+        if ( self._process is None ) or ( self._process.poll() is not None ): return
+        try: app.control.cancel_consumer( self.name, destination=[ self.node ] )
+        except Exception as err: self.logger.error( f"Error cancelling consumer for {self.node}: {err}" )
+        self._process.terminate()
+        try: self._process.wait( timeout )
+        except subprocess.TimeoutExpired:
+            self.logger.error( f"Celery worker {self.node} did not drain within {timeout} s, killing it" )
+            self._process.kill()
+
+class PoolManager(Thread):
+    """ Supervises the worker pools: restarts crashed workers and autoscales pools every 'scale_interval' seconds """
+
+    def __init__( self, scale_interval: float = 5.0 ):
+        Thread.__init__( self, daemon=True, name="CeleryPoolManager" )
+        self.logger = StratusLogger.getLogger()
+        self.pools: Dict[str,WorkerPool] = {}
+        self.monitor = EventMonitor()
+        self.scale_interval = scale_interval
+        self._shutdown = threading.Event()
+
+    def add( self, pool: WorkerPool ):
+        self.pools[ pool.name ] = pool
+        pool.start()
+        if not self.is_alive():
+            self.monitor.start()
+            self.start()
 
     def run(self):
-        self._completedProcess = subprocess.run(['celery', '--app=stratus.handlers.celery.app:app', 'worker', '-l', 'info',  '-Q', self._name,  '-n', self.id, '-E' ], check = True )
+        while not self._shutdown.wait( self.scale_interval ):
+            for pool in list( self.pools.values() ):
+                try:
+                    if pool.check(): self.monitor.stats.pop( pool.node, None )     # Tasks in flight on the exited worker are gone
+                    pool.autoscale( self.monitor.stats[ pool.node ] )
+                except Exception as err:
+                    self.logger.error( f"Error managing celery worker pool {pool.name}: {err}" )
+
+    def shutdown( self, timeout: float = 60.0 ):
+        self._shutdown.set()
+        self.monitor.shutdown()
+        for pool in self.pools.values(): pool.drain( timeout )
 
 class FlowerManager(Thread):
 
@@ -38,7 +197,7 @@ class ServiceHandler( Handler ):
 
     def __init__(self, **kwargs ):
         htype = os.path.basename(os.path.dirname(__file__))
-        self._workers: Dict[str,TaskManager] = {}
+        self._pools: PoolManager = None
         self._flower = None
         self.baseDir = os.path.dirname(__file__)
         super(ServiceHandler, self).__init__( htype, **kwargs )
@@ -66,16 +225,23 @@ class ServiceHandler( Handler ):
         return self._app
 
     def buildWorker( self, name: str, spec: Dict[str,str] ):
-        if name not in self._workers:
-            self._startWorker( name )
+        # Pool sizing parms can be set per service in its spec, defaulting to the celery handler's parms
+        if self._pools is None:
+            self._pools = PoolManager( float( self.parm( 'scale_interval', "5.0" ) ) )
+            atexit.register( self.shutdown )
+        if name not in self._pools.pools:
+            pool_parm = lambda key, default: spec.get( key, self.parm( key, default ) )
+            pool = WorkerPool( name, spec, int( pool_parm( 'min_concurrency', "1" ) ), int( pool_parm( 'max_concurrency', "4" ) ),
+                               float( pool_parm( 'max_latency', "2.0" ) ), float( pool_parm( 'scale_down_delay', "60.0" ) ) )
+            try:
+                self._pools.add( pool )
+            except OSError as err:
+                self.logger.error( f"Error starting celery worker for {name}: {err}")
 
-    def _startWorker(self, name: str ):
-        taskManager = TaskManager( name )
-        self._workers[ name ] = taskManager
-        try:
-            taskManager.start()
-        except subprocess.CalledProcessError as err:
-            self.logger.error( f" Worker exited with error: {err.stderr}")
+    def shutdown(self):
+        if self._pools is not None:
+            self._pools.shutdown( float( self.parm( 'drain_timeout', "60.0" ) ) )
+            self._pools = None
 
     def _startFlower(self):
         if self._flower is None:
@@ -3,10 +3,13 @@ from stratus.app.operations import WorkflowBase, WorkflowTask
 from stratus.app.graph import DGNode, DependencyGraph, graphop, Connection
 from celery.result import AsyncResult
 from stratus_endpoint.util.config import StratusLogger, UID
-from celery import group, states
+from celery import group, chain, states
+from celery.utils import uuid
 from stratus.app.client import StratusClient
-from typing import Dict, List, Optional
-import queue, datetime, time, traceback
+from stratus.handlers.celery.dataplane import DataPlane
+from typing import Dict, List, Optional, Any, Callable, Tuple
+import queue, datetime, time, traceback, threading, collections, functools
+from threading import Thread
 from celery.utils.log import get_task_logger
 from celery import Task
 logger = get_task_logger(__name__)
@@ -24,10 +27,10 @@ class CeleryAsyncTaskHandle(TaskHandle):
         block = kwargs.get("block",False)
         try:
             if block:
-                return self.manager.get( timeout )
+                return DataPlane.resolve( self.manager.get( timeout ) )
             if self.manager.ready():
                 if self.manager.successful():
-                    return self.manager.result
+                    return DataPlane.resolve( self.manager.result )
                 elif self.manager.failed():
                     self._exception = self.manager.result
                     return None
@@ -67,73 +70,183 @@ class CelerySyncTaskHandle(TaskHandle):
         return self._exception
 
 
+class CeleryResultPoller(Thread):
+    """ Background thread that watches the results of dispatched workflows in batches, calling each watcher's callback
+        once its result is ready, so that neither the app loop nor request threads poll the result backend.  A result
+        that can't be checked ( e.g. the backend is unreachable ) stays pending and is retried; after max_errors
+        consecutive errors its watcher's on_error callback is called instead. """
+
+    def __init__( self, poll_interval: float = 0.1, max_errors: int = 10 ):
+        Thread.__init__( self, daemon=True, name="CeleryResultPoller" )
+        self.logger = StratusLogger.getLogger()
+        self.poll_interval = poll_interval
+        self.max_errors = max_errors
+        self._pending: Dict[str,Tuple[AsyncResult,Callable[[],None],Optional[Callable[[Exception],None]]]] = {}
+        self._errors = collections.Counter()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._active = True
+        self._launched = False
+
+    def watch( self, result: AsyncResult, callback: Callable[[],None], on_error: Callable[[Exception],None] = None ):
+        with self._lock:
+            self._pending[result.id] = ( result, callback, on_error )
+            if not self._launched:
+                self._launched = True
+                self.start()
+        self._wakeup.set()
+
+    def run(self):
+        while self._active:
+            with self._lock: pending = list( self._pending.items() )
+            if len( pending ) == 0:
+                self._wakeup.wait()
+            else:
+                for id, ( result, callback, on_error ) in pending:
+                    try:
+                        ready = result.ready() or result.state == states.REJECTED
+                        self._errors.pop( id, None )
+                    except Exception as err:
+                        self._errors[id] += 1
+                        self.logger.error( f"CeleryResultPoller: error checking result {id} ( {self._errors[id]}/{self.max_errors} ): {err}" )
+                        if ( on_error is None ) or ( self._errors[id] < self.max_errors ): continue
+                        ready, callback = True, functools.partial( on_error, err )
+                    if not ready: continue
+                    with self._lock: self._pending.pop( id, None )
+                    self._errors.pop( id, None )
+                    try: callback()
+                    except Exception as err:
+                        self.logger.error( f"CeleryResultPoller: error in callback for result {id}: {err}" )
+                        self.logger.error( traceback.format_exc() )
+                self._wakeup.wait( self.poll_interval )
+            self._wakeup.clear()
+
+    def shutdown(self):
+        self._active = False
+        self._wakeup.set()
+
 class CeleryWorkflow(WorkflowBase):
 
     def __init__( self, **kwargs ):
         WorkflowBase.__init__(self, **kwargs)
-        self.taskSigs: Dict = {}
-        self.celery_workflow_sig = None
+        self.celery_workflow_steps: List = None
+        self.node_ids: Dict[str,str] = {}
         self.celery_result: AsyncResult = None
         self.task_result: TaskResult = None
         self.executor = kwargs.get('executor','inline')
+        self.poller: Optional[CeleryResultPoller] = kwargs.get( 'poller', None )
+        self.on_ready: Optional[Callable[[],None]] = kwargs.get( 'on_ready', None )
+        self._ready = False
+        # Data plane parms: 'dataplane' ( inline | filesystem ), 'dataplane.threshold_mb', 'dataplane.directory', 'dataplane.max_age'
+        self.dataplane: Dict[str,Any] = dict( type=kwargs.get( 'dataplane', 'inline' ), **{ key.split(".",1)[1]: value for key, value in kwargs.items() if key.startswith("dataplane.") } )
         self.rid: str = None
         self.logger.info( f"Starting Celery Workflow with parms: {kwargs}" )
 
-    def getConnectedTaskSig( self, wtask: WorkflowTask ):
-        from stratus.handlers.celery.app import celery_execute
-        if wtask.id not in self.taskSigs:
-            core_task_sig = celery_execute.signature( (wtask.clientSpec, wtask.requestSpec), queue=wtask.name )
-            dep_sigs = [ self.getConnectedTaskSig(deptask) for deptask in wtask.dependencies ]
-            if len(dep_sigs) == 0:
-                self.taskSigs[wtask.id] =                       core_task_sig
-            elif len( dep_sigs ) == 1:
-                self.taskSigs[wtask.id] = (    dep_sigs[0]    | core_task_sig )
-            else:
-                self.taskSigs[wtask.id] = ( group( dep_sigs ) | core_task_sig )
-        return self.taskSigs[wtask.id]
-
-    def connect(self):
-        if self.celery_workflow_sig is None:
-            WorkflowBase.connect(self)
-            for wtask in self.tasks:
-                out_edges = self.graph.out_edges(wtask.id)
-                connections = [Connection(self.graph.get_edge_data(*edge_tup)["id"], edge_tup[0], edge_tup[1]) for edge_tup in out_edges]
-                nids = [conn.nid(Connection.OUTGOING) for conn in connections]
-                consumer_tasks: List[WorkflowTask] = [self.nodes.get(nid) for nid in nids if nid is not None]
-                wtask.setConsumers(consumer_tasks)
-            for wtask in self.tasks:
-                self.celery_workflow_sig = self.getConnectedTaskSig( wtask )
-
+    def levels(self) -> List[List[WorkflowTask]]:
+        # Groups the tasks by depth in the DAG: every task's dependencies are in earlier levels
+        depth: Dict[str,int] = {}
+        for tid in self.graph.topological_order():
+            depth[tid] = 1 + max( [ depth[dep.id] for dep in self.nodes[tid].dependencies ], default=-1 )
+        levels: List[List[WorkflowTask]] = [ [] for i in range( max( depth.values(), default=-1 ) + 1 ) ]
+        for tid, level in depth.items(): levels[level].append( self.nodes[tid] )
+        return levels
+
+    def compile(self) -> List:
+        """ Compiles the workflow into a chain of chords, one per level, so that each task is executed exactly once.
+            Node task ids are assigned up front and each node is passed the ids of its dependencies, whose results it reads
+            from the result backend, so no node receives the results of tasks it doesn't consume; the chain ends by
+            selecting the output result. """
+        from stratus.handlers.celery.app import celery_execute_node, level_completed, select_output
+        output_task: WorkflowTask = self.nodes[ self.getOutputNode() ]
+        levels = self.levels()
+        self.node_ids = { wtask.id: uuid() for wtasks in levels for wtask in wtasks }
+        steps = []
+        for index, level in enumerate( levels ):
+            node_sigs = [ celery_execute_node.si( wtask.id, { dep.id: self.node_ids[dep.id] for dep in wtask.dependencies }, wtask.clientSpec, wtask.requestSpec,
+                                                  dataplane=self.dataplane ).set( queue=wtask.name, task_id=self.node_ids[wtask.id] ) for wtask in level ]
+            steps.append( group( node_sigs ) )
+            if index < len( levels ) - 1: steps.append( level_completed.si().set( queue=levels[index+1][0].name ) )
+        steps.append( select_output.si( self.node_ids[output_task.id] ).set( queue=output_task.name ) )
+        self.logger.info( f"Compiled Celery Workflow: {len(self.tasks)} tasks in {len(levels)} levels" )
+        return steps
+
+    def applyInline( self ) -> Optional[TaskResult]:
+        # Eager execution in this process, level by level, passing results by value and retaining only those consumed later
+        from stratus.handlers.celery.app import celery_execute_node
+        output_id = self.getOutputNode()
+        levels = self.levels()
+        results: Dict[str,TaskResult] = {}
+        for index, level in enumerate( levels ):
+            for wtask in level:
+                inputs = { dep.id: results[dep.id] for dep in wtask.dependencies }
+                results[wtask.id] = celery_execute_node.apply( args=( wtask.id, inputs, wtask.clientSpec, wtask.requestSpec ), kwargs=dict( dataplane=self.dataplane ) ).get()
+            keep = { dep.id for wtasks in levels[index+1:] for wtask in wtasks for dep in wtask.dependencies } | { output_id }
+            results = { tid: result for tid, result in results.items() if tid in keep }
+        return results.get( output_id )
+
+    def forgetNodeResults(self):
+        # Node results are only read by downstream nodes, release them from the result backend once the workflow is done
+        for task_id in self.node_ids.values():
+            try: AsyncResult( task_id ).forget()
+            except Exception as err: self.logger.warning( f"Unable to release celery result {task_id}: {err}" )
 
     @graphop
     def update( self ) -> bool:
-        task_inputs = []
-
         if self.executor == "inline":
             if self.task_result == None:
                 self.logger.info( "Executing Celery Workflow")
-                self.task_result: TaskResult = self.celery_workflow_sig(task_inputs)
+                self.task_result: TaskResult = DataPlane.resolve( self.applyInline() )
                 self._status = Status.COMPLETED
                 return True
         else:
             if self.celery_result == None:
                 self.logger.info( f"Executing Celery Workflow")
-                self.celery_result = self.celery_workflow_sig.apply_async( args=[task_inputs] )
+                self.celery_workflow_steps = self.compile()
+                self.celery_result = chain( *self.celery_workflow_steps ).apply_async()
                 self.result = CeleryAsyncTaskHandle(self.celery_result)
                 self._status = Status.EXECUTING
-            else:
-                if self.celery_result.successful():
+                if self.poller is not None: self.poller.watch( self.celery_result, self.setReady, self.setFailed )
+            elif self._ready or ( self.poller is None ):
+                if self.exc is not None:
+                    self._status = Status.ERROR
+                    self.result = FailedTask( self.exc )
+                    self.logger.error( f"Workflow Errored out: {self.error_msg}" )
+                    return True
+                elif self.celery_result.successful():
                     self._status = Status.COMPLETED
+                    self.forgetNodeResults()
                     return True
                 elif self.celery_result.failed():
                     self._status = Status.ERROR
+                    self.forgetNodeResults()
                     exc = self.celery_result.result
-                    self.logger.error(traceback.format_exc())
-                    raise Exception("Workflow Errored out: " + (getattr(exc, 'message', repr(exc)) if exc is not None else "NULL"))
+                    self.logger.error( "Workflow Errored out: " + (getattr(exc, 'message', repr(exc)) if exc is not None else "NULL") )
+                    return True
+                elif self.celery_result.state in [ states.REVOKED, states.REJECTED ]:
+                    self._status = Status.CANCELED
+                    self.forgetNodeResults()
+                    self.logger.info( f"Workflow canceled: celery state {self.celery_result.state}" )
+                    return True
             return False
 
+    def polled(self) -> bool:
+        # The result poller signals completion through on_ready
+        return ( self.poller is None ) and not self.completed()
+
+    def setReady(self):
+        # Called from the result poller thread when the workflow's final result is available
+        self._ready = True
+        if self.on_ready is not None: self.on_ready()
+
+    def setFailed( self, err: Exception ):
+        # Called from the result poller thread when the workflow's result could not be read from the result backend
+        self.error_msg, self.exc = f"Unable to read the workflow result: {err}", err
+        self.setReady()
+
     def getResult(self) -> TaskHandle:
-        if self.celery_result is not None:
+        if self.exc is not None:
+            return self.result
+        elif self.celery_result is not None:
             return CeleryAsyncTaskHandle(self.celery_result)
         elif self.task_result is not None:
             return CelerySyncTaskHandle(self.task_result)
@@ -1,5 +1,5 @@
-import os, json
-from typing import List, Dict, Callable, Optional
+import os, json, re, threading
+from typing import List, Dict, Callable, Optional, Tuple, Pattern
 from stratus.app.client import StratusClient
 from stratus_endpoint.util.config import StratusLogger
 from stratus.app.base import StratusFactory, StratusCoreBase
@@ -8,9 +8,43 @@ from stratus.app.operations import Op
 import traceback
 import importlib
 
+class EpaRouter:
+    """ Maps EPAs to the names of the services whose clients handle them.  Exact endpoint specs are looked up in
+        a hash table, wildcard specs are matched using a single compiled regex per service, and the results are
+        cached per EPA string.  A router is immutable once built: Handlers replaces it when its clients' endpoint specs change. """
+
+    def __init__(self):
+        self._order: Dict[str,int] = {}
+        self._exact: Dict[str, List[str]] = {}
+        self._patterns: List[Tuple[str,Pattern]] = []
+        self._cache: Dict[str, List[str]] = {}
+        self.generation = None
+
+    def build(self, clients: Dict[str, StratusClient], generation: int ):
+        self._order = { name: index for index, name in enumerate( clients.keys() ) }
+        self._exact, self._patterns, self._cache = {}, [], {}
+        for name, client in clients.items():
+            patterns = []
+            for spec in client.getEndpointSpecs():
+                if spec.isPattern:  patterns.append( spec.regex )
+                else:               self._exact.setdefault( str(spec), [] ).append( name )
+            if len( patterns ): self._patterns.append( ( name, re.compile( "|".join( f"(?:{pattern})" for pattern in patterns ) ) ) )
+        self.generation = generation
+
+    def route(self, epa: str ) -> List[str]:
+        names = self._cache.get( epa )
+        if names is None:
+            matches = set( self._exact.get( epa, [] ) )
+            for name, regex in self._patterns:
+                if ( name not in matches ) and regex.match( epa ): matches.add( name )
+            names = sorted( matches, key=lambda name: self._order[name] )
+            self._cache[epa] = names
+        return names
+
 class Handlers:
     HERE = os.path.dirname( __file__ )
     STRATUS_ROOT = os.path.dirname( os.path.dirname( HERE ) )
+    _constructor_cache: Dict[str, Callable[[], StratusFactory]] = None     # Discovered once per process
 
     def __init__(self, core: Optional[StratusCoreBase], settings: Dict[str,Dict], **kwargs ):
         self.logger = StratusLogger.getLogger()
@@ -21,6 +55,9 @@ class Handlers:
         self._parms = kwargs
         self._constructors: Dict[str, Callable[[], StratusFactory]] = {}
         self.configSpec: Dict[str,Dict] = settings
+        self._router = EpaRouter()
+        self._router_lock = threading.Lock()
+        self._generation = 0            # Incremented when the endpoint specs of any of this instance's clients change
         self._init()
 
     @property
@@ -67,16 +104,34 @@ class Handlers:
         assert self.configSpec is not None, "Error, the handlers have not yet been initialized"
         clients = []
         self.logger.debug( f"GET CLIENTS, handlers: {[str(h) for h in self._handlers.values()]}")
-        for service in self._handlers.values():
-            if op == None:
+        if op is None:
+            for service in self._handlers.values():
                 clients.append( service.client( core, internal_clients=self.internal_clients, **kwargs ) )
-            else:
-                cid = op.get( "cid",  None )
-                for epa in op.epas:
-                    if service.client( core, cid=cid, internal_clients=self.internal_clients, **kwargs ).handles( epa, **kwargs ):
-                        clients.append( service.getClient(cid) )
+        else:
+            cid = op.get( "cid",  None )
+            router = self.getRouter( core, **kwargs )
+            for epa in op.epas:
+                for service_name in router.route( epa ):
+                    clients.append( self._handlers[service_name].client( core, cid=cid, internal_clients=self.internal_clients, **kwargs ) )
         return clients
 
+    def _endpointsChanged(self):
+        self._generation += 1
+
+    def getRouter( self, core: StratusCoreBase, **kwargs ) -> EpaRouter:
+        router = self._router
+        if router.generation != self._generation:
+            with self._router_lock:
+                router = self._router
+                if router.generation != self._generation:
+                    generation = self._generation
+                    service_clients = { name: service.client( core, internal_clients=self.internal_clients, **kwargs ) for name, service in self._handlers.items() }
+                    for client in service_clients.values(): client.addEndpointListener( self._endpointsChanged )
+                    router = EpaRouter()
+                    router.build( service_clients, generation )
+                    self._router = router
+        return router
+
     def getEpas(self, core: StratusCoreBase, **kwargs) -> List[str]:
         epas = []
         for service in self._handlers.values():
@@ -143,6 +198,13 @@ class Handlers:
         return packages
 
     def _addConstructors(self):
+        if Handlers._constructor_cache is None:
+            self._discoverConstructors()
+            Handlers._constructor_cache = dict( self._constructors )
+        else:
+            self._constructors = dict( Handlers._constructor_cache )
+
+    def _discoverConstructors(self):
         packageList = self._listPackages()
         self.logger.info( f"Adding constructors for packages {packageList}")
         for package_name in packageList:
@@ -1,11 +1,81 @@
-from flask import request, Blueprint, make_response
+from flask import request, Blueprint, Response
 from stratus_endpoint.handler.base import TaskHandle, TaskResult
-import pickle
 from typing import *
+import time, threading
 from stratus.handlers.rest.app import RestAPIBase
+from stratus.app.base import StratusAppBase
+from stratus.util.encoding import ResultStream
 
 class RestAPI(RestAPIBase):
     debug = True
+    max_poll_timeout = 60.0
+    chunk_size = 1024 * 1024
+
+    def __init__(self, name: str, app: StratusAppBase, **kwargs):
+        RestAPIBase.__init__( self, name, app, **kwargs )
+        self.result_streams: Dict[str,Tuple[ResultStream,float]] = {}     # Encoded results ( with last access time ), retained until fully delivered so downloads can resume
+        self.stream_ttl = float( kwargs.get( "stream_ttl", 600 ) )        # Streams idle for longer are dropped ( and re-encoded from the result store if requested again )
+        self._stream_readers: Dict[str,int] = {}                            # Number of downloads in progress per rid
+        self._delivered: Set[str] = set()                                   # Rids whose final byte has been sent, cleared by the last reader
+        self._streams_lock = threading.Lock()
+
+    def getResultStream(self, rid: str ) -> Optional[ResultStream]:
+        self.expireResultStreams()
+        with self._streams_lock:
+            entry = self.result_streams.get( rid )
+            if entry is not None:
+                self.result_streams[rid] = ( entry[0], time.time() )
+                return entry[0]
+        task:  Optional[TaskHandle] = self.app.getResult( rid )
+        result: Optional[TaskResult] = task.getResult() if task is not None else None
+        if result is None: return None
+        datasets = []
+        while not result.empty(): datasets.append( result.popDataset() )
+        with self._streams_lock:
+            return self.result_streams.setdefault( rid, ( ResultStream( result.header, datasets ), time.time() ) )[0]
+
+    def expireResultStreams(self):
+        expiry = time.time() - self.stream_ttl
+        with self._streams_lock:
+            expired = [ rid for rid, ( stream, accessed ) in self.result_streams.items() if accessed < expiry ]
+            for rid in expired: del self.result_streams[rid]
+        if len( expired ): self.logger.info( f"Dropped idle result streams: {expired}" )
+
+    def releaseResultStream(self, rid: str, delivered: bool ) -> bool:
+        """ Ends a download of the rid's stream, returns True if the workflow should now be cleared: the stream has been
+            delivered to the end ( by this or a concurrent download ) and no other download is still reading it """
+        with self._streams_lock:
+            readers = self._stream_readers.pop( rid, 1 ) - 1
+            if readers > 0: self._stream_readers[rid] = readers
+            if delivered: self._delivered.add( rid )
+            if ( readers > 0 ) or ( rid not in self._delivered ): return False
+            self._delivered.discard( rid )
+            self.result_streams.pop( rid, None )
+            return True
+
+    def streamResult(self, rid: str, stream: ResultStream ) -> Response:
+        byte_range = request.range.range_for_length( stream.size ) if request.range is not None else None
+        if ( request.range is not None ) and ( byte_range is None ):
+            response = Response( status=416 )
+            response.headers.set( 'Content-Range', f'bytes */{stream.size}' )
+            return response
+        start, stop = byte_range if byte_range is not None else ( 0, stream.size )
+
+        def generate():
+            with self._streams_lock: self._stream_readers[rid] = self._stream_readers.get( rid, 0 ) + 1
+            delivered = False
+            try:
+                for chunk in stream.iterate( start, stop, self.chunk_size ): yield bytes( chunk )
+                delivered = ( stop == stream.size )
+            finally:
+                if self.releaseResultStream( rid, delivered ): self.app.clearWorkflow( rid )
+
+        response = Response( generate(), status=( 200 if byte_range is None else 206 ), mimetype='application/octet-stream' )
+        response.headers.set( 'Content-Format', 'stratus-result-stream' )
+        response.headers.set( 'Content-Length', str( stop - start ) )
+        response.headers.set( 'Accept-Ranges', 'bytes' )
+        if byte_range is not None: response.headers.set( 'Content-Range', f'bytes {start}-{stop-1}/{stream.size}' )
+        return response
 
     def _addRoutes(self, bp: Blueprint):
 
@@ -24,19 +94,30 @@ class RestAPI(RestAPIBase):
             if self.debug: self.logger.info( f"Status Map[{rid}]: {statusMap}" )
             return self.jsonResponse( statusMap )
 
+        @bp.route('/events', methods=('GET',))
+        def events():
+            since = int( self.getParameter( "since", 0, False ) )
+            timeout = min( float( self.getParameter( "timeout", 30.0, False ) ), self.max_poll_timeout )
+            rids = self.getParameter( "rid", None, False )
+            cursor, events, reset = self.app.statusJournal.since( since, None if rids is None else set( rids.split(",") ), timeout )
+            return self.jsonResponse( dict( cursor=cursor, events=events, reset=reset ) )
+
         @bp.route('/result', methods=('GET',))
         def result():
             rid = self.getParameter("rid")
-            task:  Optional[TaskHandle] = self.app.getResult( rid )
-            result: Optional[TaskResult] = task.getResult() if task is not None else None
-            if result is None:
-                return self.jsonResponse( dict( status="executing", rid=rid, tid=task.rid ) )
+            stream: Optional[ResultStream] = self.getResultStream( rid )
+            if stream is None:
+                task: Optional[TaskHandle] = self.app.getResult( rid )
+                if task is not None:                    return self.jsonResponse( dict( status="error", rid=rid, message=str( task.exception() ) ), code=500 )
+                if self.app.resultExpired( rid ):       return self.jsonResponse( dict( status="expired", rid=rid, message=f"Result expired: {rid}" ), code=404 )
+                if rid in self.app.registeredRequests:  return self.jsonResponse( dict( status="executing", rid=rid ) )
+                return self.jsonResponse( dict( status="error", rid=rid, message=f"Unknown request: {rid}" ), code=404 )
             else:
-                response = make_response( pickle.dumps( result ) )
-                response.headers.set('Content-Type', 'application/octet-stream')
-                response.headers.set('Content-Format', 'xarray-dataset' )
-                self.app.clearWorkflow( rid )
-                return response
+                return self.streamResult( rid, stream )
+
+        @bp.route('/stats', methods=('GET',))
+        def stats():
+            return self.jsonResponse( self.app.getStoreStats() )
 
         @bp.route('/capabilities', methods=('GET',))
         def capabilities():
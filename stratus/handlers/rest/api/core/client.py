@@ -1,11 +1,13 @@
 from stratus.app.client import StratusClient, stratusrequest
-from typing import Dict, Optional, List
-import traceback, time, requests
+from typing import Dict, Optional, List, Callable
+import traceback, time, requests, threading
 from stratus_endpoint.util.config import StratusLogger, UID
 from threading import Thread
 from stratus_endpoint.handler.base import TaskHandle, Status, TaskResult
 from stratus.app.core import StratusCore
-import os, pickle
+from stratus.util.http import getSession
+from stratus.util.encoding import ResultStreamDecoder
+import os
 from enum import Enum
 MB = 1024 * 1024
 
@@ -15,6 +17,7 @@ class MessageState(Enum):
     RESULT = 2
 
 class CoreRestClient(StratusClient):
+    pushes_status = True
 
     def __init__( self, **kwargs ):
         super(CoreRestClient, self).__init__( "rest", **kwargs )
@@ -29,16 +32,17 @@ class CoreRestClient(StratusClient):
 
     def init(self):
         if self.response_manager  is None:
-            self.response_manager = ResponseManager.getManger( self.cid, self.host_address )
-            self.response_manager.start()
+            self.response_manager = ResponseManager.getManger( self.cid, self.host_address, **self.parms )
+            self.response_manager.addStatusListener( self.notifyStatus )
+            if not self.response_manager.is_alive(): self.response_manager.start()
             super(CoreRestClient, self).init()
 
     @stratusrequest
     def request( self, requestSpec: Dict, inputs: List[TaskResult] = None, **kwargs ) -> TaskHandle:
         if "rid" not in requestSpec: requestSpec["rid"] = UID.randomId(6)
+        self.response_manager.addRequest( requestSpec["rid"] )
         response = self.response_manager.postMessage( "exe", requestSpec, **kwargs )
         self.log( "Got response: " + str(response) )
-        self.response_manager.addRequest( requestSpec["rid"] )
         return RestTask( requestSpec['rid'], self.cid, self.response_manager )
 
     def status(self, **kwargs ) -> Status:
@@ -84,23 +88,36 @@ class ResponseManager(Thread):
         self.setDaemon(True)
         self.poll_freq = kwargs.get( "poll_freq", 0.5 )
         self.timeout = kwargs.get("timeout", 60.0)
+        self.session: requests.Session = getSession( host_address, **kwargs )
+        self.event_timeout = kwargs.get( "event_timeout", 30.0 )
+        self.download_retries = int( kwargs.get( "download_retries", 3 ) )
+        self.push = True                                # Long-poll the server's status journal, falls back to polling /status on older servers
+        self.cursor = 0
         self.statusMap: Dict[str,Status] = {}
         self.active_requests = set()
+        self._listeners: List[Callable[[str],None]] = []
+        self._status_changed = threading.Condition()
 
     @classmethod
-    def getManger( cls, cid: str, host_address: str)  ->  "ResponseManager":
-        return cls.managers.setdefault(host_address, ResponseManager( cid, host_address ) )
+    def getManger( cls, cid: str, host_address: str, **kwargs )  ->  "ResponseManager":
+        manager = cls.managers.get( host_address )
+        if manager is None: manager = cls.managers.setdefault( host_address, ResponseManager( cid, host_address, **kwargs ) )
+        return manager
 
     def run(self):
         debug = False
         try:
             self.log("Run RM thread")
             while( self.active ):
-                if len( self.active_requests ) > 0:
+                if len( self.active_requests ) == 0:
+                    with self._status_changed: self._status_changed.wait( self.timeout )
+                elif self.push:
+                    self._getStatusEvents()
+                else:
                     statMap = self._getStatusMap()
-                    for key,value in statMap.items(): self.statusMap[key] = Status.decode( value )
+                    for key,value in statMap.items(): self.setStatus( key, Status.decode( value ) )
                     if debug: self.logger.info( "Server Job Status: " + str( statMap ) + ";  Client Job Status: " + str( self.statusMap ) )
-                time.sleep( self.poll_freq )
+                    time.sleep( self.poll_freq )
 
         except Exception as err:
             self.log( "ResponseManager error: " + str(err) )
@@ -108,25 +125,40 @@ class ResponseManager(Thread):
             self.statusMap.clear()
 
     def addRequest(self, rid: str ):
-        self.active_requests.add( rid )
+        with self._status_changed:
+            self.active_requests.add( rid )
+            self._status_changed.notify_all()
+
+    def addStatusListener(self, listener: Callable[[str],None] ):
+        if listener not in self._listeners:
+            self._listeners.append( listener )
+
+    def setStatus(self, rid: str, status: Status ):
+        with self._status_changed:
+            changed = self.statusMap.get( rid ) != status
+            self.statusMap[ rid ] = status
+            if changed: self._status_changed.notify_all()
+        if changed:
+            for listener in self._listeners: listener( rid )
 
     def updateStatus(self, message: Dict ) -> Dict:
         if "status" in message:
             rid = message.get("rid")
             if rid is not None:
                 status = Status.decode( message["status"] )
-                self.statusMap[ rid ] = status
+                self.setStatus( rid, status )
                 message["status"] = status
                 if self.debug or status == Status.ERROR:
                     self.logger.info( f"REST_CLIENT: Update Status Map[{rid}]: " + str( status ) )
         return message
 
     def getMessage(self, type: str, requestSpec: Dict, **kwargs ) -> Dict:
+        http_timeout = kwargs.pop( "http_timeout", None )
         request_params = dict(requestSpec)
         request_params.update(kwargs)
         address = f"{self.host_address}/{type}"
         if self.debug: self.log(f"REQUEST[{address}](status): {str(request_params)}")
-        response: requests.Response = requests.get( address, params=request_params )
+        response: requests.Response = self.session.get( address, params=request_params, timeout=http_timeout )
         if self.debug: self.log( f"RESPONSE[{response.encoding}]({response.url}): {str(response)}: {response.text}"  )
         return self.processResponse(response)
 
@@ -134,7 +166,7 @@ class ResponseManager(Thread):
         request_params = dict(requestSpec)
         request_params.update(kwargs)
         self.logger.info( f"POSTing request: {str(requestSpec)}")
-        response: requests.Response = requests.post( f"{self.host_address}/{type}", json=requestSpec )
+        response: requests.Response = self.session.post( f"{self.host_address}/{type}", json=requestSpec )
         self.log( f"RESPONSE[{response.encoding}]({response.url}): {str(response)}: {response.text}"  )
         return self.processResponse(response)
 
@@ -142,7 +174,7 @@ class ResponseManager(Thread):
         if( response.ok ):
             if self.debug: self.logger.info( f"PROCESS REPSONSE: headers = {str(response.headers)}")
             content_type = response.headers.get('Content-Type',None)
-            if content_type == "application/octet-stream":  result = { "type": "data", "header": response.headers, "content": pickle.loads( response.content ) }
+            if content_type == "application/octet-stream":  result = { "type": "error", "code": response.status_code, "message": f"Unsupported content format: {response.headers.get('Content-Format')}" }
             else:                                           result = { "type": "json",  "json": self.updateStatus( response.json() ) }
         else:                                               result = { "type": "error",  "code": response.status_code, "message": response.text }
         return result
@@ -153,21 +185,67 @@ class ResponseManager(Thread):
         rid = kwargs.get("rid")
         self.logger.info(f" ResponseManager:getResult: rid = {rid}, block = {block}, timeout = {timeout} ")
         if block: self.waitUntilReady( rid, timeout )
-        result = self.getMessage( "result", dict(rid=rid) )
+        result = self.downloadResult( rid )
         rtype = result["type"]
-        self.active_requests.remove(rid)
+        self.active_requests.discard(rid)
         if   rtype == "error":  raise Exception( result["message"] )
         elif rtype == "json":   return TaskResult( { "rid":rid, "cid":self.cid, **result["json"] } )
         elif rtype == "data":   return result.get("content",None)
         else:                   raise Exception( f"Unrecognized result type: {rtype}")
 
 
+    def downloadResult( self, rid: str ) -> Dict:
+        """ Streams the result, decoding it as it arrives; an interrupted transfer is resumed from the last byte received """
+        address = f"{self.host_address}/result"
+        decoder = ResultStreamDecoder()
+        retries = self.download_retries
+        while True:
+            headers = { "Range": f"bytes={decoder.received}-" } if decoder.received else {}
+            try:
+                with self.session.get( address, params=dict(rid=rid), headers=headers, stream=True ) as response:
+                    if ( response.status_code == 416 ) and ( retries > 0 ):                                     # Resume point no longer valid, start over
+                        retries -= 1
+                        decoder = ResultStreamDecoder()
+                        continue
+                    if not response.ok or response.headers.get('Content-Type') != "application/octet-stream":
+                        return self.processResponse( response )
+                    if decoder.received and ( response.status_code != 206 ): decoder = ResultStreamDecoder()     # Range not honored, start over
+                    for chunk in response.iter_content( chunk_size=MB ): decoder.feed( chunk )
+                if decoder.complete:
+                    header, datasets = decoder.result()
+                    return { "type": "data", "header": header, "content": TaskResult( header, datasets ) }
+                raise requests.exceptions.ChunkedEncodingError( f"Result stream for {rid} ended after {decoder.received} bytes" )
+            except ( requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError, requests.exceptions.Timeout ) as err:
+                retries -= 1
+                if retries < 0: raise err
+                self.log( f"Result download for {rid} interrupted after {decoder.received} bytes, resuming: {err}" )
+
     def _getStatusMap(self) -> Dict:
         result = self.getMessage( "status", {}, timeout=self.timeout  )
         rtype = result["type"]
         if rtype == "error":    raise Exception( result["message"] )
         else:                   return result["json"]
 
+    def _getStatusEvents(self):
+        result = self.getMessage( "events", dict( since=self.cursor, timeout=self.event_timeout ), http_timeout=self.event_timeout + self.timeout )
+        rtype = result["type"]
+        if rtype == "error":
+            if result["code"] == 404:
+                self.log( "Server does not support status events, reverting to status polling" )
+                self.push = False
+                return
+            raise Exception( result["message"] )
+        events = result["json"]
+        self.cursor = events["cursor"]
+        if events.get( "reset", False ):
+            self.log( "Status events missed ( journal overflow or server restart ), resynchronizing from /status" )
+            for rid, status in self._getStatusMap().items():
+                if rid in self.active_requests: self.setStatus( rid, Status.decode( status ) )
+            return
+        for event in events["events"]:
+            if event["rid"] in self.active_requests:
+                self.setStatus( event["rid"], Status.decode( event["status"] ) )
+
     def getStatus( self, rid ) -> Status:
         status = self.statusMap.get( rid, Status.UNKNOWN )
         if self.debug: self.logger.info( f"Status[{rid}]: {status}")
@@ -181,20 +259,15 @@ class ResponseManager(Thread):
         return result
 
     def waitUntilReady( self, rid: str, timeout: float = None ):
-        accum_time = 0.0
-        while not self.completed( rid ):
-            time.sleep(0.2)
-            if timeout is not None:
-                accum_time += 0.2
-                if( accum_time >= timeout ):
-                    return False
-        return True
+        with self._status_changed:
+            return self._status_changed.wait_for( lambda: self.completed( rid ), timeout )
 
     def log(self, msg: str ):
         self.logger.info( "[RM] " + msg )
 
     def term(self):
         self.active = False
+        with self._status_changed: self._status_changed.notify_all()
 
 class RestTask(TaskHandle):
 
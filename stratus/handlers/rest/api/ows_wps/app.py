@@ -141,7 +141,11 @@ class RestAPI(RestAPIBase):
         @bp.route('/file', methods=['GET'])
         def file_result():
             rid = self.getParameter("rid")
+            index = self.fileIndex( rid )
+            key = f"{rid}-{index}"
+            if self.app.spool.contains( key ): return self.fileResponse( self.app.spool.path( key ), rid, index )
             workflow = self.app.getWorkflow(rid)
+            if workflow is None: return self.getErrorResponse( f"Unknown request: {rid}" )
             if workflow.status() == Status.EXECUTING:
                 return self.jsonResponse( dict(status="executing", rid=rid) )
             else:
@@ -149,9 +153,8 @@ class RestAPI(RestAPIBase):
                 result: Optional[TaskResult] = task.getResult() if task is not None else None
                 self.logger.info(f"Got File Request for task rid={rid}, result = {str(result)}")
                 if result is None: return self.missingResult( task )
-                dataset: Optional[xa.Dataset] = result.popDataset()
-                if dataset is None:
-                    if result.getResultClass() == "METADATA":
+                if index >= result.size():
+                    if result.empty() and ( result.getResultClass() == "METADATA" ):
                         metadata = json.dumps(result.header)
                         self.logger.info(f"Sending metadata response: " + metadata )
                         response =  flask.Response( response=metadata, status=200, mimetype="application/json" )
@@ -160,17 +163,9 @@ class RestAPI(RestAPIBase):
                         return response
                     else:
                         return self.getErrorResponse( "No more results available")
-                path = f"/tmp/{rid}.nc"
-                self.logger.info(f"Saving temp file to {path}")
-                dataset.to_netcdf( path, mode="w", format='NETCDF4' )
-                with open(path, mode='rb') as ncfile:
-                    response = make_response( ncfile.read() )
-                    response.headers.set('Content-Type', 'application/octet-stream')
-                    response.headers.set('Content-Format', 'netcdf-file' )
-                    response.headers.set('Results-Remaining', str(result.size()) )
-                    if result.empty(): self.app.clearWorkflow( rid )
-                self.logger.info(f"Returning file response.")
-                return response
+                path = self.spoolResult( rid, index, result )
+                self.logger.info(f"Returning file response from {path}")
+                return self.fileResponse( path, rid, index )
 
         @bp.route('/data', methods=['GET'])
         def data_result():
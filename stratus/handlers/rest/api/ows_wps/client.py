@@ -4,6 +4,7 @@ import time, os, requests, json, pickle, xarray as xa
 from stratus_endpoint.util.config import StratusLogger
 from stratus_endpoint.handler.base import TaskHandle, Status, TaskResult
 from stratus.app.core import StratusCore
+from stratus.util.http import getSession, isIdempotent
 from xml.etree.ElementTree import Element
 import defusedxml.ElementTree as ET
 from owslib.wps import WebProcessingService, WPSExecution, monitorExecution
@@ -107,7 +108,7 @@ class OwsWpsClient(StratusClient):
         return OwsWpsTask( requestSpec['rid'], self.cid, response, cache=self.cache_dir )
 
     def execJsonRequest( self, requestURL, parms: Dict) -> Dict:
-        response: requests.Response = requests.get(requestURL, params=parms)
+        response: requests.Response = getSession( requestURL, isIdempotent(parms), **self.parms ).get(requestURL, params=parms)
         self.logger.info( f"SUBMIT JSON Request {requestURL} with parms: {parms}\n  Response: \n {response.text}" )
         if response.ok:
             return json.loads(response.text)
@@ -115,7 +116,7 @@ class OwsWpsClient(StratusClient):
             raise Exception(response.text)
 
     def execRequest(self, requestURL, parms: Dict) -> Element:
-        response: requests.Response = requests.get(requestURL, params=parms)
+        response: requests.Response = getSession( requestURL, isIdempotent(parms), **self.parms ).get(requestURL, params=parms)
         return ET.fromstring(response.text)
 
     def capabilities(self, type: str, **kwargs ) -> Dict:
@@ -131,31 +131,26 @@ class RestAPI(RestAPIBase):
         @bp.route('/file', methods=['GET'])
         def file_result():
             rid = self.getParameter("rid")
-            task: TaskHandle = self.app.getTask( rid )
-            assert task is not None, f"Can't find task for rid {rid}, current tasks: {self.app.getTaskIds()}"
-            result: Optional[TaskResult] = task.getResult()
-            self.logger.info(f"Got File Request for task rid={rid}, result = {str(result)}")
-            if task.status() == Status.EXECUTING:
-                return self.jsonResponse( dict(status="executing", rid=rid, tid=task.rid) )
+            index = self.fileIndex( rid )
+            key = f"{rid}-{index}"
+            if self.app.spool.contains( key ): return self.fileResponse( self.app.spool.path( key ), rid, index )
+            workflow = self.app.getWorkflow(rid)
+            if workflow is None: return self.getErrorResponse( f"Unknown request: {rid}" )
+            if workflow.status() == Status.EXECUTING:
+                return self.jsonResponse( dict(status="executing", rid=rid) )
             else:
+                task: Optional[TaskHandle] = workflow.getResult()
+                result: Optional[TaskResult] = task.getResult() if task is not None else None
+                self.logger.info(f"Got File Request for task rid={rid}, result = {str(result)}")
                 if result is None: return self.missingResult( task )
-                dataset: Optional[xa.Dataset] = result.popDataset()
-                if dataset is None:
-                    if result.getResultClass() == "METADATA":
+                if index >= result.size():
+                    if result.empty() and ( result.getResultClass() == "METADATA" ):
                         return flask.Response(response=json.dumps(result.header), status=200, mimetype="application/json")
                     else:
                         return self.getErrorResponse( "No more results available")
-                path = f"/tmp/{rid}.nc"
-                self.logger.info(f"Saving temp file to {path}")
-                dataset.to_netcdf( path, mode="w", format='NETCDF4' )
-                with open(path, mode='rb') as ncfile:
-                    response = make_response( ncfile.read() )
-                    response.headers.set('Content-Type', 'application/octet-stream')
-                    response.headers.set('Content-Format', 'netcdf-file' )
-                    response.headers.set('Results-Remaining', str(result.size()) )
-                    if result.empty(): self.removeTask( rid )
-                self.logger.info(f"Returning file response.")
-                return response
+                path = self.spoolResult( rid, index, result )
+                self.logger.info(f"Returning file response from {path}")
+                return self.fileResponse( path, rid, index )
 
         @bp.route('/data', methods=['GET'])
         def data_result():
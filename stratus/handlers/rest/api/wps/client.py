@@ -25,7 +25,7 @@ class WPSRestClient(StratusClient):
             port = self["port"]
             route = self.parm("route","wps")
             self.host_address = f"http://{host}:{port}/{route}"
-        self.wpsRequest = WPSExecuteRequest(self.host_address)
+        self.wpsRequest = WPSExecuteRequest( self.host_address, **self.parms )
 
     @stratusrequest
     def request( self, requestSpec: Dict, inputs: List[TaskResult] = None, **kwargs ) -> TaskHandle:
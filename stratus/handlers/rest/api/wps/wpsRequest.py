@@ -5,14 +5,16 @@ import xarray as xa
 from stratus_endpoint.util.config import Config, StratusLogger, UID
 from typing import List, Dict, Any, Sequence, BinaryIO, TextIO, ValuesView, Optional
 from stratus_endpoint.util.config import StratusLogger
+from stratus.util.http import getSession, isIdempotent
 
 def boolStr( bval ): return "true" if bval else "false"
 
 class WPSExecuteRequest:
 
-    def __init__( self, host_address ):
+    def __init__( self, host_address, **kwargs ):
         self.logger = StratusLogger.getLogger()
         self._host_address = host_address
+        self._parms = kwargs
         self.ns = {'wps': "http://www.opengis.net/wps/1.0.0", "ows": "http://www.opengis.net/ows/1.1"}
 
     def _getCapabilitiesStr( self, type ): return '%s?request=getCapabilities&service=WPS&identifier=%s' % ( self._host_address, type )
@@ -44,7 +46,7 @@ class WPSExecuteRequest:
     def exe( self, requestJson ) -> Dict:
         requestParms = self.getWpsParms( requestJson )
         self.logger.info( "\nExecuting Request: host = %s\n Params: %s\nResponse:\n" % ( self._host_address, str(requestParms) ) )
-        responseXML: requests.Response = requests.get( self._host_address, params=requestParms ).text
+        responseXML: requests.Response = self.session( self._host_address, False ).get( self._host_address, params=requestParms ).text
         refs = {}
         root =   ET.fromstring(responseXML)
         for eProcOut in root.findall("wps:ProcessOutputs",self.ns):
@@ -54,7 +56,7 @@ class WPSExecuteRequest:
         return { "xml": responseXML, "refs": refs }
 
     def getStatus(self, statusUrl: str ) -> Dict:
-        responseXML: str = requests.get(statusUrl).text
+        responseXML: str = self.session(statusUrl).get(statusUrl).text
         self.logger.info( "GetStatus Response XML: \n" + responseXML )
         root = ET.fromstring(responseXML)
         for eStat in root.findall("wps:Status", self.ns):
@@ -63,7 +65,7 @@ class WPSExecuteRequest:
                 return dict( status=elem.tag.split("}")[1], message=elem.text )
 
     def downloadFile( self, filePath: str, fileUrl: str ):
-        r = requests.get(fileUrl, allow_redirects=True)
+        r = self.session(fileUrl).get(fileUrl, allow_redirects=True)
         contentType = r.headers['Content-Type']
         if   contentType == 'application/octet-stream': open(filePath, 'wb').write(r.content)
         elif contentType == 'application/x-netcdf':     open(filePath, 'wb').write(r.content)
@@ -71,15 +73,18 @@ class WPSExecuteRequest:
         else:                                           self.logger.error("Got result with contentType: " + str(contentType))
 
     def downloadData( self, dataUrl: str ) -> xa.Dataset:
-        r = requests.get( dataUrl, allow_redirects=True )
+        r = self.session(dataUrl).get( dataUrl, allow_redirects=True )
         contentType = r.headers['Content-Type']
         if   contentType == 'application/octet-stream': return pickle.loads( r.content, encoding="bytes" )
         elif contentType == 'application/x-netcdf':     return pickle.loads(r.content, encoding="bytes")
         elif contentType == 'application/json':         self.logger.info( "Got result for data download: " + str(r.json()) )
         else:                                           self.logger.error("Got result with contentType: " + str(contentType))
 
+    def session( self, url: str, idempotent: bool = True ) -> requests.Session:
+        return getSession( url, idempotent, **self._parms )
+
     def execJsonRequest( self, requestURL, parms: Dict) -> Dict:
-        response: requests.Response = requests.get(requestURL, params=parms)
+        response: requests.Response = self.session( requestURL, isIdempotent(parms) ).get(requestURL, params=parms)
         self.logger.info( f"SUBMIT JSON Request {requestURL} with parms: {parms}\n  Response: \n {response.text}" )
         if response.ok:
             return json.loads(response.text)
@@ -87,7 +92,7 @@ class WPSExecuteRequest:
             raise Exception(response.text)
 
     def execRequest(self, requestURL, parms: Dict) -> Element:
-        response: requests.Response = requests.get(requestURL, params=parms)
+        response: requests.Response = self.session( requestURL, isIdempotent(parms) ).get(requestURL, params=parms)
         return ET.fromstring(response.text)
 
     def getCapabilities( self, type="processes" ) -> Dict:
@@ -1,6 +1,6 @@
 from typing import Dict
-import os, traceback, abc
-from flask import Flask, Response, Blueprint, request
+import os, traceback, abc, time
+from flask import Flask, Response, Blueprint, request, send_file
 import json, importlib
 from stratus_endpoint.util.config import StratusLogger
 from stratus.app.core import StratusCore
@@ -9,6 +9,7 @@ from flask_sqlalchemy import SQLAlchemy
 from stratus.app.base import StratusAppBase, StratusServerApp
 from jsonschema import validate
 from threading import Thread
+import threading
 HERE = os.path.dirname(os.path.abspath(__file__))
 API_DIR = os.path.join( HERE, "api" )
 
@@ -20,12 +21,18 @@ class RestAPIBase:
         self.parms = kwargs
         self.name =  name
         self.app: StratusAppBase = app
+        self._file_cursors: Dict[str,int] = {}         # rid -> index of the first dataset not yet delivered to a sequential /file reader
+        self._file_counts: Dict[str,int] = {}          # rid -> number of datasets in the result
+        self._file_accessed: Dict[str,float] = {}      # rid -> time of the last /file fetch
+        self.file_cursor_ttl = float( kwargs.get( "file_cursor_ttl", 3600 ) )     # Cursors of readers idle for longer are dropped
+        self._files_lock = threading.Lock()
 
     def getStatus( self, rid: str ) -> Dict[str,str]:
         if rid is None: return {}
         workflow = self.app.getWorkflow(rid)
         if workflow is None:
             if rid in self.app.registeredRequests:  return { "status": Status.str( Status.IDLE  ), "rid": rid }
+            elif self.app.resultExpired( rid ):     return { "status": Status.str( Status.ERROR ), "rid": rid, "message": "Result expired: " + rid }
             else:                                   return { "status": Status.str( Status.ERROR ), "rid": rid, "message": "Unknown request: " + rid }
         else:
             status = workflow.status()
@@ -82,6 +89,58 @@ class RestAPIBase:
         except Exception as err:
             return dict( status="error", message=f"Error parsing/validating request: '{requestSpec}'", error=str(err) )
 
+    def fileIndex( self, rid: str ) -> int:
+        """ Index of the dataset requested by a /file fetch: the 'index' parameter if given, else the first dataset not yet
+            delivered to a sequential reader, so a failed or resumed ( Range ) fetch returns the same dataset again """
+        self.expireFileCursors()
+        index = self.getParameter( "index", None, False )
+        with self._files_lock:
+            self._file_accessed[rid] = time.time()
+            return int( index ) if index is not None else self._file_cursors.get( rid, 0 )
+
+    def fileDelivered( self, rid: str, index: int ):
+        """ Advances the sequential reader past a dataset whose file has been sent in full; forgets the rid after its last dataset """
+        with self._files_lock:
+            cursor = max( self._file_cursors.get( rid, 0 ), index + 1 )
+            if cursor >= self._file_counts.get( rid, cursor + 1 ):
+                for files in ( self._file_cursors, self._file_counts, self._file_accessed ): files.pop( rid, None )
+            else:
+                self._file_cursors[rid] = cursor
+
+    def expireFileCursors(self):
+        expiry = time.time() - self.file_cursor_ttl
+        with self._files_lock:
+            for rid in [ rid for rid, accessed in self._file_accessed.items() if accessed < expiry ]:
+                for files in ( self._file_cursors, self._file_counts, self._file_accessed ): files.pop( rid, None )
+
+    def filesRemaining( self, rid: str, index: int ) -> int:
+        return max( self._file_counts.get( rid, 0 ) - index - 1, 0 )
+
+    def spoolResult( self, rid: str, index: int, result ) -> str:
+        """ Spools dataset 'index' of the result under its own key; the workflow is cleared once the last dataset is spooled """
+        dataset = result.data[index]
+        path = self.app.spool.write( f"{rid}-{index}", lambda path: dataset.to_netcdf( path, mode="w", format='NETCDF4' ) )
+        with self._files_lock: self._file_counts[rid] = result.size()
+        if index == result.size() - 1: self.app.clearWorkflow( rid )
+        return path
+
+    def fileResponse( self, path: str, rid: str, index: int ) -> Response:
+        """ Streams a spooled result file, with ETag and Range support; the reader's cursor advances once the end of the file has been sent """
+        response = send_file( path, mimetype='application/octet-stream', conditional=True )
+        response.headers.set('Content-Format', 'netcdf-file' )
+        response.headers.set('Results-Remaining', str( self.filesRemaining( rid, index ) ) )
+        content_range = response.content_range
+        if ( response.status_code == 200 ) or ( ( response.status_code == 206 ) and ( content_range.stop == content_range.length ) ):
+            response.response = self._deliver( response.response, rid, index )
+        return response
+
+    def _deliver( self, body, rid: str, index: int ):
+        try:
+            for chunk in body: yield chunk
+        finally:
+            if hasattr( body, "close" ): body.close()
+        self.fileDelivered( rid, index )
+
     def xmlResponse(self, type: str, message: Dict, code: int = 200 ) -> Response:
         return Response( response="" , status=code, mimetype="application/xml")
 
@@ -4,9 +4,10 @@ import json, os, sys
 from stratus_endpoint.util.config import StratusLogger
 from zmq.auth.thread import ThreadAuthenticator
 import zmq, traceback
-from typing import Dict
+from typing import Dict, List
 import queue, datetime
 from .responder import StratusZMQResponder, StratusResponse
+from . import protocol
 from stratus_endpoint.handler.base import Status
 MB = 1024 * 1024
 
@@ -61,12 +62,12 @@ class StratusApp(StratusServerApp):
     def setExeStatus( self, submissionId: str, status: Status ):
         self.responder.setExeStatus( submissionId, status )
 
-    def sendResponseMessage(self, msg: StratusResponse) -> str:
-        request_args = [ msg.id, msg.message ]
-        packaged_msg = "!".join( request_args )
+    def sendResponseMessage(self, msg: StratusResponse, envelope: List[bytes] ) -> List[bytes]:
+        """ Replies are routed back to the requesting client using the envelope ( identity frames + delimiter ) of its request """
+        packaged_msg = protocol.pack( msg.id, "response", msg.body )
         timeStamp =  datetime.datetime.now().strftime("MM/dd HH:mm:ss")
         self.logger.info( "@@STRATUS-APP: Sending response {} on request_socket @({}): {}".format( msg.id, timeStamp, str(msg) ) )
-        self.request_socket.send_string( packaged_msg )
+        self.request_socket.send_multipart( envelope + packaged_msg )
         return packaged_msg
 
     def initInteractions(self):
@@ -79,56 +80,68 @@ class StratusApp(StratusServerApp):
             self.auth.allow( self.client_address )
             self.auth.configure_curve( domain='*', location=zmq.auth.CURVE_ALLOW_ANY ) # self.public_keys_dir )  # Use 'location=zmq.auth.CURVE_ALLOW_ANY' for stonehouse security
 
-            self.request_socket: zmq.Socket = self.zmqContext.socket(zmq.REP)
-            self.responder = StratusZMQResponder( self.zmqContext, self.response_port, client_address = self.client_address, certificate_path=self.cert_dir )
+            self.request_socket: zmq.Socket = self.zmqContext.socket(zmq.ROUTER)
+            self.responder = StratusZMQResponder( self.zmqContext, self.response_port, client_address = self.client_address, certificate_path=self.cert_dir,
+                                                  chunk_size=self.parms.get( "chunk_size", 8 * MB ), send_hwm=self.parms.get( "send_hwm", 16 ),
+                                                  send_timeout=self.parms.get( "send_timeout", 60 ) )
+            self.responder.start()
             self.initSocket()
+            self.poller = zmq.Poller()
+            self.poller.register( self.request_socket, zmq.POLLIN )
+            self.poller.register( self.wakeup, zmq.POLLIN )
             self.logger.info(  "@@STRATUS-APP:Listening for requests on port: {}".format( self.request_port ) )
 
         except Exception as err:
             self.logger.error( "@@STRATUS-APP:  ------------------------------- StratusApp Init error: {} ------------------------------- ".format( err ) )
 
+    def waitForEvents(self, timeout: float ):
+        poller = getattr( self, "poller", None )
+        if poller is None: return StratusServerApp.waitForEvents( self, timeout )
+        poller.poll( int( timeout * 1000 ) )
+        self.wakeup.clear()
+
     def processResults(self):
         completed_workflows = self.responder.processWorkflows(self.getWorkflows())
         for rid in completed_workflows: self.clearWorkflow( rid )
 
     def processRequests(self):
         while self.request_socket.poll(0) != 0:
-            request_header = self.request_socket.recv_string().strip().strip("'")
-            parts = request_header.split("!")
-            submissionId = str(parts[0])
-            rType =  str(parts[1])
-            request: Dict = json.loads(parts[2]) if len(parts) > 2 else ""
+            try:
+                envelope, submissionId, rType, request = protocol.unpack( self.request_socket.recv_multipart() )
+            except protocol.ProtocolError as err:
+                self.logger.error( f"@@STRATUS-APP: Dropping malformed request: {err}" )
+                continue
             try:
                 self.logger.info( "@@STRATUS-APP:  ###  Processing {} request: {}".format( rType, request) )
                 if rType == "capabilities":
                     response = self.core.getCapabilities( request["type"] )
-                    self.sendResponseMessage(StratusResponse(submissionId, response))
+                    self.sendResponseMessage(StratusResponse(submissionId, response), envelope)
                 elif rType == "exe":
-                    if len(parts) <= 2: raise Exception( "Missing parameters to exe request")
+                    if not request: raise Exception( "Missing parameters to exe request")
                     request["rid"] = submissionId
                     self.logger.info( "Processing zmq Request: '{}' '{}' '{}'".format( submissionId, rType, str(request)) )
                     self.submitWorkflow(request)                                                                            #   TODO: Send results when tasks complete.
                     response = { "status": "Executing" }
-                    self.sendResponseMessage(StratusResponse(submissionId, response))
+                    self.sendResponseMessage(StratusResponse(submissionId, response), envelope)
                 elif rType == "quit" or rType == "shutdown":
                     response = {"status": "Terminating" }
-                    self.sendResponseMessage(StratusResponse(submissionId, response))
+                    self.sendResponseMessage(StratusResponse(submissionId, response), envelope)
                     self.logger.info("@@STRATUS-APP: Received Shutdown Message")
                     exit(0)
                 else:
                     msg = "@@STRATUS-APP: Unknown request type: " + rType
                     self.logger.info(msg)
                     response = { "status":"error", "error": msg }
-                    self.sendResponseMessage(StratusResponse(submissionId, response))
+                    self.sendResponseMessage(StratusResponse(submissionId, response), envelope)
             except Exception as ex:
-                self.processError( submissionId, ex )
+                self.processError( submissionId, ex, envelope )
 
-    def processError(self, rid: str, ex: Exception ):
+    def processError(self, rid: str, ex: Exception, envelope: List[bytes] ):
         tb = traceback.format_exc()
         self.logger.error("@@STRATUS-APP: Execution error: " + str(ex))
         self.logger.error(tb)
         response = {"status": "error", "error": str(ex), "traceback": tb}
-        self.sendResponseMessage( StratusResponse( rid, response ) )
+        self.sendResponseMessage( StratusResponse( rid, response ), envelope )
 
     def updateInteractions(self):
         self.processRequests()
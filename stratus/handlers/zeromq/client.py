@@ -2,11 +2,15 @@ from stratus.app.client import StratusClient, stratusrequest
 import zmq, zmq.auth, traceback, json
 from stratus_endpoint.util.config import StratusLogger, UID
 from threading import Thread
-from typing import Dict, Optional, List
+from typing import Dict, Optional, List, Callable
 from stratus.util.parsing import s2b, b2s
+from stratus.util.encoding import decodeDataset, loadHeader, DatasetAssembler
 from stratus_endpoint.handler.base import TaskHandle, Status, TaskResult, FailedTask
 from zmq.auth.thread import ThreadAuthenticator
-import os, pickle, queue
+from stratus.app.events import Wakeup
+from . import protocol
+import os, queue, threading
+from concurrent.futures import Future
 import xarray as xa
 from enum import Enum
 MB = 1024 * 1024
@@ -46,22 +50,26 @@ class MessageState(Enum):
     RESULT = 2
 
 class ZMQClient(StratusClient):
+    pushes_status = True
 
     def __init__( self, **kwargs ):
         super(ZMQClient, self).__init__( "zeromq", **kwargs )
         self.host_address = self.parm( "host", "127.0.0.1" )
         self.default_request_port = int( self.parm( "request_port", 4556 ) )
         self.response_port = int( self.parm( "response_port", 4557 ) )
+        timeout = self.parm( "request_timeout" )
+        self.request_timeout: Optional[float] = None if timeout is None else float( timeout )
         self.context = None
+        self.response_manager: ResponseManager = None
 
     def init(self, **kwargs):
         try:
             if self.context is None:
                 self.context = zmq.Context()
                 self.connector = ConnectionMode( **self.parms )
-                self.request_socket = self.context.socket(zmq.REQ)
-                self.request_port = self.connector.connectSocket(self.request_socket, self.host_address, self.default_request_port )
-                self.log("[1]Connected request socket to server {0} on port: {1}".format( self.host_address, self.request_port ) )
+                self.request_port = self.default_request_port
+                self.response_manager = ResponseManager( self.context, self.connector, self.host_address, self.request_port, self.response_port, self.cache_dir, listener=self.notifyStatus )
+                self.response_manager.start()
                 local_stack = str( [ str(sl) + "\n" for sl in traceback.format_stack() ] )
                 print( f"Initialized zmq client at:\n{local_stack}" )
                 super(ZMQClient, self).init()
@@ -74,14 +82,17 @@ class ZMQClient(StratusClient):
 
     @stratusrequest
     def request(self, requestSpec: Dict, inputs: List[TaskResult] = None, **kwargs ) -> TaskHandle:
-        response = self.sendMessage( "exe", requestSpec, **kwargs )
+        rid = requestSpec.get( "rid", UID.randomId(6) )
+        channel = self.response_manager.register( rid )                 # Subscribe before the request is sent so no responses are missed
+        response = self.sendMessage( "exe", dict( requestSpec, rid=rid ), **kwargs )
         self.log( f"Got exe response: {response}" )
-        if "error" in response: raise Exception( f"Server Error: {response['error']}" )
+        if "error" in response:
+            self.response_manager.release( rid )
+            raise Exception( f"Server Error: {response['error']}" )
         status = Status.decode( response.get('status') )
         self.log( str(response) )
-        response_manager = ResponseManager( self.context, self.connector, response["rid"], self.host_address, self.response_port, status, self.cache_dir, **kwargs )
-        response_manager.start()
-        return zmqTask( self.cid, response_manager )
+        channel.setStatus( status )
+        return zmqTask( self.cid, self.response_manager, channel )
 
     def capabilities(self, ctype: str, **kwargs ) -> Dict:
         return self.sendMessage( "capabilities", {"type":ctype}, **kwargs )
@@ -91,47 +102,31 @@ class ZMQClient(StratusClient):
 
     def shutdown(self):
         StratusClient.shutdown(self)
-        try: self.request_socket.close()
-        except Exception: pass
+        if self.response_manager is not None: self.response_manager.term()
 
     def sendMessage(self, type: str, requestData: Dict, **kwargs ) -> Dict:
         requestId = requestData.get( "rid", UID.randomId(6) )
-        msg = json.dumps( requestData )
-        self.log( "Sending authenticated {} request {} on port {}, requestId = {}.".format( type, msg, str(self.request_port), requestId )  )
+        self.log( "Sending authenticated {} request {} on port {}, requestId = {}.".format( type, requestData, str(self.request_port), requestId )  )
         try:
-            message = "!".join( [ requestId, type, msg ] )
-            self.request_socket.send_string( message )
-            response = self.request_socket.recv_string()
-        except zmq.error.ZMQError as err:
-            self.logger.error( "Error sending message {0} on request socket: {1}".format( msg, str(err) ) )
-            response = str(err)
-        parts = response.split("!")
-        response = json.loads(parts[1])
+            response = self.response_manager.submit( requestId, protocol.pack( requestId, type, requestData ) ).result( self.request_timeout )
+        except Exception as err:
+            self.logger.error( "Error sending message {0} on request socket: {1}".format( requestData, str(err) ) )
+            response = { "status": "error", "error": str(err) }
         response["rid"] = requestId
         return response
 
-class ResponseManager(Thread):
+class ResponseChannel:
+    """ Responses received for a single request, demultiplexed from the client's shared response socket """
 
-    def __init__(self, context: zmq.Context, connector: ConnectionMode, rid: str, host: str, port: int, status: Status, cache_dir: str, **kwargs ):
-        Thread.__init__(self)
-        self.context = context
-        self._connector = connector
-        self.logger = StratusLogger.getLogger()
-        self.host = host
-        self.port = port
+    def __init__(self, rid: str ):
         self.requestId = rid
-        self.active = True
-        self.mstate = MessageState.RESULT
-        self.setName('STRATUS zeromq client Response Thread')
         self.cached_results: queue.Queue[TaskResult] = queue.Queue()
-        self.setDaemon(True)
-        self.cacheDir = os.path.expanduser( cache_dir )
-        self.log("Created RM, cache dir = " + self.cacheDir )
-        self._status = status
+        self._status = Status.IDLE
         self._exception = None
+        self._assembler: Optional[DatasetAssembler] = None
+        self._stream_header: Dict = None
 
     def cacheResult(self, header: Dict, data: Optional[xa.Dataset] ):
-        self.logger.info( "Caching result: " + str(header) )
         dataList = [] if data is None else [data]
         self.cached_results.put( TaskResult( header, dataList )  )
 
@@ -141,77 +136,202 @@ class ResponseManager(Thread):
         try:                 return self.cached_results.get( block, timeout )
         except queue.Empty:  return None
 
+    def setStatus(self, status: Status ):
+        self._status = status
+
+    def setException(self, err: Exception ):
+        self._status = Status.ERROR
+        self._exception = err
+
+    def getStatus(self):
+        return self._status
+
+    def exception(self) -> Optional[Exception]:
+        return self._exception
+
+    def processResponse(self, header: Dict, frames: List[zmq.Frame] ):
+        type = header["type"]
+        if type == "chunk":
+            self._assembler.add( header["frame"], header["offset"], frames[0].buffer )
+            return
+
+        self._status =  Status.decode( header["status"] )
+        if type == "xarray" and "nchunks" in header:
+            self._assembler = DatasetAssembler( header.pop("dataset") )
+            self._stream_header = header
+        elif type == "xarray" and "dataset" in header:
+            dataset = decodeDataset( header.pop("dataset"), frames )
+            self.cacheResult( header, dataset )
+        elif type == "trailer" and self._status == Status.ERROR:
+            self._assembler = None
+            self._exception = Exception( header["error"] )
+        elif type == "trailer":
+            assembler, self._assembler = self._assembler, None
+            if assembler.nchunks != header["nchunks"]:
+                raise Exception( f"Incomplete result stream for request {self.requestId}: received {assembler.nchunks} of {header['nchunks']} chunks" )
+            self._stream_header["status"] = header["status"]
+            self.cacheResult( self._stream_header, assembler.dataset() )
+        elif self._status == Status.ERROR:
+            self._exception = Exception( header["error"] )
+        else:
+            self.cacheResult( header, None )
+
+class ResponseManager(Thread):
+    """ I/O thread owning the client's sockets: a DEALER request socket, on which any number of requests may be
+        in flight with replies resolved to futures by rid, and a single response ( SUB ) socket whose messages
+        are routed to per-request channels by rid """
+
+    def __init__(self, context: zmq.Context, connector: ConnectionMode, host: str, request_port: int, port: int, cache_dir: str, **kwargs ):
+        Thread.__init__(self)
+        self.context = context
+        self._connector = connector
+        self.logger = StratusLogger.getLogger()
+        self.host = host
+        self.request_port = request_port
+        self.port = port
+        self.active = True
+        self.mstate = MessageState.RESULT
+        self.setName('STRATUS zeromq client Response Thread')
+        self.setDaemon(True)
+        self.cacheDir = os.path.expanduser( cache_dir )
+        self.log("Created RM, cache dir = " + self.cacheDir )
+        self._listener: Optional[Callable[[str],None]] = kwargs.get( "listener" )
+        self._channels: Dict[str,ResponseChannel] = {}
+        self._commands: queue.Queue = queue.Queue()
+        self._outgoing: queue.Queue = queue.Queue()
+        self._pending: Dict[str,Future] = {}
+        self._lock = threading.Lock()               # Orders submissions against thread shutdown
+        self._wakeup = Wakeup()
+
+    def submit(self, rid: str, message: List[bytes] ) -> Future:
+        """ Queues a request for sending, returns a future resolved with the server's reply """
+        future = Future()
+        with self._lock:
+            if not self.active:
+                future.set_exception( Exception( "zeromq client connection closed" ) )
+                return future
+            self._pending[rid] = future
+            self._outgoing.put( message )
+            self._wakeup.set()
+        return future
+
+    def register(self, rid: str ) -> ResponseChannel:
+        channel = ResponseChannel( rid )
+        self._channels[rid] = channel
+        subscribed = threading.Event()
+        self.command( zmq.SUBSCRIBE, rid, subscribed )
+        subscribed.wait( 5.0 )
+        return channel
+
+    def release(self, rid: str ):
+        if self._channels.pop( rid, None ) is not None:
+            self.command( zmq.UNSUBSCRIBE, rid )
+
+    def command(self, option: int, rid: str, done: threading.Event = None ):
+        self._commands.put( ( option, rid, done ) )
+        with self._lock:
+            if self.active: self._wakeup.set()
+
+    def processCommands(self, socket: zmq.Socket ):
+        while not self._commands.empty():
+            option, rid, done = self._commands.get()
+            socket.setsockopt( option, s2b( rid ) )
+            if done is not None: done.set()
+
+    def sendRequests(self, socket: zmq.Socket ):
+        while not self._outgoing.empty():
+            socket.send_multipart( [ b"" ] + self._outgoing.get() )
+
+    def processReplies(self, socket: zmq.Socket ):
+        while socket.poll( 0 ):
+            try:
+                envelope, rid, type, reply = protocol.unpack( socket.recv_multipart() )
+            except protocol.ProtocolError as err:
+                self.log( f"Dropping malformed reply: {err}" )
+                continue
+            future = self._pending.pop( rid, None )
+            if future is not None: future.set_result( reply )
+
     def run(self):
-        response_socket = None
+        request_socket, response_socket = None, None
         try:
             self.log("Run RM thread")
+            request_socket: zmq.Socket = self.context.socket( zmq.DEALER )
+            self._connector.connectSocket( request_socket, self.host, self.request_port )
             response_socket: zmq.Socket = self.context.socket( zmq.SUB )
             response_port = self._connector.connectSocket( response_socket, self.host, self.port )
-            response_socket.subscribe( s2b( self.requestId ) )
-            self.log("Connected response socket on port {} with subscription (client/request) id: '{}', active = {}".format( response_port, self.requestId, str(self.active) ) )
+            poller = zmq.Poller()
+            poller.register( request_socket, zmq.POLLIN )
+            poller.register( response_socket, zmq.POLLIN )
+            poller.register( self._wakeup, zmq.POLLIN )
+            self.log("Connected request socket on port {} and response socket on port {}, active = {}".format( self.request_port, response_port, str(self.active) ) )
             while( self.active ):
-                self.processNextResponse( response_socket )
+                poller.poll()
+                self._wakeup.clear()
+                self.processCommands( response_socket )
+                self.sendRequests( request_socket )
+                self.processReplies( request_socket )
+                while response_socket.poll( 0 ):
+                    self.processNextResponse( response_socket )
 
         except Exception as err:
             self.log( "ResponseManager error: " + str(err) )
-            self.cacheResult( {  "status":"error", "error": str(err) }, None )
+            for channel in list( self._channels.values() ):
+                channel.setException( err )
+                if self._listener is not None: self._listener( channel.requestId )
         finally:
-            if response_socket: response_socket.close()
+            with self._lock:
+                self.active = False
+                pending, self._pending = list( self._pending.values() ), {}
+                self._wakeup.close()
+            for future in pending:
+                if not future.done(): future.set_exception( Exception( "zeromq client connection closed" ) )
+            for socket in ( request_socket, response_socket ):
+                if socket: socket.close()
 
     def term(self):
-        if self.active:
-            self.active = False
+        with self._lock:
+            if self.active:
+                self.active = False
+                self._wakeup.set()
 
     def log(self, msg: str ):
         self.logger.info( "[RM] " + msg )
 
-    def exception(self) -> Optional[Exception]:
-        return self._exception
-
     def processNextResponse(self, socket: zmq.Socket ):
+        response = socket.recv_multipart( copy=False )
+        sId = b2s( response[0].bytes )
+        channel = self._channels.get( sId )
+        if channel is None: return                              # Released request, or a prefix match on another rid
         try:
-            self.log("Awaiting responses" )
-            response = socket.recv_multipart()
-            sId = b2s( response[0] )
-            header = json.loads( b2s( response[1] ) )
-            type = header["type"]
-            self._status =  Status.decode( header["status"] )
-
-            if type == "xarray" and len(response) > 2:
-                dataset = pickle.loads(response[2])
-                self.cacheResult( header, dataset )
-            elif self._status == Status.ERROR:
-                self._exception = Exception( header["error"] )
-            else:
-                self.cacheResult( header, None )
-
-            self.log(f"[{sId}]: Received response: " +  str( header ) + ", new status = " + str( self._status )  + ", exception = " + str( self._exception )  )
+            header = loadHeader( response[1].buffer )
+            channel.processResponse( header, response[2:] )
+            if header["type"] == "chunk": return
+            self.log(f"[{sId}]: Received response: " +  str( header ) + ", new status = " + str( channel.getStatus() )  + ", exception = " + str( channel.exception() )  )
 
         except Exception as err:
             self.log( "EDAS error: {0}\n{1}\n".format(err, traceback.format_exc() ) )
-            self._exception = err
+            channel.setException( err )
 
-    def getStatus(self):
-        return self._status
+        if self._listener is not None: self._listener( sId )
 
 
 class zmqTask(TaskHandle):
 
-    def __init__(self, cid: str, manager: ResponseManager, **kwargs):
-        super(zmqTask,self).__init__( rid=manager.requestId, cid=cid, **kwargs )
+    def __init__(self, cid: str, manager: ResponseManager, channel: ResponseChannel, **kwargs):
+        super(zmqTask,self).__init__( rid=channel.requestId, cid=cid, **kwargs )
         self.logger = StratusLogger.getLogger()
         self.manager = manager
+        self.channel = channel
 
     def getResult( self, **kwargs ) ->  Optional[TaskResult]:
-        return self.manager.getResult(**kwargs)
+        return self.channel.getResult(**kwargs)
 
     def exception(self) -> Optional[Exception]:
-        return self.manager.exception()
+        return self.channel.exception()
 
     def status(self) ->  Status:
-        return self.manager.getStatus()
+        return self.channel.getStatus()
 
     def __del__(self):
-        self.manager.term()
-
-
+        self.manager.release( self.channel.requestId )
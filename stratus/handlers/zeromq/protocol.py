@@ -0,0 +1,24 @@
+""" Framing of control messages on the zeromq request channel: [ version, rid, type, msgpack body ] """
+import msgpack
+from typing import List, Dict, Any, Tuple
+from stratus.util.parsing import s2b, b2s
+
+VERSION = b"\x01"
+NFRAMES = 4
+
+class ProtocolError(Exception):
+    pass
+
+def _packable( value: Any ) -> Any:
+    if hasattr( value, "tolist" ): return value.tolist()
+    return str( value )
+
+def pack( rid: str, type: str, body: Dict ) -> List[bytes]:
+    return [ VERSION, s2b( rid ), s2b( type ), msgpack.packb( body, use_bin_type=True, default=_packable ) ]
+
+def unpack( frames: List[Any] ) -> Tuple[List[Any],str,str,Dict]:
+    """ Splits a received multipart message into ( envelope, rid, type, body ), the envelope being any routing frames preceding the message """
+    if len( frames ) < NFRAMES: raise ProtocolError( f"Malformed message: expected at least {NFRAMES} frames, got {len(frames)}" )
+    envelope, ( version, rid, type, body ) = frames[:-NFRAMES], frames[-NFRAMES:]
+    if bytes( version ) != VERSION: raise ProtocolError( f"Unsupported protocol version {bytes(version)!r}, expected {VERSION!r}" )
+    return envelope, b2s( rid ), b2s( type ), msgpack.unpackb( body, raw=False )
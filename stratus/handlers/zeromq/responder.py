@@ -1,5 +1,5 @@
-import json, string, random, abc, os, pickle, collections
-from typing import List, Dict, Any, Sequence, BinaryIO, TextIO, ValuesView, Tuple, Optional
+import json, string, random, abc, os, collections
+from typing import List, Dict, Any, Sequence, BinaryIO, TextIO, ValuesView, Tuple, Optional, Iterator
 from stratus_endpoint.util.config import StratusLogger
 from threading import Thread
 import zmq, zmq.auth, traceback, time, logging, xml, socket
@@ -9,6 +9,7 @@ from stratus.app.operations import StratusWorkflow
 from typing import List, Dict, Sequence, Set
 import random, string, os, queue, datetime
 from stratus.util.parsing import s2b, b2s, ia2s, sa2s, m2s
+from stratus.util.encoding import encodeDataset, chunkBuffers, dumpHeader
 import xarray as xa
 
 class StratusResponse:
@@ -21,27 +22,44 @@ class StratusResponse:
     def id(self): return self._id
 
     @property
-    def message(self) -> str: return json.dumps(self._body)
+    def body(self) -> Dict: return self._body
+
+    @property
+    def message(self) -> str: return b2s( dumpHeader( self._body ) )
 
     def __str__(self) -> str: return "[" + self.__class__.__name__  + "]: " + self.message
 
 class DataPacket(StratusResponse):
 
-    def __init__( self, rid: str, header: Dict, data: bytes = bytearray(0)  ):
+    def __init__( self, rid: str, header: Dict, frames: List[Any] = None  ):
         super(DataPacket, self).__init__( rid, header )
-        self._data = data
+        self._frames = [] if frames is None else frames
 
     def hasData(self) -> bool:
-        return ( self._data is not None ) and ( len( self._data ) > 0 )
+        return len( self._frames ) > 0
 
     def getTransferHeader(self) -> bytes:
-        return s2b( self.message )
+        return dumpHeader( self._body )
 
-    def getTransferData(self) -> bytes:
-        return self._data
+    def getTransferData(self) -> List[Any]:
+        return self._frames
 
-    def getRawData(self) -> bytes:
-        return self._data
+    @property
+    def size(self) -> int:
+        return sum( memoryview(frame).nbytes for frame in self._frames )
+
+    def getMessages( self, chunk_size: int ) -> Iterator[List[Any]]:
+        """ Small packets go out as a single message, larger ones as a header, a sequence of bounded chunks and a trailer """
+        topic = s2b( self.id )
+        if self.size <= chunk_size:
+            yield [ topic, self.getTransferHeader() ] + self.getTransferData()
+        else:
+            chunks = list( chunkBuffers( self._frames, chunk_size ) )
+            header = dict( self._body, nchunks=len(chunks), status=str(Status.EXECUTING) )
+            yield [ topic, dumpHeader( header ) ]
+            for seq, ( frame, offset, chunk ) in enumerate( chunks ):
+                yield [ topic, dumpHeader( dict( type="chunk", seq=seq, frame=frame, offset=offset ) ), chunk ]
+            yield [ topic, dumpHeader( dict( type="trailer", nchunks=len(chunks), status=self._body.get("status") ) ) ]
 
     def toString(self) -> str: return \
         "DataPacket[" + self.message + "]"
@@ -56,6 +74,15 @@ class StratusZMQResponder(Thread):
         self.executing_jobs: Dict[str, StratusResponse] = {}
         self.status_reports: Dict[str,str] = {}
         self.client_address = kwargs.get( "client_address", "*" )
+        self.chunk_size = int( kwargs.get( "chunk_size", 8 * 1024 * 1024 ) )
+        self.send_hwm = int( kwargs.get( "send_hwm", 16 ) )
+        self.send_timeout = float( kwargs.get( "send_timeout", 60 ) )
+        self.send_queue: queue.Queue = queue.Queue()            # DataPackets, or ( rid, status, workflow ) results to be packed on this thread
+        self.dispatched: Set[str] = set()                       # Completed requests whose results have been queued
+        self.packed: queue.Queue[str] = queue.Queue()          # Completed requests whose results have been read, so their workflows can be cleared
+        self.active = True
+        self.setName('STRATUS zeromq Responder Thread')
+        self.setDaemon(True)
         self.getKeyDir( **kwargs )
         self.socket: zmq.Socket = self.initSocket()
 
@@ -88,28 +115,83 @@ class StratusZMQResponder(Thread):
             raise Exception( f"Unexpected Status in getDataPackets: {Status.str(status)}")
 
     def processWorkflows(self, workflows: Dict[str, StratusWorkflow]) -> List[str]:
-        completed_requests = []
+        """ Queues the results of newly completed workflows, which are read ( possibly reloaded or fetched ) and encoded on the
+            responder thread rather than the app loop.  Returns the requests whose results have been read since the last call. """
         for rid, workflow in workflows.items():
+            if rid in self.dispatched: continue
             status = workflow.status()
 #            self.logger.info( f"@@SR: process Workflow {rid}, status= {status} " )
             self.setExeStatus( rid, status )
             if status in [Status.COMPLETED, Status.ERROR, Status.CANCELED]:
-                dataPacket = self.getDataPacket( rid, status, workflow )
                 self.logger.info(f"@@SR: Sending Completed Result for request {rid}" )
-                self.sendDataPacket( dataPacket )
-                completed_requests.append(rid)
+                self.dispatched.add( rid )
+                self.send_queue.put( ( rid, status, workflow ) )
+        completed_requests = []
+        while not self.packed.empty():
+            rid = self.packed.get_nowait()
+            self.dispatched.discard( rid )
+            completed_requests.append( rid )
         return completed_requests
 
+    def packResult( self, rid: str, status: Status, workflow: StratusWorkflow ) -> DataPacket:
+        try:
+            dataPacket = self.getDataPacket( rid, status, workflow )
+            return dataPacket if dataPacket is not None else self.createMessage( rid, {"status": "error", "error": f"Empty result in request {rid}"} )
+        except Exception as err:
+            self.logger.error( f"@@SR: Error reading result for request {rid}: {err}" )
+            return self.createMessage( rid, {"status": "error", "error": str(err)} )
+        finally:
+            self.packed.put( rid )
+
     def sendDataPacket( self, dataPacket: DataPacket ):
-        multipart_msg = [ s2b( dataPacket.id ), dataPacket.getTransferHeader() ]
+        self.send_queue.put( dataPacket )
+
+    def run(self):
+        try:
+            while self.active:
+                item = self.send_queue.get()
+                if item is None: break
+                dataPacket = item if isinstance( item, DataPacket ) else self.packResult( *item )
+                self.streamDataPacket( dataPacket )
+        finally:
+            self.socket.close()
+
+    def streamDataPacket( self, dataPacket: DataPacket ):
+        """ A packet that can't be delivered within 'send_timeout' seconds ( a stalled subscriber ) is abandoned with an error trailer,
+            so one slow client can't hold up the results of all the others """
+        nmessages = 0
+        deadline = time.time() + self.send_timeout
+        for multipart_msg in dataPacket.getMessages( self.chunk_size ):
+            if not self.sendMultipart( multipart_msg, deadline ):
+                if self.active: self.abandonDataPacket( dataPacket, nmessages )
+                return
+            nmessages += 1
         if dataPacket.hasData():
-            bdata: bytes = dataPacket.getTransferData()
-            multipart_msg.append( bdata )
-            self.logger.info("@@SR: Sent data packet for " + dataPacket.id + ", data Size: " + str(len(bdata)) )
-            self.logger.info("@@SR: Data header: " + dataPacket.message)
+            self.logger.info("@@SR: Sent data packet for " + dataPacket.id + " in " + str(nmessages) + " messages, data Size: " + str(dataPacket.size) )
         else:
             self.logger.info( "@@SR: Sent data header only for " + dataPacket.id + "---> NO DATA!   BODY = " + dataPacket.message )
-        self.socket.send_multipart( multipart_msg )
+
+    def sendMultipart( self, multipart_msg: List[Any], deadline: float ) -> bool:
+        """ Waits ( until the deadline ) while the subscriber's queue is at its high-water mark ( XPUB_NODROP ), so memory stays bounded """
+        while self.active:
+            try:
+                self.socket.send_multipart( multipart_msg, flags=zmq.NOBLOCK, copy=False )
+                return True
+            except zmq.Again:
+                if time.time() > deadline: return False
+                self.drainSubscriptions()
+                self.socket.poll( 100, zmq.POLLOUT )
+        return False
+
+    def abandonDataPacket( self, dataPacket: DataPacket, nmessages: int ):
+        error = f"Result stream for request {dataPacket.id} abandoned after {self.send_timeout} sec: subscriber not reading"
+        self.logger.error( f"@@SR: {error} ( sent {nmessages} messages )" )
+        trailer = [ s2b( dataPacket.id ), dumpHeader( dict( type="trailer", status="error", error=error ) ) ]
+        if not self.sendMultipart( trailer, time.time() + 1.0 ):
+            self.logger.error( f"@@SR: Unable to send error trailer for request {dataPacket.id}" )
+
+    def drainSubscriptions(self):
+        while self.socket.poll( 0, zmq.POLLIN ): self.socket.recv()
 
     def setExeStatus( self, rid: str, status: Status ):
         self.status_reports[rid] = status
@@ -122,8 +204,10 @@ class StratusZMQResponder(Thread):
         except Exception: pass
 
     def initSocket(self) -> zmq.Socket:
-        socket: zmq.Socket   = self.context.socket(zmq.PUB)
+        socket: zmq.Socket   = self.context.socket(zmq.XPUB)
         try:
+            socket.setsockopt( zmq.XPUB_NODROP, 1 )
+            socket.setsockopt( zmq.SNDHWM, self.send_hwm )
             server_secret_file = os.path.join( self.secret_keys_dir, "server.key_secret" )
             server_public, server_secret = zmq.auth.load_certificate(server_secret_file)
             socket.curve_secretkey = server_secret
@@ -141,9 +225,9 @@ class StratusZMQResponder(Thread):
 
     def close_connection( self ):
         try:
-            for response in self.executing_jobs.values():
-                self.sendErrorMessage( f"Job {response.id} terminated  by server shutdown.")
-            self.socket.close()
+            for response in list( self.executing_jobs.values() ):
+                self.sendErrorMessage( response.id, f"Job {response.id} terminated  by server shutdown.")
+            self.send_queue.put( None )
         except Exception: pass
 
     def sendMessage(self, rid: str, message: Dict = None):
@@ -154,11 +238,12 @@ class StratusZMQResponder(Thread):
         self.sendMessage(rid, {  "status":"error", "error": message }  )
 
     def createDataPacket( self, rid: str, dataset: xa.Dataset, metadata: Dict = None ) -> DataPacket:
-        data = pickle.dumps(dataset, protocol=-1)
+        dataset_header, buffers = encodeDataset( dataset )
         header = metadata if metadata else {}
         header["type"] = "xarray"
         header["status"] = str( Status.COMPLETED )
-        return DataPacket( rid, header, data )
+        header["dataset"] = dataset_header
+        return DataPacket( rid, header, buffers )
 
     def createMessage(self, rid: str, message: Dict = None ) -> DataPacket:
         if "type" not in message: message["type"] = "message"
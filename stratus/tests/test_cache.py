@@ -0,0 +1,154 @@
+import unittest, tempfile, shutil
+import numpy as np
+import xarray as xa
+from stratus.app.base import StratusAppBase
+from stratus.app.cache import RequestCache, CoalescedWorkflow
+from stratus.app.store import StoredTask, StoredWorkflow
+from stratus_endpoint.handler.base import Status, TaskHandle, TaskResult
+
+def request( rid: str, axes: str = "t" ):
+    return dict( rid=rid, cid="c0", domain=[ dict( name="d0", lat=dict( start=0, end=10 ) ) ],
+                 operation=[ dict( name="xarray:ave", input="v0", axes=axes ) ] )
+
+def completed( rid: str ) -> StoredWorkflow:
+    dataset = xa.Dataset( { "v": ( ( "x", ), np.arange( 10.0 ) ) } )
+    return StoredWorkflow( StoredTask( rid, dict( rid=rid ), [ dataset ], Status.COMPLETED ), Status.COMPLETED )
+
+class TestRequestCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = RequestCache( **{ "cache.enabled": "true" } )
+
+    def test_key(self):
+        self.assertEqual( self.cache.key( request( "r0" ) ), self.cache.key( request( "r1" ) ) )
+        self.assertNotEqual( self.cache.key( request( "r0" ) ), self.cache.key( request( "r0", axes="x" ) ) )
+        self.assertIsNone( RequestCache().key( request( "r0" ) ) )
+        self.assertIsNone( RequestCache( **{ "cache.enabled": "true", "cache.exclude_epas": "xarray:*" } ).key( request( "r0" ) ) )
+
+    def test_coalescing(self):
+        key = self.cache.key( request( "r0" ) )
+        self.assertIsNone( self.cache.join( key, "r0" ) )
+        self.assertEqual( self.cache.join( key, "r1" ), "r0" )
+        self.assertEqual( self.cache.join( key, "r2" ), "r0" )
+        self.assertEqual( self.cache.complete( "r0", completed( "r0" ) ), [ "r1", "r2" ] )
+        self.assertIsNone( self.cache.join( key, "r3" ) )
+        self.assertEqual( self.cache.stats()["coalesced"], 2 )
+
+    def test_lookup(self):
+        key = self.cache.key( request( "r0" ) )
+        self.assertIsNone( self.cache.lookup( key, "r0" ) )
+        self.cache.join( key, "r0" )
+        self.cache.complete( "r0", completed( "r0" ) )
+        hit = self.cache.lookup( key, "r1" )
+        self.assertEqual( hit.status(), Status.COMPLETED )
+        self.assertEqual( float( hit.getResult().getResult().popDataset().v.sum() ), 45.0 )
+        self.assertEqual( self.cache.stats()["memory_bytes"], 80 )
+
+    def test_unretrievable_entry_is_a_miss(self):
+        key = self.cache.key( request( "r0" ) )
+        self.cache.join( key, "r0" )
+        self.cache.complete( "r0", StoredWorkflow( StoredTask.pending( "r0", FailingHandle(), Status.COMPLETED ), Status.COMPLETED ) )
+        self.assertIsNotNone( self.cache.lookup( key, "r1" ) )
+        self.assertIsNone( self.cache.lookup( key, "r1" ).getResult().getResult() )     # Loading the result fails
+        self.assertIsNone( self.cache.lookup( key, "r2" ) )
+        self.assertEqual( self.cache.stats()["entries"], 0 )
+
+    def test_abandon(self):
+        key = self.cache.key( request( "r0" ) )
+        for rid in ( "r0", "r1", "r2" ): self.cache.join( key, rid )
+        self.assertEqual( self.cache.abandon( "r1" ), [] )
+        self.assertEqual( self.cache.abandon( "r0" ), [ "r2" ] )
+        self.assertFalse( self.cache.leading( "r0" ) )
+        self.assertIsNone( self.cache.join( key, "r2" ) )
+
+class FailingHandle(TaskHandle):
+
+    def __init__(self): TaskHandle.__init__( self, rid="source" )
+
+    def getResult( self, **kwargs ): raise Exception( "result lost" )
+
+class SourceHandle(TaskHandle):
+
+    def __init__(self): TaskHandle.__init__( self, rid="source" )
+
+    def getResult( self, **kwargs ): return TaskResult( {}, [ xa.Dataset( { "v": ( ( "x", ), np.arange( 1000.0 ) ) } ) ] )
+
+class ExecutingWorkflow:
+
+    def __init__(self):
+        self.done = False
+        self.handle = SourceHandle()
+
+    def status(self): return Status.COMPLETED if self.done else Status.EXECUTING
+
+    def getResult(self): return self.handle
+
+    def update(self) -> bool: return self.done
+
+    def completed(self) -> bool: return self.done
+
+    def polled(self) -> bool: return False
+
+class StubCore:
+
+    def __init__( self, **parms ): self.parms = parms
+
+    def parm( self, name: str, default = None ) -> str: return self.parms.get( name, default )
+
+class CacheApp(StratusAppBase):
+
+    def processError(self, rid: str, ex: Exception): pass
+
+    def initInteractions(self): pass
+
+    def updateInteractions(self): pass
+
+class TestCoalescing(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.app = CacheApp( StubCore( spool_dir=self.directory, **{ "cache.enabled": "true" } ) )
+
+    def tearDown(self):
+        self.app.shutdown()
+        shutil.rmtree( self.directory, ignore_errors=True )
+
+    def admit( self, rid: str ) -> bool:
+        admitted = self.app.admitCached( rid, request( rid ) )
+        if not admitted: self.app.active_workflows[rid] = ExecutingWorkflow()
+        return admitted
+
+    def test_followers_resubmitted_when_leader_cleared(self):
+        self.assertFalse( self.admit( "r0" ) )
+        self.assertTrue( self.admit( "r1" ) )
+        self.assertTrue( self.admit( "r2" ) )
+        self.app.clearWorkflow( "r0" )
+        self.assertEqual( self.app.active_workflows["r1"].status(), Status.IDLE )
+        self.assertEqual( [ self.app.requestQueue.get_nowait()["rid"] for index in range( 2 ) ], [ "r1", "r2" ] )
+        self.assertFalse( self.admit( "r1" ) )
+        self.assertTrue( self.admit( "r2" ) )
+        self.app.active_workflows["r1"].done = True
+        self.app.update_workflows()
+        self.assertEqual( sorted( self.app.completed_workflows ), [ "r1", "r2" ] )
+
+    def test_stale_leader_is_a_miss(self):
+        self.app.requestCache.join( self.app.requestCache.key( request( "r0" ) ), "r0" )
+        self.assertFalse( self.admit( "r1" ) )
+        self.assertTrue( self.app.requestCache.leading( "r1" ) )
+        self.assertTrue( self.admit( "r2" ) )
+        self.assertIsInstance( self.app.active_workflows["r2"], CoalescedWorkflow )
+
+    def test_cached_result_outlives_leader(self):
+        store = self.app.completed_workflows
+        store.spill_bytes, store.max_bytes = 0, 0              # Spills every loaded result
+        self.assertFalse( self.admit( "r0" ) )
+        self.app.active_workflows["r0"].done = True
+        self.app.update_workflows()
+        self.assertEqual( store["r0"].getResult().getResult().getDataset().v.size, 1000 )
+        store.enforce()
+        store.flush()
+        self.assertTrue( store["r0"].spilled )
+        self.app.clearWorkflow( "r0" )
+        self.assertTrue( self.admit( "r1" ) )
+        self.assertEqual( store["r1"].status(), Status.COMPLETED )
+        self.assertEqual( store["r1"].getResult().getResult().getDataset().v.size, 1000 )
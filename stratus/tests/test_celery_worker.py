@@ -0,0 +1,66 @@
+import unittest, threading, json, os
+from unittest import mock
+from stratus.handlers.celery import app as celery_app
+
+class StubHandler:
+
+    def __init__( self, builds: list ):
+        self.builds = builds
+
+    def client( self, core ):
+        self.builds.append( core )
+        return object()
+
+class StubCore:
+    """ Stands in for a StratusCore built in a worker process: records the handler specs and client builds """
+    builds = []
+
+    def __init__( self, hspec, **kwargs ):
+        self.handlers = mock.Mock( available={ name: StubHandler( self.builds ) for name in hspec } )
+
+SPEC = dict( name="xop", type="zeromq", host="localhost", cid="c0" )
+
+class TestWorkerPreload(unittest.TestCase):
+
+    def setUp(self):
+        StubCore.builds = []
+        patches = [ mock.patch.object( celery_app, "StratusCore", StubCore ), mock.patch.dict( celery_app._worker_clients, clear=True ),
+                    mock.patch.dict( celery_app.worker_warmup, clear=True ) ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup( patch.stop )
+
+    def test_client_key_ignores_cid(self):
+        self.assertEqual( celery_app.workerClientKey( SPEC ), celery_app.workerClientKey( dict( SPEC, cid="c1" ) ) )
+        self.assertNotEqual( celery_app.workerClientKey( SPEC ), celery_app.workerClientKey( dict( SPEC, host="remote" ) ) )
+
+    def test_client_built_once_per_process(self):
+        clients = []
+        threads = [ threading.Thread( target=lambda index=index: clients.append( celery_app.getWorkerClient( dict( SPEC, cid=f"c{index}" ) ) ) ) for index in range( 8 ) ]
+        for thread in threads: thread.start()
+        for thread in threads: thread.join()
+        self.assertEqual( len( StubCore.builds ), 1 )
+        self.assertEqual( len( set( map( id, clients ) ) ), 1 )
+        self.assertEqual( list( celery_app.worker_warmup ), [ celery_app.workerClientKey( SPEC ) ] )
+
+    def test_preload_from_worker_spec(self):
+        with mock.patch.dict( os.environ, STRATUS_WORKER_SPEC=json.dumps( SPEC ), STRATUS_WORKER_NODE="xop@host" ), \
+             mock.patch.object( celery_app.app.events, "default_dispatcher" ) as dispatcher:
+            celery_app.preloadHandlers()
+            celery_app.getWorkerClient( SPEC )
+        self.assertEqual( len( StubCore.builds ), 1 )
+        dispatcher.assert_called_once_with( hostname="xop@host" )
+        event = dispatcher.return_value.__enter__.return_value.send.call_args
+        self.assertEqual( event.args, ( "worker-warmup", ) )
+        self.assertEqual( event.kwargs["pid"], os.getpid() )
+
+    def test_preload_without_spec(self):
+        with mock.patch.dict( os.environ ):
+            os.environ.pop( "STRATUS_WORKER_SPEC", None )
+            celery_app.preloadHandlers()
+        self.assertEqual( StubCore.builds, [] )
+
+    def test_preload_errors_logged(self):
+        with mock.patch.dict( os.environ, STRATUS_WORKER_SPEC="{ not json" ):
+            celery_app.preloadHandlers()
+        self.assertEqual( celery_app._worker_clients, {} )
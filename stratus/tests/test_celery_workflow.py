@@ -0,0 +1,156 @@
+import unittest, threading, tempfile, shutil
+from unittest import mock
+from typing import Dict, List
+import numpy as np
+import xarray as xa
+from celery import group
+from stratus.handlers.celery import app as celery_app
+from stratus.handlers.celery.workflow import CeleryWorkflow, CeleryResultPoller
+from stratus.app.store import StoredWorkflow
+from stratus.app.operations import Op, ClientOpSet, WorkflowTask
+from stratus_endpoint.handler.base import TaskResult, FailedTask, Status
+
+class StubClient:
+    """ Stands in for a StratusClient: only the attributes used to build workflow tasks """
+
+    def __init__( self, handle: str ):
+        self.handle, self.cid, self.name, self.type, self.parms = handle, handle, handle, "stub", dict( name=handle )
+
+def diamond() -> List[WorkflowTask]:
+    # src -> ( left, right ) -> join
+    request = dict( rid="r0", cid="c0", operation=[ dict( name="a:src", input="v0", result="s" ), dict( name="a:left", input="s", result="l" ),
+                                                    dict( name="a:right", input="s", result="r" ), dict( name="a:join", input="l,r", result="o" ) ] )
+    wtasks = []
+    for spec in request["operation"]:
+        opset = ClientOpSet( request, StubClient( "A" ) )
+        opset.add( Op( **spec ) )
+        wtasks.append( WorkflowTask( opset ) )
+    return wtasks
+
+def executeRequest( self, inputs: List[TaskResult], clientSpec: Dict, requestSpec: Dict ) -> TaskResult:
+    # Each node returns 1 + the sum of its inputs
+    value = 1.0 + sum( float( dataset.v.sum() ) for input in inputs for dataset in input.data )
+    return TaskResult( dict( op=requestSpec["operation"][0]["name"] ), [ xa.Dataset( { "v": ( ( "x", ), np.array( [ value ] ) ) } ) ] )
+
+class TestCeleryWorkflow(unittest.TestCase):
+
+    def test_levels(self):
+        workflow = CeleryWorkflow( nodes=diamond() )
+        workflow.connect()
+        names = [ sorted( wtask.ops[0].name for wtask in level ) for level in workflow.levels() ]
+        self.assertEqual( names, [ [ "src" ], [ "left", "right" ], [ "join" ] ] )
+
+    def test_compile(self):
+        workflow = CeleryWorkflow( nodes=diamond() )
+        workflow.connect()
+        steps = workflow.compile()
+        self.assertEqual( [ isinstance( step, group ) for step in steps ], [ True, False, True, False, True, False ] )
+        self.assertEqual( [ len( step.tasks ) for step in steps[0::2] ], [ 1, 2, 1 ] )
+        node_ids = workflow.node_ids
+        for level in steps[0::2]:
+            for node in level.tasks:
+                tid, dependencies = node.args[0], node.args[1]
+                self.assertEqual( node.options["task_id"], node_ids[tid] )
+                self.assertEqual( dependencies, { dep.id: node_ids[dep.id] for dep in workflow.nodes[tid].dependencies } )
+        self.assertEqual( steps[-1].args, ( node_ids[ workflow.getOutputNode() ], ) )
+
+    def test_inline_execution(self):
+        with mock.patch.object( celery_app.CeleryTask, "executeRequest", executeRequest ):
+            workflow = CeleryWorkflow( nodes=diamond() )
+            self.assertTrue( workflow.update() )
+            result: TaskResult = workflow.getResult().getResult()
+        self.assertEqual( result.header, dict( op="a:join" ) )
+        self.assertEqual( float( result.data[0].v[0] ), 5.0 )
+
+class StubAsyncResult:
+
+    def __init__( self, ready: bool, result = None ):
+        self._ready, self.result = ready, result
+
+    def ready(self) -> bool: return self._ready
+
+    def failed(self) -> bool: return isinstance( self.result, Exception )
+
+    def get( self, **kwargs ): raise AssertionError( "blocking read inside a task" )
+
+class TestFetchResult(unittest.TestCase):
+
+    def fetch( self, async_result: StubAsyncResult ):
+        with mock.patch.object( celery_app.app, "AsyncResult", lambda ref: async_result ):
+            return celery_app.fetchResult( "t0" )
+
+    def test_reads_without_blocking(self):
+        result = TaskResult( dict( op="a:src" ) )
+        self.assertIs( self.fetch( StubAsyncResult( True, result ) ), result )
+        self.assertIs( celery_app.fetchResult( result ), result )
+
+    def test_pending_or_failed_upstream_raises(self):
+        with self.assertRaises( Exception ): self.fetch( StubAsyncResult( False ) )
+        with self.assertRaisesRegex( ValueError, "bad input" ): self.fetch( StubAsyncResult( True, ValueError( "bad input" ) ) )
+
+class FlakyAsyncResult:
+    """ Result whose backend is unreachable for the first 'failures' checks """
+
+    def __init__( self, id: str, failures: int ):
+        self.id, self.failures, self.checks, self.state = id, failures, 0, "PENDING"
+
+    def ready(self) -> bool:
+        self.checks += 1
+        if self.checks <= self.failures: raise ConnectionError( "backend unreachable" )
+        return True
+
+class TestCeleryResultPoller(unittest.TestCase):
+
+    def setUp(self):
+        self.poller = CeleryResultPoller( 0.01, max_errors=5 )
+        self.ready, self.failed = threading.Event(), []
+
+    def tearDown(self):
+        self.poller.shutdown()
+
+    def onError( self, err: Exception ):
+        self.failed.append( err )
+        self.ready.set()
+
+    def test_retried_after_backend_errors(self):
+        result = FlakyAsyncResult( "t0", 3 )
+        self.poller.watch( result, self.ready.set, self.onError )
+        self.assertTrue( self.ready.wait( 5.0 ) )
+        self.assertEqual( ( result.checks, self.failed ), ( 4, [] ) )
+
+    def test_fails_after_max_errors(self):
+        self.poller.watch( FlakyAsyncResult( "t0", 100 ), self.ready.set, self.onError )
+        self.assertTrue( self.ready.wait( 5.0 ) )
+        self.assertIsInstance( self.failed[0], ConnectionError )
+        self.assertEqual( self.poller._pending, {} )
+
+    def test_failed_workflow(self):
+        workflow = CeleryWorkflow( nodes=diamond(), executor="celery", poller=self.poller )
+        workflow.setFailed( ConnectionError( "backend unreachable" ) )
+        workflow.celery_result = FlakyAsyncResult( "t0", 0 )
+        self.assertTrue( workflow.update() )
+        self.assertEqual( workflow.status(), Status.ERROR )
+        self.assertIsInstance( workflow.getResult().exception(), ConnectionError )
+
+class StubCore:
+
+    def __init__( self, **parms ): self.parms = parms
+
+    def parm( self, name: str, default = None ) -> str: return self.parms.get( name, default )
+
+    def getConfigParms( self, module: str ) -> Dict: return self.parms
+
+class TestInlineCompletion(unittest.TestCase):
+
+    def test_wait_uses_completion_condition(self):
+        directory = tempfile.mkdtemp()
+        app = celery_app.StratusAppCelery( StubCore( spool_dir=directory ) )
+        try:
+            with mock.patch.object( app._completion, "notify_all", wraps=app._completion.notify_all ) as notify:
+                app.completed_workflows["r0"] = StoredWorkflow( FailedTask( Exception( "failed" ) ), Status.ERROR )
+                self.assertTrue( app.waitForCompletion( "r0", 0.0 ) )
+                self.assertFalse( app.waitForCompletion( "r1", 0.05 ) )
+                self.assertEqual( notify.call_count, 1 )
+        finally:
+            app.shutdown()
+            shutil.rmtree( directory, ignore_errors=True )
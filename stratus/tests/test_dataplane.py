@@ -0,0 +1,34 @@
+import unittest, tempfile, shutil
+import numpy as np
+import xarray as xa
+from stratus.handlers.celery.dataplane import DataPlane, DatasetRef, InlineDataPlane, FilesystemDataPlane
+from stratus_endpoint.handler.base import TaskResult
+
+class TestDataPlane(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.small = xa.Dataset( { "v": ( ( "x", ), np.arange( 10.0 ) ) } )
+        self.large = xa.Dataset( { "v": ( ( "x", ), np.arange( 200000.0 ) ) } )
+
+    def tearDown(self):
+        shutil.rmtree( self.directory, ignore_errors=True )
+
+    def test_create(self):
+        self.assertIsInstance( DataPlane.create( None ), InlineDataPlane )
+        self.assertIsInstance( DataPlane.create( dict( type="filesystem", directory=self.directory ) ), FilesystemDataPlane )
+        with self.assertRaises( Exception ): DataPlane.create( dict( type="carrier-pigeon" ) )
+
+    def test_inline_passes_through(self):
+        result = TaskResult( dict( rid="r0" ), [ self.large ] )
+        self.assertIs( DataPlane.create( None ).externalize( result ).data[0], self.large )
+
+    def test_filesystem_round_trip(self):
+        dataplane = DataPlane.create( dict( type="filesystem", directory=self.directory, threshold_mb="1" ) )
+        external = dataplane.externalize( TaskResult( dict( rid="r0" ), [ self.small, self.large ] ) )
+        self.assertIs( external.data[0], self.small )
+        self.assertIsInstance( external.data[1], DatasetRef )
+        self.assertEqual( external.data[1].nbytes, self.large.nbytes )
+        resolved = DataPlane.resolve( external )
+        self.assertEqual( resolved.header, dict( rid="r0" ) )
+        xa.testing.assert_equal( resolved.data[1], self.large )
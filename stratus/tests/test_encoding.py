@@ -0,0 +1,52 @@
+import unittest
+import numpy as np
+import xarray as xa
+from stratus.util.encoding import encodeDataset, decodeDataset, chunkBuffers, DatasetAssembler, ResultStream, ResultStreamDecoder
+
+def sampleDataset( size: int = 1000 ) -> xa.Dataset:
+    return xa.Dataset( { "tas": ( ( "t", "x" ), np.random.rand( size // 10, 10 ).astype( np.float32 ), { "units": "K" } ),
+                         "count": ( ( "t", ), np.arange( size // 10, dtype=np.int64 ) ) },
+                       coords=dict( t=np.arange( size // 10, dtype=np.float64 ), x=np.linspace( 0.0, 1.0, 10 ) ), attrs=dict( source="test" ) )
+
+class TestEncoding(unittest.TestCase):
+
+    def test_dataset_round_trip(self):
+        dataset = sampleDataset()
+        header, buffers = encodeDataset( dataset )
+        xa.testing.assert_identical( decodeDataset( header, buffers ), dataset )
+
+    def test_decode_does_not_copy(self):
+        header, buffers = encodeDataset( sampleDataset() )
+        frames = [ bytearray( buffer.tobytes() ) for buffer in buffers ]
+        decoded = decodeDataset( header, frames )
+        frames[ header["variables"][0]["frame"] ][:4] = np.float32( 42.0 ).tobytes()
+        self.assertEqual( float( decoded[ header["variables"][0]["name"] ].values.flat[0] ), 42.0 )
+
+    def test_non_contiguous_and_object_variables(self):
+        dataset = xa.Dataset( { "v": ( ( "x", "y" ), np.arange( 12.0 ).reshape( 3, 4 ).T ), "label": ( ( "y", ), np.array( [ "a", "bb", "c" ], dtype=object ) ) } )
+        header, buffers = encodeDataset( dataset )
+        self.assertEqual( len( buffers ), 1 )
+        xa.testing.assert_identical( decodeDataset( header, buffers ), dataset )
+
+    def test_chunked_assembly(self):
+        dataset = sampleDataset()
+        header, buffers = encodeDataset( dataset )
+        chunks = list( chunkBuffers( buffers, 256 ) )
+        self.assertTrue( all( chunk.nbytes <= 256 for frame, offset, chunk in chunks ) )
+        assembler = DatasetAssembler( header )
+        for frame, offset, chunk in reversed( chunks ): assembler.add( frame, offset, chunk )
+        self.assertEqual( assembler.nchunks, len( chunks ) )
+        xa.testing.assert_identical( assembler.dataset(), dataset )
+
+    def test_result_stream_resume(self):
+        datasets = [ sampleDataset( 500 ), sampleDataset( 2000 ) ]
+        stream = ResultStream( dict( rid="r0" ), datasets )
+        decoder = ResultStreamDecoder()
+        split = stream.size // 3
+        for chunk in stream.iterate( 0, split, 100 ): decoder.feed( chunk )
+        self.assertFalse( decoder.complete )
+        self.assertEqual( decoder.received, split )
+        for chunk in stream.iterate( decoder.received, None, 100 ): decoder.feed( chunk )
+        header, results = decoder.result()
+        self.assertEqual( header, dict( rid="r0" ) )
+        for result, dataset in zip( results, datasets ): xa.testing.assert_identical( result, dataset )
@@ -0,0 +1,109 @@
+import unittest, threading, time, tempfile, shutil
+from stratus.app.events import Wakeup, RequestQueue, StatusJournal
+from stratus.app.base import StratusAppBase
+
+class StubCore:
+    """ Stands in for a StratusCore: only the parms read by StratusAppBase """
+
+    def __init__( self, **parms ):
+        self.parms = parms
+
+    def parm( self, name: str, default = None ) -> str:
+        return self.parms.get( name, default )
+
+class StubWorkflow:
+
+    def __init__( self, polled: bool ):
+        self._polled = polled
+
+    def polled(self) -> bool: return self._polled
+
+class LoopApp(StratusAppBase):
+
+    def processError(self, rid: str, ex: Exception): pass
+
+    def initInteractions(self): pass
+
+    def updateInteractions(self): pass
+
+class TestWakeup(unittest.TestCase):
+
+    def test_set_interrupts_wait(self):
+        wakeup = Wakeup()
+        threading.Timer( 0.05, wakeup.set ).start()
+        start = time.time()
+        self.assertTrue( wakeup.wait( 5.0 ) )
+        self.assertLess( time.time() - start, 1.0 )
+        self.assertFalse( wakeup.wait( 0.01 ) )
+        wakeup.close()
+
+    def test_wakeups_coalesce(self):
+        wakeup = Wakeup()
+        for iteration in range( 10000 ): wakeup.set()
+        self.assertTrue( wakeup.wait( 0 ) )
+        self.assertFalse( wakeup.wait( 0 ) )
+        wakeup.close()
+        wakeup.set()
+
+    def test_request_queue_wakes(self):
+        wakeup = Wakeup()
+        requests = RequestQueue( wakeup )
+        requests.put( dict( rid="r0" ) )
+        self.assertTrue( wakeup.wait( 0 ) )
+        self.assertEqual( requests.get_nowait(), dict( rid="r0" ) )
+        wakeup.close()
+
+class TestAppLoop(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.app = LoopApp( StubCore( spool_dir=self.directory, poll_interval="0.05", idle_timeout="5.0" ) )
+
+    def tearDown(self):
+        self.app.shutdown()
+        shutil.rmtree( self.directory, ignore_errors=True )
+
+    def test_event_timeout(self):
+        self.assertEqual( self.app.eventTimeout(), 5.0 )
+        self.app.active_workflows["r0"] = StubWorkflow( False )
+        self.assertEqual( self.app.eventTimeout(), 5.0 )
+        self.app.active_workflows["r1"] = StubWorkflow( True )
+        self.assertEqual( self.app.eventTimeout(), 0.05 )
+
+    def test_shutdown_stops_loop(self):
+        self.app.start()
+        time.sleep( 0.05 )
+        start = time.time()
+        self.app.shutdown()
+        self.app.join( 2.0 )
+        self.assertFalse( self.app.is_alive() )
+        self.assertLess( time.time() - start, 1.0 )
+        self.assertEqual( self.app.wakeup._reader.fileno(), -1 )
+
+class TestStatusJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.journal = StatusJournal( 4 )
+
+    def test_long_poll(self):
+        threading.Timer( 0.05, self.journal.record, ( "r0", "completed" ) ).start()
+        start = time.time()
+        cursor, events, reset = self.journal.since( 0, timeout=5.0 )
+        self.assertLess( time.time() - start, 1.0 )
+        self.assertEqual( ( cursor, events, reset ), ( 1, [ dict( rid="r0", status="completed" ) ], False ) )
+        self.assertEqual( self.journal.since( cursor, timeout=0.05 ), ( 1, [], False ) )
+
+    def test_filtered_by_rid(self):
+        threading.Timer( 0.05, self.journal.record, ( "r1", "executing" ) ).start()
+        threading.Timer( 0.1, self.journal.record, ( "r0", "error" ), dict( message="failed" ) ).start()
+        cursor, events, reset = self.journal.since( 0, { "r0" }, timeout=5.0 )
+        self.assertEqual( ( cursor, events ), ( 2, [ dict( rid="r0", status="error", message="failed" ) ] ) )
+
+    def test_gap_reported(self):
+        for index in range( 6 ): self.journal.record( f"r{index}", "executing" )
+        self.assertEqual( self.journal.oldest, 3 )
+        cursor, events, reset = self.journal.since( 1, timeout=0 )
+        self.assertTrue( reset )
+        self.assertEqual( ( cursor, [ event["rid"] for event in events ] ), ( 6, [ "r2", "r3", "r4", "r5" ] ) )
+        self.assertFalse( self.journal.since( 2, timeout=0 )[2] )
+        self.assertTrue( StatusJournal().since( 6, timeout=0 )[2] )       # Journal restarted behind the reader
@@ -0,0 +1,93 @@
+import unittest
+from typing import List
+from stratus.app.graph import DGNode, DependencyGraph, Connection
+
+def node( id: str, inputs: List[str], outputs: List[str] ) -> DGNode:
+    return DGNode( inputs, outputs, id=id )
+
+def edges( dgraph: DependencyGraph ):
+    return sorted( ( conn.src_nid, conn.dest_nid, conn.id ) for nid in dgraph.ids for conn in dgraph.getConnections( nid, Connection.OUTGOING ) )
+
+class TestLinking(unittest.TestCase):
+
+    def test_links_in_any_order(self):
+        nodes = [ node( "n0", [ "s0" ], [ "r0" ] ), node( "n1", [ "r0" ], [ "r1" ] ), node( "n2", [ "r0", "r1" ], [ "r2" ] ) ]
+        expected = [ ( "n0", "n1", "r0" ), ( "n0", "n2", "r0" ), ( "n1", "n2", "r1" ) ]
+        for order in ( nodes, list( reversed( nodes ) ), [ nodes[2], nodes[0], nodes[1] ] ):
+            dgraph = DependencyGraph()
+            for dnode in order: dgraph._addDGNode( dnode )
+            self.assertEqual( edges( dgraph ), expected )
+
+    def test_remove_unlinks(self):
+        dgraph = DependencyGraph()
+        for dnode in ( node( "n0", [ "s0" ], [ "r0" ] ), node( "n1", [ "r0" ], [ "r1" ] ), node( "n2", [ "r1" ], [ "r2" ] ) ): dgraph._addDGNode( dnode )
+        dgraph.remove( [ "n1" ] )
+        self.assertEqual( edges( dgraph ), [] )
+        dgraph._addDGNode( node( "n3", [ "r0" ], [ "r1" ] ) )
+        self.assertEqual( edges( dgraph ), [ ( "n0", "n3", "r0" ), ( "n3", "n2", "r1" ) ] )
+
+    def test_filter(self):
+        dgraph = DependencyGraph()
+        for dnode in ( node( "n0", [ "s0" ], [ "r0" ] ), node( "n1", [ "r0" ], [ "r1" ] ), node( "n2", [ "r1" ], [ "r2" ] ) ): dgraph._addDGNode( dnode )
+        subgraph = dgraph.filter( { "n1", "n2" } )
+        self.assertEqual( edges( subgraph ), [ ( "n1", "n2", "r1" ) ] )
+        self.assertEqual( edges( dgraph ), [ ( "n0", "n1", "r0" ), ( "n1", "n2", "r1" ) ] )
+
+class TestQueryCache(unittest.TestCase):
+
+    def setUp(self):
+        self.dgraph = DependencyGraph()
+        for dnode in ( node( "n0", [ "s0" ], [ "r0" ] ), node( "n1", [ "r0" ], [ "r1" ] ) ): self.dgraph._addDGNode( dnode )
+
+    def test_queries_are_memoized(self):
+        self.assertIs( self.dgraph.getInputs(), self.dgraph.getInputs() )
+        self.assertIs( self.dgraph.getConnections( "n0", Connection.OUTGOING ), self.dgraph.getConnections( "n0", Connection.OUTGOING ) )
+        self.assertIsNot( self.dgraph.getConnections( "n0", Connection.OUTGOING ), self.dgraph.getConnections( "n1", Connection.OUTGOING ) )
+
+    def test_mutation_invalidates(self):
+        self.assertEqual( self.dgraph.getOutputNode(), "n1" )
+        self.dgraph._addDGNode( node( "n2", [ "r1" ], [ "r2" ] ) )
+        self.assertEqual( self.dgraph.getOutputNode(), "n2" )
+        self.assertEqual( [ conn.dest_nid for conn in self.dgraph.getConnections( "n1", Connection.OUTGOING ) ], [ "n2" ] )
+        self.dgraph.remove( [ "n2" ] )
+        self.assertEqual( self.dgraph.getOutputNode(), "n1" )
+        self.assertEqual( self.dgraph.getConnections( "n1", Connection.OUTGOING ), [] )
+        self.assertEqual( [ ( conn.id, conn.dest_nid ) for conn in self.dgraph.getInputs() ], [ ( "s0", "n0" ) ] )
+
+class TestDAG(unittest.TestCase):
+    """ The compact DAG must answer the same queries as the networkx DiGraph it replaced """
+
+    def setUp(self):
+        import networkx as nx
+        self.nx = nx
+        self.dgraph = DependencyGraph( allow_multiple_outputs=True )
+        for dnode in ( node( "n0", [ "s0" ], [ "r0" ] ), node( "n1", [ "r0" ], [ "r1" ] ), node( "n2", [ "r0" ], [ "r2" ] ),
+                       node( "n3", [ "r1", "r2" ], [ "r3" ] ), node( "n4", [ "s1" ], [ "r4" ] ) ): self.dgraph._addDGNode( dnode )
+        self.reference = self.dgraph.toNetworkx()
+
+    def test_adjacency(self):
+        for nid in self.dgraph.ids:
+            self.assertEqual( sorted( self.dgraph.predecessors( nid ) ), sorted( self.reference.predecessors( nid ) ) )
+            self.assertEqual( sorted( self.dgraph.successors( nid ) ), sorted( self.reference.successors( nid ) ) )
+            self.assertEqual( sorted( self.dgraph.graph.in_edges( nid ) ), sorted( self.reference.in_edges( nid ) ) )
+            self.assertEqual( sorted( self.dgraph.graph.out_edges( nid ) ), sorted( self.reference.out_edges( nid ) ) )
+        self.assertTrue( self.dgraph.has_predecessor( "n3", "n1" ) )
+        self.assertFalse( self.dgraph.has_successor( "n3", "n1" ) )
+
+    def test_components_and_order(self):
+        self.assertEqual( sorted( map( sorted, self.dgraph.connectedComponents() ) ), sorted( map( sorted, self.nx.weakly_connected_components( self.reference ) ) ) )
+        order = self.dgraph.topologicalOrder()
+        self.assertEqual( sorted( order ), sorted( self.reference.nodes ) )
+        for src, dest in self.reference.edges: self.assertLess( order.index( src ), order.index( dest ) )
+
+    def test_cycle_detected(self):
+        self.dgraph._addDGNode( node( "n5", [ "r3" ], [ "s0" ] ) )
+        self.assertFalse( self.nx.is_directed_acyclic_graph( self.dgraph.toNetworkx() ) )
+        with self.assertRaises( Exception ): self.dgraph.topologicalOrder()
+
+    def test_copy_on_write(self):
+        copy = self.dgraph.graph.copy()
+        copy.remove_node( "n1" )
+        self.assertTrue( self.dgraph.graph.has_edge( "n0", "n1" ) )
+        self.assertFalse( copy.has_node( "n1" ) )
+        self.assertEqual( sorted( copy.predecessors( "n3" ) ), [ "n2" ] )
@@ -0,0 +1,59 @@
+import unittest, threading
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from stratus.util.http import getSession, isIdempotent, PooledSession
+
+class FlakyHandler(BaseHTTPRequestHandler):
+    """ Fails the first 'failures' requests with a 503, counting requests and client connections """
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup( self )
+        self.server.connections += 1
+
+    def do_GET(self):
+        self.server.requests += 1
+        failed = self.server.requests <= self.server.failures
+        body = b"busy" if failed else b"ok"
+        self.send_response( 503 if failed else 200 )
+        self.send_header( "Content-Length", str( len( body ) ) )
+        self.end_headers()
+        self.wfile.write( body )
+
+    def log_message( self, format, *args ): pass
+
+class TestPooledSessions(unittest.TestCase):
+
+    def setUp(self):
+        self.server = HTTPServer( ( "127.0.0.1", 0 ), FlakyHandler )
+        self.server.requests, self.server.connections, self.server.failures = 0, 0, 0
+        threading.Thread( target=self.server.serve_forever, daemon=True ).start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_shared_per_host(self):
+        session = getSession( self.url + "/core/status" )
+        self.assertIs( getSession( self.url + "/wps/cwt" ), session )
+        self.assertIsNot( getSession( self.url + "/core/exe", idempotent=False ), session )
+        self.assertIsNot( getSession( "http://127.0.0.2:80/core" ), session )
+
+    def test_keep_alive(self):
+        session = PooledSession()
+        for iteration in range( 5 ): self.assertEqual( session.get( self.url ).text, "ok" )
+        self.assertEqual( ( self.server.requests, self.server.connections ), ( 5, 1 ) )
+
+    def test_idempotent_requests_retried(self):
+        self.server.failures = 2
+        response = PooledSession( backoff=0 ).get( self.url )
+        self.assertEqual( ( response.status_code, self.server.requests ), ( 200, 3 ) )
+
+    def test_execute_requests_not_resent(self):
+        self.server.failures = 2
+        response = PooledSession( backoff=0, idempotent=False ).get( self.url )
+        self.assertEqual( ( response.status_code, self.server.requests ), ( 503, 1 ) )
+
+    def test_is_idempotent(self):
+        self.assertTrue( isIdempotent( dict( request="GetCapabilities" ) ) )
+        self.assertFalse( isIdempotent( dict( request="Execute" ) ) )
@@ -0,0 +1,53 @@
+import unittest, tempfile, shutil
+from typing import Dict, List
+from stratus.app.memo import TaskMemo
+from stratus.app.operations import Op, ClientOpSet, WorkflowTask
+from stratus.util.spool import ResultSpool
+
+class StubClient:
+    """ Stands in for a StratusClient: only the attributes used to build workflow tasks """
+
+    def __init__( self, handle: str ):
+        self.handle, self.cid, self.name, self.type, self.parms = handle, handle, handle, "stub", dict( name=handle )
+
+def request( rid: str, reduction: str = "ave", **options ) -> Dict:
+    return dict( rid=rid, cid="c0", domain=[ dict( name="d0", lat=dict( start=0, end=10 ) ) ], input=[ dict( uri="file:///data/tas.nc", name="tas:v0" ) ],
+                 operation=[ dict( name="a:subset", input="v0", domain="d0", result=f"s-{rid}" ), dict( name=f"b:{reduction}", input=f"s-{rid}", axes="t", result=f"o-{rid}" ) ],
+                 **options )
+
+def tasks( request: Dict ) -> List[WorkflowTask]:
+    wtasks = []
+    for spec, handle in zip( request["operation"], ( "A", "B" ) ):
+        opset = ClientOpSet( request, StubClient( handle ) )
+        opset.add( Op( **spec ) )
+        wtasks.append( WorkflowTask( opset ) )
+    return wtasks
+
+def keys( memo: TaskMemo, request: Dict ) -> List[str]:
+    wtasks = tasks( request )
+    task_keys = memo.taskKeys( request, wtasks )
+    return [ task_keys[wtask.id] for wtask in wtasks ]
+
+class TestTaskMemo(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.memo = TaskMemo( ResultSpool( self.directory ), **{ "memo.enabled": "true" } )
+
+    def tearDown(self):
+        shutil.rmtree( self.directory, ignore_errors=True )
+
+    def test_keys_are_stable_across_requests(self):
+        self.assertEqual( keys( self.memo, request( "r0" ) ), keys( self.memo, request( "r1" ) ) )
+
+    def test_keys_follow_the_sub_dag(self):
+        ( subset0, ave0 ), ( subset1, max1 ) = keys( self.memo, request( "r0" ) ), keys( self.memo, request( "r1", "max" ) )
+        self.assertEqual( subset0, subset1 )
+        self.assertNotEqual( ave0, max1 )
+
+    def test_keys_include_request_options(self):
+        self.assertNotEqual( keys( self.memo, request( "r0" ) ), keys( self.memo, request( "r0", engine="dask" ) ) )
+
+    def test_disabled(self):
+        memo = TaskMemo( ResultSpool( self.directory ) )
+        self.assertEqual( memo.taskKeys( request( "r0" ), tasks( request( "r0" ) ) ), {} )
@@ -0,0 +1,99 @@
+import unittest
+from typing import Dict, List
+from stratus.app.client import StratusClient
+from stratus.app.operations import Op, ClientOpSet
+from stratus.app.placement import PlacementEngine
+
+class StubClient(StratusClient):
+    """ Client that is only placed, never executed """
+
+    def __init__( self, name: str, **kwargs ):
+        StratusClient.__init__( self, "stub", name=name, cid=name, **kwargs )
+
+    def request( self, request: Dict, inputs = None, **kwargs ): raise NotImplementedError()
+
+    def status( self, **kwargs ): return None
+
+    def capabilities( self, type: str, **kwargs ): return {}
+
+REQUEST = dict( rid="r0", cid="c0", input=[ dict( uri="file:///data/tas.nc", name="tas:v0" ) ] )
+
+def opsets( clients: List[StratusClient], *specs: Dict ) -> Dict[str,ClientOpSet]:
+    ops = [ Op( **spec ) for spec in specs ]
+    result = {}
+    for client in clients:
+        opset = ClientOpSet( REQUEST, client )
+        for op in ops: opset.add( op )
+        result[client.handle] = opset
+    return result
+
+def placement( placed: List[ClientOpSet] ) -> Dict[str,List[str]]:
+    return { opset.client.name: sorted( op.name for op in opset ) for opset in placed }
+
+CHAIN = ( dict( name="a:subset", input="v0", result="s" ), dict( name="a:ave", input="s", result="o" ) )
+
+class TestPlacement(unittest.TestCase):
+
+    def test_unknown_engine(self):
+        with self.assertRaises( AssertionError ): PlacementEngine.create( "random" )
+
+    def test_greedy_covers_each_op_once(self):
+        placed = PlacementEngine.create( "greedy" ).place( opsets( [ StubClient( "c1" ), StubClient( "c2" ) ], *CHAIN ) )
+        self.assertEqual( sorted( op.name for opset in placed for op in opset ), [ "ave", "subset" ] )
+        self.assertEqual( len( placed ), 1 )
+
+    def test_cost_hints(self):
+        slow, fast = StubClient( "slow", cost="10" ), StubClient( "fast", cost="1" )
+        placed = PlacementEngine.create( "cost" ).place( opsets( [ slow, fast ], *CHAIN ) )
+        self.assertEqual( placement( placed ), dict( fast=[ "ave", "subset" ] ) )
+
+    def test_cost_uses_measured_latency(self):
+        c1, c2 = StubClient( "c1", cost="1" ), StubClient( "c2", cost="1" )
+        c1.stats.finished( 20.0 )
+        placed = PlacementEngine.create( "cost" ).place( opsets( [ c1, c2 ], *CHAIN ) )
+        self.assertEqual( placement( placed ), dict( c2=[ "ave", "subset" ] ) )
+
+    def test_heft_matches_exhaustive_search(self):
+        clients = [ StubClient( "c1", cost="1" ), StubClient( "c2", cost="3" ), StubClient( "c3", **{ "cost.a.ave": "0.5", "cost": "4" } ) ]
+        exhaustive = PlacementEngine.create( "cost" ).place( opsets( clients, *CHAIN ) )
+        heft = PlacementEngine.create( "cost", **{ "placement.exhaustive_limit": "0" } ).place( opsets( clients, *CHAIN ) )
+        self.assertEqual( placement( exhaustive ), placement( heft ) )
+
+class TestBalancedPlacement(unittest.TestCase):
+    # Two independent groups of ops, each of which either client can handle
+    GROUPS = ( dict( name="a:subset", input="v0", result="s0" ), dict( name="a:ave", input="s0", result="o0" ),
+               dict( name="a:max", input="v0", result="o1" ) )
+
+    def setUp(self):
+        self.clients = [ StubClient( "c1" ), StubClient( "c2" ) ]
+
+    def engine( self, mode: str ) -> PlacementEngine:
+        return PlacementEngine.create( "balanced", **{ "placement.balance": mode } )
+
+    def test_unknown_mode(self):
+        with self.assertRaises( AssertionError ): self.engine( "random" )
+
+    def test_groups_spread_across_clients(self):
+        for mode in ( "round_robin", "least_outstanding", "p2c" ):
+            placed = placement( self.engine( mode ).place( opsets( self.clients, *self.GROUPS ) ) )
+            self.assertEqual( sorted( placed.keys() ), [ "c1", "c2" ], mode )
+            self.assertEqual( sorted( placed.values() ), [ [ "ave", "subset" ], [ "max" ] ], mode )
+
+    def test_least_outstanding(self):
+        for iteration in range( 3 ): self.clients[0].stats.started()
+        placed = self.engine( "least_outstanding" ).place( opsets( self.clients, dict( name="a:max", input="v0", result="o1" ) ) )
+        self.assertEqual( placement( placed ), dict( c2=[ "max" ] ) )
+
+    def test_round_robin(self):
+        engine = self.engine( "round_robin" )
+        names = [ list( placement( engine.place( opsets( self.clients, dict( name="a:max", input="v0", result="o1" ) ) ) ) ) for iteration in range( 4 ) ]
+        self.assertEqual( names, [ [ "c1" ], [ "c2" ], [ "c1" ], [ "c2" ] ] )
+
+    def test_fallback_when_no_client_handles_the_group(self):
+        specs = [ Op( **spec ) for spec in CHAIN ]
+        clientOpsets = {}
+        for client, op in zip( self.clients, specs ):
+            clientOpsets[client.handle] = ClientOpSet( REQUEST, client )
+            clientOpsets[client.handle].add( op )
+        placed = self.engine( "least_outstanding" ).place( clientOpsets )
+        self.assertEqual( placement( placed ), dict( c1=[ "subset" ], c2=[ "ave" ] ) )
@@ -0,0 +1,19 @@
+import unittest
+import numpy as np
+from stratus.handlers.zeromq import protocol
+
+class TestProtocol(unittest.TestCase):
+
+    def test_round_trip(self):
+        body = dict( rid="r0", operation=[ dict( name="xop:ave", axes="t" ) ], bounds=np.array( [ 1.5, 2.5 ] ), scale=np.float32( 2.0 ), data=b"\x00\x01" )
+        envelope, rid, type, unpacked = protocol.unpack( [ b"identity", b"" ] + protocol.pack( "r0", "exe", body ) )
+        self.assertEqual( ( envelope, rid, type ), ( [ b"identity", b"" ], "r0", "exe" ) )
+        self.assertEqual( unpacked, dict( body, bounds=[ 1.5, 2.5 ], scale=2.0 ) )
+
+    def test_version_mismatch(self):
+        frames = protocol.pack( "r0", "exe", {} )
+        frames[0] = b"\x02"
+        with self.assertRaises( protocol.ProtocolError ): protocol.unpack( frames )
+
+    def test_malformed(self):
+        with self.assertRaises( protocol.ProtocolError ): protocol.unpack( [ b"r0", b"exe" ] )
@@ -0,0 +1,78 @@
+import unittest
+import numpy as np
+import xarray as xa
+from flask import Flask
+from stratus.handlers.rest.api.core.app import RestAPI
+from stratus.util.encoding import ResultStreamDecoder
+from stratus_endpoint.handler.base import TaskResult
+
+class StoredResult:
+
+    def getResult( self, **kwargs ):
+        return TaskResult( dict( rid="r0" ), [ xa.Dataset( { "v": ( ( "x", ), np.arange( 10000.0 ) ) } ) ] )
+
+    def exception(self): return None
+
+class StubApp:
+    """ Stands in for a StratusAppBase holding one completed result """
+
+    def __init__(self):
+        self.registeredRequests = { "r0" }
+        self.cleared = []
+
+    def getResult( self, rid: str ):
+        return StoredResult() if rid in self.registeredRequests else None
+
+    def resultExpired( self, rid: str ) -> bool:
+        return rid == "expired"
+
+    def clearWorkflow( self, rid: str ):
+        self.cleared.append( rid )
+        self.registeredRequests.discard( rid )
+
+class TestResultStreaming(unittest.TestCase):
+
+    def setUp(self):
+        self.app = StubApp()
+        self.api = RestAPI( "core", self.app )
+        flask_app = Flask( "stratus_test" )
+        self.api.instantiate( flask_app )
+        self.client = flask_app.test_client()
+
+    def test_range_resume(self):
+        decoder = ResultStreamDecoder()
+        partial = self.client.get( "/core/result?rid=r0", headers=dict( Range="bytes=0-999" ) )
+        self.assertEqual( partial.status_code, 206 )
+        decoder.feed( partial.data )
+        self.assertFalse( decoder.complete )
+        rest = self.client.get( "/core/result?rid=r0", headers=dict( Range=f"bytes={decoder.received}-" ) )
+        self.assertEqual( rest.status_code, 206 )
+        decoder.feed( rest.data )
+        header, datasets = decoder.result()
+        self.assertEqual( header, dict( rid="r0" ) )
+        self.assertEqual( float( datasets[0].v.sum() ), float( np.arange( 10000.0 ).sum() ) )
+        self.assertEqual( self.app.cleared, [ "r0" ] )
+
+    def test_unsatisfiable_range(self):
+        size = int( self.client.get( "/core/result?rid=r0", headers=dict( Range="bytes=0-0" ) ).headers["Content-Range"].split("/")[1] )
+        response = self.client.get( "/core/result?rid=r0", headers=dict( Range=f"bytes={size+10}-" ) )
+        self.assertEqual( response.status_code, 416 )
+        self.assertEqual( response.headers["Content-Range"], f"bytes */{size}" )
+
+    def test_missing_results(self):
+        self.assertEqual( self.client.get( "/core/result?rid=expired" ).status_code, 404 )
+        self.assertEqual( self.client.get( "/core/result?rid=unknown" ).status_code, 404 )
+
+    def test_concurrent_downloads(self):
+        self.api.chunk_size = 1000
+        partial = self.client.get( "/core/result?rid=r0", headers=dict( Range="bytes=0-4999" ) )
+        chunks = iter( partial.response )
+        next( chunks )
+        complete = self.client.get( "/core/result?rid=r0" )
+        self.assertEqual( ( complete.status_code, len( complete.get_data() ) ), ( 200, int( complete.headers["Content-Length"] ) ) )
+        complete.close()
+        self.assertEqual( self.app.cleared, [] )
+        for chunk in chunks: pass
+        partial.close()
+        self.assertEqual( self.app.cleared, [ "r0" ] )
+        self.assertEqual( ( self.api.result_streams, self.api._stream_readers ), ( {}, {} ) )
@@ -0,0 +1,67 @@
+import unittest, threading
+from typing import Dict, List
+from stratus.app.client import StratusClient
+from stratus.handlers.manager import EpaRouter, Handlers
+
+class StubClient(StratusClient):
+    """ Client that is only routed to, never executed """
+
+    def __init__( self, name: str, epas: List[str] ):
+        StratusClient.__init__( self, "stub", name=name, cid=name )
+        self.setEndpointSpecs( epas )
+
+    def request( self, request: Dict, inputs = None, **kwargs ): raise NotImplementedError()
+
+    def status( self, **kwargs ): return None
+
+    def capabilities( self, type: str, **kwargs ): return {}
+
+class StubService:
+
+    def __init__( self, client: StratusClient ):
+        self._client = client
+        self.created = 0
+
+    def client( self, core, **kwargs ) -> StratusClient:
+        self.created += 1
+        return self._client
+
+def handlers( services: Dict[str,StubService] ) -> Handlers:
+    # Handlers without handler discovery: only the state used for routing
+    instance = Handlers.__new__( Handlers )
+    instance._handlers, instance._internal_clients = services, True
+    instance._router, instance._router_lock, instance._generation = EpaRouter(), threading.Lock(), 0
+    return instance
+
+class TestEpaRouter(unittest.TestCase):
+
+    def setUp(self):
+        self.clients = dict( edas=StubClient( "edas", [ "edas.*" ] ), xop=StubClient( "xop", [ "xop.ave", "xop.max" ] ), any=StubClient( "any", [ "*.ave" ] ) )
+
+    def test_route(self):
+        router = EpaRouter()
+        router.build( self.clients, 0 )
+        self.assertEqual( router.route( "xop.ave" ), [ "xop", "any" ] )
+        self.assertEqual( router.route( "edas.ave" ), [ "edas", "any" ] )
+        self.assertEqual( router.route( "edas.subset" ), [ "edas" ] )
+        self.assertEqual( router.route( "xop.subset" ), [] )
+        self.assertIs( router.route( "xop.ave" ), router.route( "xop.ave" ) )
+
+    def test_route_matches_fnmatch(self):
+        router = EpaRouter()
+        router.build( self.clients, 0 )
+        for epa in ( "xop.ave", "xop.max", "edas.x", "edas", "a.ave", "ave", "xop.avex" ):
+            expected = [ name for name, client in self.clients.items() if any( spec.handles( epa ) for spec in client.getEndpointSpecs() ) ]
+            self.assertEqual( router.route( epa ), expected, epa )
+
+    def test_rebuilt_when_endpoints_change(self):
+        services = { name: StubService( client ) for name, client in self.clients.items() }
+        manager = handlers( services )
+        router = manager.getRouter( None )
+        self.assertIs( manager.getRouter( None ), router )
+        self.assertEqual( services["xop"].created, 1 )
+        self.clients["xop"].setEndpointSpecs( [ "xop.*" ] )
+        rebuilt = manager.getRouter( None )
+        self.assertIsNot( rebuilt, router )
+        self.assertEqual( rebuilt.route( "xop.subset" ), [ "xop" ] )
+        self.assertEqual( router.route( "xop.subset" ), [] )
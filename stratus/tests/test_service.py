@@ -0,0 +1,37 @@
+import unittest, time
+from stratus.handlers.celery.service import WorkerPool, WorkerStats
+
+class TestWorkerPool(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = WorkerPool( "edas", {}, min_concurrency=1, max_concurrency=4, max_latency=2.0, scale_down_delay=0.05 )
+        self.pool.concurrency = 1
+        self.depth = 0
+        self.pool.queueDepth = lambda: self.depth
+        self.pool.resize = lambda target: setattr( self.pool, "concurrency", target )
+
+    def test_grows_with_queue_depth(self):
+        self.depth = 10
+        self.pool.autoscale( WorkerStats() )
+        self.assertEqual( self.pool.concurrency, 4 )
+
+    def test_latency_bump_requires_waiting_tasks(self):
+        stats = WorkerStats()
+        stats.onReceived( "t0", 0.0 )
+        stats.onStarted( "t0", 10.0 )
+        stats.onFinished( "t0" )
+        self.assertGreater( stats.latency, self.pool.max_latency )
+        for iteration in range( 3 ): self.pool.autoscale( stats )
+        self.assertEqual( self.pool.concurrency, 1 )
+        self.depth = 1
+        self.pool.autoscale( stats )
+        self.assertEqual( self.pool.concurrency, 2 )
+
+    def test_shrinks_after_idle_delay(self):
+        self.pool.concurrency = 3
+        stats = WorkerStats()
+        self.pool.autoscale( stats )
+        self.assertEqual( self.pool.concurrency, 3 )
+        time.sleep( 0.1 )
+        self.pool.autoscale( stats )
+        self.assertEqual( self.pool.concurrency, 1 )
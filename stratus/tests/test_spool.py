@@ -0,0 +1,115 @@
+import unittest, tempfile, shutil, os
+import numpy as np
+import xarray as xa
+from flask import Flask
+from stratus.util.spool import ResultSpool
+from stratus.handlers.rest.api.wps.app import RestAPI
+from stratus_endpoint.handler.base import TaskResult, Status
+
+class TestResultSpool(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.spool = ResultSpool( self.directory )
+
+    def tearDown(self):
+        shutil.rmtree( self.directory, ignore_errors=True )
+
+    def test_write_once(self):
+        calls = []
+        def writer( path: str ):
+            calls.append( path )
+            with open( path, "w" ) as file: file.write( "data" )
+        path = self.spool.write( "r0-0", writer )
+        self.assertEqual( self.spool.write( "r0-0", writer ), path )
+        self.assertEqual( len( calls ), 1 )
+        self.assertTrue( self.spool.contains( "r0-0" ) )
+        self.spool.remove( "r0-0" )
+        self.assertFalse( self.spool.contains( "r0-0" ) )
+
+    def test_keys_stay_in_directory(self):
+        path = self.spool.path( "../../etc/passwd" )
+        self.assertEqual( os.path.dirname( path ), self.directory )
+
+    def test_purge_is_scoped_by_prefix(self):
+        other = self.spool.withPrefix( "store" )
+        paths = [ spool.write( "r0", lambda path: open( path, "w" ).close() ) for spool in ( self.spool, other ) ]
+        for path in paths: os.utime( path, ( 0, 0 ) )
+        other.purge()
+        self.assertTrue( os.path.isfile( paths[0] ) )
+        self.assertFalse( os.path.isfile( paths[1] ) )
+
+    def test_distinct_keys_distinct_files(self):
+        self.assertNotEqual( self.spool.path( "a.b" ), self.spool.path( "a_b" ) )
+        self.assertEqual( self.spool.path( "a.b" ), self.spool.path( "a.b" ) )
+
+    def test_key_locks_dropped(self):
+        for index in range( 10 ): self.spool.write( f"r{index}", lambda path: open( path, "w" ).close() )
+        self.assertEqual( self.spool._locks, {} )
+
+class StoredTask:
+
+    def __init__( self, result: TaskResult ):
+        self.result = result
+
+    def getResult( self, **kwargs ): return self.result
+
+class StoredWorkflow:
+
+    def __init__( self, result: TaskResult ):
+        self.task = StoredTask( result )
+
+    def status(self): return Status.COMPLETED
+
+    def getResult(self): return self.task
+
+class StubApp:
+    """ Stands in for a StratusAppBase holding one completed two-dataset result """
+
+    def __init__( self, directory: str ):
+        self.spool = ResultSpool( directory )
+        datasets = [ xa.Dataset( { "v": ( ( "x", ), np.full( 100, float(index) ) ) } ) for index in range( 2 ) ]
+        self.workflows = dict( r0=StoredWorkflow( TaskResult( dict( rid="r0" ), datasets ) ) )
+
+    def getWorkflow( self, rid: str ): return self.workflows.get( rid )
+
+    def clearWorkflow( self, rid: str ): self.workflows.pop( rid, None )
+
+class TestFileCursor(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.api = RestAPI( "wps", StubApp( self.directory ) )
+        flask_app = Flask( "stratus_test" )
+        self.api.instantiate( flask_app )
+        self.client = flask_app.test_client()
+
+    def tearDown(self):
+        shutil.rmtree( self.directory, ignore_errors=True )
+
+    def fetch( self, **kwargs ):
+        response = self.client.get( "/wps/file?rid=r0", **kwargs )
+        data = response.get_data()
+        response.close()
+        return response, data
+
+    def test_sequential_fetch(self):
+        self.assertEqual( [ self.fetch()[0].headers["Results-Remaining"] for index in range( 2 ) ], [ "1", "0" ] )
+        self.assertEqual( ( self.api._file_cursors, self.api._file_counts, self.api._file_accessed ), ( {}, {}, {} ) )
+
+    def test_interrupted_fetch_retried(self):
+        response = self.client.get( "/wps/file?rid=r0" )
+        response.close()                                # Client dropped the connection before the end of the file
+        self.assertEqual( self.fetch()[0].headers["Results-Remaining"], "1" )
+        partial, data = self.fetch( headers=dict( Range="bytes=0-99" ) )
+        self.assertEqual( ( partial.status_code, partial.headers["Results-Remaining"] ), ( 206, "0" ) )
+        rest, data = self.fetch( headers=dict( Range="bytes=100-" ) )
+        self.assertEqual( ( rest.status_code, rest.headers["Results-Remaining"] ), ( 206, "0" ) )
+        self.assertEqual( self.api._file_cursors, {} )
+
+    def test_idle_cursors_expire(self):
+        self.fetch()
+        self.assertEqual( self.api._file_cursors, dict( r0=1 ) )
+        self.api.file_cursor_ttl = -1.0
+        self.api.expireFileCursors()
+        self.assertEqual( ( self.api._file_cursors, self.api._file_counts, self.api._file_accessed ), ( {}, {}, {} ) )
@@ -0,0 +1,114 @@
+import unittest, tempfile, shutil, time, os
+import numpy as np
+import xarray as xa
+from stratus.app.store import ResultStore, StoredWorkflow
+from stratus.util.spool import ResultSpool
+from stratus_endpoint.handler.base import TaskHandle, TaskResult, Status
+MB = 1024 * 1024
+
+class SourceHandle(TaskHandle):
+
+    def __init__( self, dataset: xa.Dataset ):
+        TaskHandle.__init__( self, rid="source" )
+        self.dataset = dataset
+        self.reads = 0
+
+    def getResult( self, **kwargs ):
+        self.reads += 1
+        return TaskResult( dict( reads=self.reads ), [ self.dataset ] )
+
+class CompletedWorkflow:
+
+    def __init__( self, nbytes: int ):
+        self.handle = SourceHandle( xa.Dataset( { "v": ( ( "x", ), np.zeros( nbytes // 8 ) ) } ) )
+
+    def status(self): return Status.COMPLETED
+
+    def getResult(self): return self.handle
+
+class TestResultStore(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.evicted = []
+
+    def tearDown(self):
+        shutil.rmtree( self.directory, ignore_errors=True )
+
+    def store( self, **parms ) -> ResultStore:
+        return ResultStore( ResultSpool( self.directory ), on_evict=self.evicted.append, **parms )
+
+    def fetch( self, store: ResultStore, rid: str ) -> TaskResult:
+        return store[rid].getResult().getResult()
+
+    def test_materialized_on_first_fetch(self):
+        store = self.store()
+        workflow = CompletedWorkflow( MB )
+        store["r0"] = workflow
+        self.assertEqual( workflow.handle.reads, 0 )
+        self.assertEqual( store.stats()["memory_bytes"], 0 )
+        self.fetch( store, "r0" )
+        self.fetch( store, "r0" )
+        self.assertEqual( workflow.handle.reads, 1 )
+        self.assertEqual( store.stats()["memory_bytes"], MB )
+
+    def test_lru_eviction(self):
+        store = self.store( **{ "store.max_entries": "2" } )
+        for rid in ( "r0", "r1" ):
+            store[rid] = CompletedWorkflow( 1024 )
+            time.sleep( 0.01 )
+        store["r0"].getResult()
+        store["r2"] = CompletedWorkflow( 1024 )
+        self.assertEqual( sorted( store ), [ "r0", "r2" ] )
+        self.assertEqual( self.evicted, [ "r1" ] )
+        self.assertTrue( store.expired( "r1" ) )
+
+    def test_ttl_expiry(self):
+        store = self.store( **{ "store.ttl": "0.05" } )
+        store["r0"] = CompletedWorkflow( 1024 )
+        time.sleep( 0.1 )
+        store.enforce()
+        self.assertNotIn( "r0", store )
+        self.assertTrue( store.expired( "r0" ) )
+        self.assertFalse( store.expired( "r1" ) )
+
+    def test_spill_accounting(self):
+        store = self.store( **{ "store.max_mb": "1.5", "store.spill_mb": "0.5" } )
+        for rid in ( "r0", "r1" ):
+            store[rid] = CompletedWorkflow( MB )
+            self.fetch( store, rid )
+        store.enforce()
+        store.flush()
+        stats = store.stats()
+        self.assertEqual( ( stats["memory_bytes"], stats["disk_bytes"], stats["spilled_entries"] ), ( MB, MB, 1 ) )
+        replica: StoredWorkflow = store["r0"].replicate( "r2" )
+        del store["r0"]
+        self.assertEqual( replica.getResult().getResult().popDataset().v.size, MB // 8 )
+        del store["r1"]
+        self.assertEqual( ( store.stats()["memory_bytes"], store.stats()["disk_bytes"] ), ( 0, 0 ) )
+
+    def test_spill_off_caller_thread(self):
+        store = self.store( **{ "store.max_mb": "1.5", "store.spill_mb": "0.5" } )
+        for rid in ( "r0", "r1" ):
+            store[rid] = CompletedWorkflow( MB )
+            self.fetch( store, rid )
+        store._spiller.submit( time.sleep, 0.2 )          # Holds the spill thread
+        start = time.time()
+        store.enforce()
+        self.assertLess( time.time() - start, 0.1 )
+        self.assertEqual( ( store.stats()["spilled_entries"], len( store._spilling ) ), ( 0, 1 ) )
+        self.assertEqual( self.fetch( store, "r0" ).popDataset().v.size, MB // 8 )
+        store.flush()
+        self.assertEqual( store.stats()["spilled_entries"], 1 )
+
+    def test_removed_while_spilling(self):
+        store = self.store( **{ "store.max_mb": "1.5", "store.spill_mb": "0.5" } )
+        for rid in ( "r0", "r1" ):
+            store[rid] = CompletedWorkflow( MB )
+            self.fetch( store, rid )
+        store._spiller.submit( time.sleep, 0.1 )
+        store.enforce()
+        del store["r0"]
+        store.flush()
+        self.assertEqual( os.listdir( self.directory ), [] )
+        self.assertEqual( ( store.stats()["memory_bytes"], store.stats()["disk_bytes"], store._spilling_bytes ), ( MB, 0, 0 ) )
@@ -0,0 +1,85 @@
+import unittest
+from typing import Dict, List
+from stratus.app.client import StratusClient, stratusrequest
+from stratus.app.operations import Op, ClientOpSet, WorkflowTask, StratusWorkflow
+from stratus_endpoint.handler.base import TaskHandle, TaskResult, Status
+
+class ManualHandle(TaskHandle):
+    """ Task handle whose status is set by the test """
+
+    def __init__( self, name: str, **kwargs ):
+        TaskHandle.__init__( self, **kwargs )
+        self.name = name
+        self._status = Status.EXECUTING
+
+    def getResult( self, **kwargs ): return TaskResult( dict( name=self.name ), [] )
+
+    def status(self): return self._status
+
+    def exception(self): return Exception( self.name ) if self._status == Status.ERROR else None
+
+class ManualClient(StratusClient):
+
+    def __init__( self, **kwargs ):
+        StratusClient.__init__( self, "manual", name="manual", **kwargs )
+        self.handles: Dict[str,ManualHandle] = {}
+
+    @stratusrequest
+    def request( self, request: Dict, inputs: List[TaskResult] = None, **kwargs ) -> TaskHandle:
+        name = request["operations"][0]["name"]
+        self.handles[name] = ManualHandle( name, rid=request["rid"] )
+        return self.handles[name]
+
+    def status( self, **kwargs ): return Status.EXECUTING
+
+    def capabilities( self, type: str, **kwargs ): return {}
+
+def workflow( client: ManualClient, *specs: Dict ) -> StratusWorkflow:
+    request = dict( rid="r0", cid="c0", operation=list( specs ) )
+    wtasks = []
+    for spec in specs:
+        opset = ClientOpSet( request, client )
+        opset.add( Op( **spec ) )
+        wtasks.append( WorkflowTask( opset ) )
+    return StratusWorkflow( nodes=wtasks, request=request )
+
+class TestReadyQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.client = ManualClient()
+        # src -> ( left, right ) -> join
+        self.workflow = workflow( self.client, dict( name="a:src", input="v0", result="s" ), dict( name="a:left", input="s", result="l" ),
+                                               dict( name="a:right", input="s", result="r" ), dict( name="a:join", input="l,r", result="o" ) )
+
+    def complete( self, *names: str ):
+        for name in names: self.client.handles[name]._status = Status.COMPLETED
+
+    def test_tasks_launch_when_dependencies_complete(self):
+        self.assertFalse( self.workflow.update() )
+        self.assertEqual( sorted( self.client.handles ), [ "a:src" ] )
+        self.assertFalse( self.workflow.update() )
+        self.assertEqual( sorted( self.client.handles ), [ "a:src" ] )
+        self.complete( "a:src" )
+        self.assertFalse( self.workflow.update() )
+        self.assertEqual( sorted( self.client.handles ), [ "a:left", "a:right", "a:src" ] )
+        self.complete( "a:left" )
+        self.assertFalse( self.workflow.update() )
+        self.assertNotIn( "a:join", self.client.handles )
+        self.complete( "a:right" )
+        self.assertFalse( self.workflow.update() )
+        self.complete( "a:join" )
+        self.assertTrue( self.workflow.update() )
+        self.assertEqual( self.workflow.status(), Status.COMPLETED )
+        self.assertEqual( self.workflow.getResult().name, "a:join" )
+        self.assertEqual( self.client.stats.outstanding, 0 )
+        self.assertEqual( self.client.stats.completed, 4 )
+
+    def test_error_stops_workflow(self):
+        self.workflow.update()
+        self.complete( "a:src" )
+        self.workflow.update()
+        self.client.handles["a:left"]._status = Status.ERROR
+        self.assertTrue( self.workflow.update() )
+        self.assertEqual( self.workflow.status(), Status.ERROR )
+        self.assertNotIn( "a:join", self.client.handles )
+        self.assertEqual( self.client.stats.outstanding, 0 )
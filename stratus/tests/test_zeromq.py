@@ -0,0 +1,221 @@
+import unittest, tempfile, shutil, socket, time, os, threading
+import numpy as np
+import xarray as xa
+import zmq, zmq.auth
+from stratus.handlers.zeromq.responder import StratusZMQResponder
+from stratus.handlers.zeromq.client import ResponseManager, ResponseChannel, ConnectionMode
+from stratus.util.encoding import loadHeader
+from stratus.handlers.zeromq import protocol
+from stratus_endpoint.handler.base import TaskHandle, TaskResult, Status
+
+def createCertificates( directory: str ):
+    # Key layout expected by the responder ( server secret ) and ConnectionMode ( client secret, server public )
+    for subdir in ( "public_keys", "private_keys" ): os.makedirs( os.path.join( directory, subdir ) )
+    for name in ( "server", "client" ):
+        public_file, secret_file = zmq.auth.create_certificates( directory, name )
+        shutil.move( public_file, os.path.join( directory, "public_keys" ) )
+        shutil.move( secret_file, os.path.join( directory, "private_keys" ) )
+
+def freePort() -> int:
+    with socket.socket() as sock:
+        sock.bind( ( "127.0.0.1", 0 ) )
+        return sock.getsockname()[1]
+
+def sampleDataset( size: int ) -> xa.Dataset:
+    return xa.Dataset( { "v": ( ( "x", ), np.arange( size, dtype=np.float64 ) ) }, attrs=dict( source="test" ) )
+
+class ZMQTestCase(unittest.TestCase):
+    """ A responder and a client response manager connected over authenticated loopback sockets """
+    responder_parms = {}
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        createCertificates( self.directory )
+        self.context = zmq.Context()
+        self.response_port, self.request_port = freePort(), freePort()
+        self.responder = StratusZMQResponder( self.context, self.response_port, client_address="127.0.0.1", certificate_path=self.directory, **self.responder_parms )
+        self.responder.start()
+        self.notified = []
+        self.manager = ResponseManager( self.context, ConnectionMode( certificate_path=self.directory ), "127.0.0.1", self.request_port, self.response_port,
+                                        self.directory, listener=self.notified.append )
+        self.manager.start()
+
+    def tearDown(self):
+        self.manager.term()
+        self.responder.close_connection()
+        self.manager.join( 5.0 )
+        self.responder.join( 5.0 )
+        self.context.destroy( linger=0 )
+        shutil.rmtree( self.directory, ignore_errors=True )
+
+    def register( self, *rids: str ):
+        channels = [ self.manager.register( rid ) for rid in rids ]
+        time.sleep( 0.3 )       # Subscriptions reach the responder asynchronously
+        return channels
+
+class TestDataTransport(ZMQTestCase):
+
+    def test_dataset_packet(self):
+        channel, = self.register( "r0" )
+        dataset = sampleDataset( 1000 )
+        self.responder.sendDataPacket( self.responder.createDataPacket( "r0", dataset ) )
+        result = channel.getResult( block=True, timeout=5.0 )
+        self.assertEqual( result.header["type"], "xarray" )
+        xa.testing.assert_identical( result.data[0], dataset )
+        deadline = time.time() + 5.0
+        while ( "r0" not in self.notified ) and ( time.time() < deadline ): time.sleep( 0.01 )     # The listener is called after the result is posted
+        self.assertIn( "r0", self.notified )
+
+    def test_error_message(self):
+        channel, = self.register( "r0" )
+        self.responder.sendErrorMessage( "r0", "failed" )
+        deadline = time.time() + 5.0
+        while ( channel.exception() is None ) and ( time.time() < deadline ): time.sleep( 0.01 )
+        self.assertEqual( str( channel.exception() ), "failed" )
+
+class ThreadRecordingHandle(TaskHandle):
+    """ Completed result that records the thread reading it """
+
+    def __init__( self, dataset: xa.Dataset ):
+        TaskHandle.__init__( self, rid="r0" )
+        self.dataset = dataset
+        self.threads = []
+
+    def getResult( self, **kwargs ):
+        self.threads.append( threading.current_thread() )
+        return TaskResult( dict( rid="r0" ), [ self.dataset ] )
+
+class CompletedWorkflow:
+
+    def __init__( self, handle: TaskHandle ): self.handle = handle
+
+    def status(self): return Status.COMPLETED
+
+    def getResult(self): return self.handle
+
+class TestCompletedWorkflows(ZMQTestCase):
+
+    def test_results_read_on_responder_thread(self):
+        channel, = self.register( "r0" )
+        dataset = sampleDataset( 1000 )
+        handle = ThreadRecordingHandle( dataset )
+        workflows = dict( r0=CompletedWorkflow( handle ) )
+        self.assertEqual( self.responder.processWorkflows( workflows ), [] )
+        xa.testing.assert_identical( channel.getResult( block=True, timeout=5.0 ).data[0], dataset )
+        self.assertEqual( handle.threads, [ self.responder ] )
+        self.assertEqual( self.responder.processWorkflows( workflows ), [ "r0" ] )
+        self.assertEqual( len( handle.threads ), 1 )
+
+class TestChunkedTransport(ZMQTestCase):
+    responder_parms = dict( chunk_size=1000 )
+
+    def test_chunked_packet(self):
+        channel, = self.register( "r0" )
+        dataset = sampleDataset( 10000 )
+        self.responder.sendDataPacket( self.responder.createDataPacket( "r0", dataset ) )
+        result = channel.getResult( block=True, timeout=5.0 )
+        self.assertEqual( result.header["nchunks"], 80 )
+        xa.testing.assert_identical( result.data[0], dataset )
+
+class StalledSocket:
+    """ Stands in for the XPUB socket of a subscriber that stops reading after the first few chunks """
+
+    class Frame:
+        def __init__( self, data ): self.buffer = memoryview( data )
+
+    def __init__( self, nchunks: int ):
+        self.nchunks = nchunks
+        self.messages = []
+
+    def send_multipart( self, msg, flags=0, copy=True ):
+        header = loadHeader( msg[1] )
+        if ( header.get( "type" ) == "chunk" ) and ( header["seq"] >= self.nchunks ): raise zmq.Again()
+        self.messages.append( ( header, [ self.Frame( frame ) for frame in msg[2:] ] ) )
+
+    def poll( self, timeout=None, flags=zmq.POLLIN ): return 0
+
+    def close(self): pass
+
+class TestStalledSubscriber(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        createCertificates( self.directory )
+        self.context = zmq.Context()
+        self.responder = StratusZMQResponder( self.context, freePort(), client_address="127.0.0.1", certificate_path=self.directory, chunk_size=1000, send_timeout=0.2 )
+        self.responder.socket.close()
+
+    def tearDown(self):
+        self.context.destroy( linger=0 )
+        shutil.rmtree( self.directory, ignore_errors=True )
+
+    def test_abandoned_with_error_trailer(self):
+        self.responder.socket = StalledSocket( 2 )
+        start = time.time()
+        self.responder.streamDataPacket( self.responder.createDataPacket( "r0", sampleDataset( 10000 ) ) )
+        self.assertLess( time.time() - start, 2.0 )
+        types = [ header.get( "type" ) for header, frames in self.responder.socket.messages ]
+        self.assertEqual( types, [ "xarray", "chunk", "chunk", "trailer" ] )
+        channel = ResponseChannel( "r0" )
+        for header, frames in self.responder.socket.messages: channel.processResponse( header, frames )
+        self.assertIn( "abandoned", str( channel.exception() ) )
+        self.assertIsNone( channel.getResult( block=False ) )
+
+class TestResponseMultiplexing(ZMQTestCase):
+
+    def test_responses_routed_by_rid(self):
+        channels = dict( zip( ( "r1", "r2" ), self.register( "r1", "r2" ) ) )
+        datasets = dict( r1=sampleDataset( 100 ), r2=sampleDataset( 200 ), r10=sampleDataset( 300 ) )
+        for rid in ( "r10", "r2", "r1" ): self.responder.sendDataPacket( self.responder.createDataPacket( rid, datasets[rid] ) )
+        for rid, channel in channels.items():
+            xa.testing.assert_identical( channel.getResult( block=True, timeout=5.0 ).data[0], datasets[rid] )
+            self.assertIsNone( channel.getResult( block=True, timeout=0.2 ) )
+        self.assertNotIn( "r10", self.notified )
+
+    def test_released_channel(self):
+        channel, = self.register( "r0" )
+        self.manager.release( "r0" )
+        self.responder.sendDataPacket( self.responder.createDataPacket( "r0", sampleDataset( 100 ) ) )
+        self.assertIsNone( channel.getResult( block=True, timeout=0.5 ) )
+
+    def test_submit_after_term_fails(self):
+        self.manager.term()
+        self.manager.join( 5.0 )
+        future = self.manager.submit( "r0", [ b"request" ] )
+        with self.assertRaises( Exception ): future.result( 1.0 )
+
+class TestRequestChannel(ZMQTestCase):
+
+    def setUp(self):
+        ZMQTestCase.setUp( self )
+        # Server side of the request channel, as bound by the zeromq StratusApp
+        self.router: zmq.Socket = self.context.socket( zmq.ROUTER )
+        server_public, server_secret = zmq.auth.load_certificate( os.path.join( self.directory, "private_keys", "server.key_secret" ) )
+        self.router.curve_secretkey, self.router.curve_publickey, self.router.curve_server = server_secret, server_public, True
+        self.router.bind( f"tcp://127.0.0.1:{self.request_port}" )
+
+    def tearDown(self):
+        self.router.close( linger=0 )
+        ZMQTestCase.tearDown( self )
+
+    def test_pipelined_requests(self):
+        futures = { rid: self.manager.submit( rid, protocol.pack( rid, "exe", dict( n=index ) ) ) for index, rid in enumerate( ( "r0", "r1", "r2" ) ) }
+        received = []
+        while len( received ) < 3:
+            self.assertTrue( self.router.poll( 5000 ) )
+            received.append( protocol.unpack( self.router.recv_multipart() ) )
+        self.assertEqual( [ ( rid, type, body ) for envelope, rid, type, body in received ], [ ( "r0", "exe", dict( n=0 ) ), ( "r1", "exe", dict( n=1 ) ), ( "r2", "exe", dict( n=2 ) ) ] )
+        self.assertFalse( any( future.done() for future in futures.values() ) )
+        for envelope, rid, type, body in reversed( received ):
+            self.router.send_multipart( envelope + protocol.pack( rid, "response", dict( status="executing", n=body["n"] ) ) )
+        for index, rid in enumerate( ( "r0", "r1", "r2" ) ):
+            self.assertEqual( futures[rid].result( 5.0 ), dict( status="executing", n=index ) )
+
+
+    def test_malformed_reply_dropped(self):
+        future = self.manager.submit( "r0", protocol.pack( "r0", "exe", {} ) )
+        self.assertTrue( self.router.poll( 5000 ) )
+        envelope, rid, type, body = protocol.unpack( self.router.recv_multipart() )
+        self.router.send_multipart( envelope + [ b"\x07", b"r0", b"response", b"" ] )
+        self.router.send_multipart( envelope + protocol.pack( "r0", "response", dict( status="ok" ) ) )
+        self.assertEqual( future.result( 5.0 ), dict( status="ok" ) )
@@ -0,0 +1,150 @@
+""" Framed binary encoding of xarray Datasets: a JSON header describing the variables ( dims, dtype, shape, attrs )
+    plus one raw buffer per variable, so that arrays can be transferred without pickling and rebuilt with np.frombuffer. """
+import json, struct
+from typing import List, Dict, Any, Tuple, Sequence, Iterator
+import numpy as np
+import xarray as xa
+
+def _jsonable( value: Any ) -> Any:
+    if isinstance( value, np.generic ): return value.item()
+    if isinstance( value, np.ndarray ): return value.tolist()
+    if isinstance( value, bytes ): return value.decode( 'utf-8', errors='replace' )
+    return str( value )
+
+def _buffer( array: np.ndarray ) -> np.ndarray:
+    """ Flat uint8 view of the array's memory, copying only if the array is not C-contiguous """
+    return np.ascontiguousarray( array ).reshape(-1).view( np.uint8 )
+
+def encodeDataset( dataset: xa.Dataset ) -> Tuple[Dict, List[np.ndarray]]:
+    """ Returns ( header, buffers ), where each variable with a fixed-size dtype references one buffer by index """
+    buffers: List[np.ndarray] = []
+    variables: List[Dict] = []
+    for name, variable in dataset.variables.items():
+        array: np.ndarray = np.asarray( variable.values )
+        spec = dict( name=str(name), dims=[ str(dim) for dim in variable.dims ], shape=list( array.shape ), dtype=array.dtype.str, attrs=dict( variable.attrs ), coord=( name in dataset.coords ) )
+        if array.dtype.hasobject:
+            spec["values"] = array.tolist()
+        else:
+            spec["frame"] = len( buffers )
+            buffers.append( _buffer( array ) )
+        variables.append( spec )
+    header = dict( variables=variables, attrs=dict( dataset.attrs ) )
+    return header, buffers
+
+def decodeDataset( header: Dict, frames: Sequence[Any] ) -> xa.Dataset:
+    """ Rebuilds the dataset from the header and the received frames ( bytes, zmq.Frame or any buffer ) without copying array data """
+    data_vars, coords = {}, {}
+    for spec in header["variables"]:
+        if "frame" in spec:
+            frame = frames[ spec["frame"] ]
+            buffer = frame.buffer if hasattr( frame, "buffer" ) else frame
+            array = np.frombuffer( buffer, dtype=np.dtype( spec["dtype"] ) ).reshape( spec["shape"] )
+        else:
+            array = np.array( spec["values"], dtype=np.dtype( spec["dtype"] ) ).reshape( spec["shape"] )
+        variable = xa.Variable( spec["dims"], array, attrs=spec["attrs"] )
+        ( coords if spec["coord"] else data_vars )[ spec["name"] ] = variable
+    return xa.Dataset( data_vars, coords=coords, attrs=header.get( "attrs", {} ) )
+
+def chunkBuffers( buffers: Sequence[np.ndarray], chunk_size: int ) -> Iterator[Tuple[int,int,np.ndarray]]:
+    """ Splits the encoded buffers into ( frame, offset, chunk ) views of at most chunk_size bytes, without copying """
+    for frame, buffer in enumerate( buffers ):
+        for offset in range( 0, buffer.nbytes, chunk_size ):
+            yield frame, offset, buffer[ offset: offset + chunk_size ]
+
+class DatasetAssembler:
+    """ Reassembles a chunked dataset by writing each received chunk straight into preallocated arrays """
+
+    def __init__( self, header: Dict ):
+        self.header = header
+        self.nchunks = 0
+        self._buffers: Dict[int,np.ndarray] = {}
+        for spec in header["variables"]:
+            if "frame" in spec:
+                array = np.empty( spec["shape"], dtype=np.dtype( spec["dtype"] ) )
+                self._buffers[ spec["frame"] ] = array.reshape(-1).view( np.uint8 )
+
+    def add( self, frame: int, offset: int, data: Any ):
+        chunk = np.frombuffer( data, dtype=np.uint8 )
+        self._buffers[frame][ offset: offset + chunk.size ] = chunk
+        self.nchunks += 1
+
+    @property
+    def buffers(self) -> List[np.ndarray]:
+        return [ self._buffers[frame] for frame in range( len( self._buffers ) ) ]
+
+    def dataset(self) -> xa.Dataset:
+        return decodeDataset( self.header, self.buffers )
+
+class ResultStream:
+    """ Serializes a result ( header + datasets ) as an 8 byte length prefix, a JSON header and the raw array buffers,
+        readable from any byte offset so that interrupted transfers can be resumed with an HTTP Range request """
+
+    def __init__( self, header: Dict, datasets: Sequence[xa.Dataset] ):
+        dataset_headers, buffers = [], []
+        for dataset in datasets:
+            dataset_header, dataset_buffers = encodeDataset( dataset )
+            dataset_headers.append( dataset_header )
+            buffers.extend( dataset_buffers )
+        header_bytes = dumpHeader( dict( header=header, datasets=dataset_headers ) )
+        self._segments: List[memoryview] = [ memoryview( struct.pack( ">Q", len(header_bytes) ) + header_bytes ) ] + [ memoryview( buffer ) for buffer in buffers ]
+        self.size = sum( segment.nbytes for segment in self._segments )
+
+    def iterate( self, start: int = 0, stop: int = None, chunk_size: int = 1024 * 1024 ) -> Iterator[memoryview]:
+        stop = self.size if stop is None else stop
+        base = 0
+        for segment in self._segments:
+            begin, end = max( start - base, 0 ), min( stop - base, segment.nbytes )
+            for offset in range( begin, end, chunk_size ):
+                yield segment[ offset: min( offset + chunk_size, end ) ]
+            base += segment.nbytes
+            if base >= stop: break
+
+class ResultStreamDecoder:
+    """ Incrementally decodes a ResultStream, writing array data directly into preallocated arrays as it arrives """
+
+    def __init__(self):
+        self.received = 0
+        self._pending = bytearray()
+        self._header: Dict = None
+        self._assemblers: List[DatasetAssembler] = []
+        self._targets: List[np.ndarray] = []
+        self._target_offset = 0
+
+    @property
+    def complete(self) -> bool:
+        return ( self._header is not None ) and ( len( self._targets ) == 0 )
+
+    def feed( self, data: Any ):
+        data = memoryview( data ).cast( "B" )
+        self.received += data.nbytes
+        if self._header is None:
+            self._pending.extend( data )
+            if len( self._pending ) < 8: return
+            length = struct.unpack( ">Q", self._pending[:8] )[0]
+            if len( self._pending ) < 8 + length: return
+            self._setHeader( loadHeader( self._pending[8:8+length] ) )
+            data = memoryview( bytes( self._pending[8+length:] ) )
+            self._pending = bytearray()
+        while data.nbytes and len( self._targets ):
+            target = self._targets[0]
+            nbytes = min( target.size - self._target_offset, data.nbytes )
+            target[ self._target_offset: self._target_offset + nbytes ] = np.frombuffer( data[:nbytes], dtype=np.uint8 )
+            data, self._target_offset = data[nbytes:], self._target_offset + nbytes
+            if self._target_offset == target.size:
+                self._targets.pop(0)
+                self._target_offset = 0
+
+    def _setHeader( self, header: Dict ):
+        self._header = header
+        self._assemblers = [ DatasetAssembler( dataset_header ) for dataset_header in header["datasets"] ]
+        self._targets = [ buffer for assembler in self._assemblers for buffer in assembler.buffers if buffer.size > 0 ]
+
+    def result(self) -> Tuple[Dict, List[xa.Dataset]]:
+        assert self.complete, f"Incomplete result stream, received {self.received} bytes"
+        return self._header["header"], [ assembler.dataset() for assembler in self._assemblers ]
+
+def dumpHeader( header: Dict ) -> bytes:
+    return json.dumps( header, default=_jsonable ).encode( 'utf-8' )
+
+def loadHeader( data: Any ) -> Dict:
+    return json.loads( bytes( data ).decode( 'utf-8' ) )
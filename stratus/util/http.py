@@ -0,0 +1,48 @@
+""" Shared keep-alive HTTP sessions for the REST and WPS clients: one pooled requests.Session per host, configured
+    from client parms 'http.pool_size', 'http.retries', 'http.backoff' and 'http.timeout' """
+import requests, threading
+from typing import Dict, Any, Tuple
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+class PooledSession(requests.Session):
+    """ Session with a connection pool, retries with exponential backoff for idempotent requests, and a default timeout.
+        A non-idempotent session ( e.g. for WPS Execute, which is a GET ) only retries connection failures, never a
+        request that may have reached the server. """
+
+    def __init__( self, pool_size: int = 10, retries: int = 3, backoff: float = 0.2, timeout: float = 60.0, idempotent: bool = True ):
+        requests.Session.__init__( self )
+        self.default_timeout = timeout
+        if idempotent:  retry = Retry( total=retries, backoff_factor=backoff, status_forcelist=( 502, 503, 504 ) )
+        else:           retry = Retry( total=retries, backoff_factor=backoff, read=0, status=0 )
+        adapter = HTTPAdapter( pool_connections=1, pool_maxsize=pool_size, max_retries=retry )
+        self.mount( "http://", adapter )
+        self.mount( "https://", adapter )
+
+    def request( self, method, url, **kwargs ) -> requests.Response:
+        if kwargs.get( "timeout" ) is None: kwargs["timeout"] = self.default_timeout
+        return requests.Session.request( self, method, url, **kwargs )
+
+_sessions: Dict[Tuple[str,str,bool], PooledSession] = {}
+_lock = threading.Lock()
+
+def isIdempotent( parms: Dict[str,Any] ) -> bool:
+    """ False for WPS requests that submit a job """
+    return str( parms.get( "request", "" ) ).lower() != "execute"
+
+def getSession( url: str, idempotent: bool = True, **parms: Any ) -> PooledSession:
+    """ Returns the session shared by all clients talking to the host of the given url, created on first use.
+        Requests that start server-side work ( idempotent=False ) get a separate session that doesn't resend them. """
+    address = urlsplit( url )
+    key = ( address.scheme, address.netloc, idempotent )
+    session = _sessions.get( key )
+    if session is None:
+        with _lock:
+            session = _sessions.get( key )
+            if session is None:
+                session = PooledSession( pool_size=int( parms.get( "http.pool_size", 10 ) ), retries=int( parms.get( "http.retries", 3 ) ),
+                                         backoff=float( parms.get( "http.backoff", 0.2 ) ), timeout=float( parms.get( "http.timeout", 60.0 ) ),
+                                         idempotent=idempotent )
+                _sessions[key] = session
+    return session
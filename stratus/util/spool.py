@@ -0,0 +1,78 @@
+import os, threading, time, glob, re, hashlib
+from contextlib import contextmanager
+from typing import Dict, Callable, Optional, List
+from stratus_endpoint.util.config import StratusLogger, UID
+
+class ResultSpool:
+    """ Directory of encoded result files, each written exactly once per key ( atomically, via a temp file and rename )
+        so that repeated or concurrent fetches of the same result share the file instead of re-encoding it.
+        File names start with the spool's prefix, so spools with different prefixes can share a directory:
+        each one only purges its own files. """
+
+    purge_interval = 60.0
+
+    def __init__( self, directory: str, max_age: float = 86400.0, prefix: str = "file" ):
+        self.logger = StratusLogger.getLogger()
+        self.directory = os.path.expanduser( directory )
+        self.max_age = max_age
+        self.prefix = prefix
+        self._locks: Dict[str,List] = {}               # key -> [ lock, number of threads holding or waiting on it ]
+        self._lock = threading.Lock()
+        self._last_purge = 0.0
+        os.makedirs( self.directory, exist_ok=True )
+
+    def path( self, key: str, ext: str = "nc" ) -> str:
+        # Keys come from request parameters: the sanitized key keeps the file inside the spool directory, the digest keeps distinct keys apart
+        safe_key = re.sub( r"[^A-Za-z0-9_\-]", "_", key )[:64]
+        digest = hashlib.sha1( key.encode() ).hexdigest()[:16]
+        return os.path.join( self.directory, f"{self.prefix}.{safe_key}-{digest}.{ext}" )
+
+    def withPrefix( self, prefix: str, max_age: Optional[float] = None ) -> "ResultSpool":
+        """ Spool in the same directory whose files are named, and purged, separately from this one's """
+        return ResultSpool( self.directory, self.max_age if max_age is None else max_age, prefix )
+
+    def contains( self, key: str, ext: str = "nc" ) -> bool:
+        return os.path.isfile( self.path( key, ext ) )
+
+    @contextmanager
+    def _keyLock( self, key: str ):
+        """ Serializes work on one key; the lock is dropped once no thread holds or waits on it """
+        with self._lock:
+            entry = self._locks.setdefault( key, [ threading.Lock(), 0 ] )
+            entry[1] += 1
+        try:
+            with entry[0]: yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if entry[1] == 0: self._locks.pop( key, None )
+
+    def write( self, key: str, writer: Callable[[str],None], ext: str = "nc" ) -> str:
+        """ Returns the spooled file for key, calling writer( temp_path ) to create it if it does not yet exist """
+        path = self.path( key, ext )
+        with self._keyLock( key ):
+            if not os.path.isfile( path ):
+                temp_path = f"{path}.{UID.randomId(6)}.tmp"
+                try:
+                    writer( temp_path )
+                    os.replace( temp_path, path )
+                    self.logger.info( f"Spooled result {key} to {path}" )
+                finally:
+                    if os.path.exists( temp_path ): os.remove( temp_path )
+        if time.time() - self._last_purge > self.purge_interval: self.purge()
+        return path
+
+    def remove( self, key: str, ext: str = "nc" ):
+        with self._keyLock( key ):
+            try: os.remove( self.path( key, ext ) )
+            except FileNotFoundError: pass
+
+    def purge( self, max_age: Optional[float] = None ):
+        """ Deletes this spool's files that have not been modified within max_age seconds """
+        max_age = self.max_age if max_age is None else max_age
+        self._last_purge = time.time()
+        cutoff = time.time() - max_age
+        for path in glob.glob( os.path.join( self.directory, f"{self.prefix}.*" ) ):
+            try:
+                if ( not path.endswith( ".tmp" ) ) and ( os.path.getmtime( path ) < cutoff ): os.remove( path )
+            except OSError: pass